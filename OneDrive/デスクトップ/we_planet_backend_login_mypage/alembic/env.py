@@ -3,30 +3,33 @@ from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
 from alembic import context
 import os
+import sys
 
-from dotenv import load_dotenv
-load_dotenv(".env")
+# alembic をアプリのルートから実行しても app パッケージを import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-config = context.config
+from app.core.config import settings
+from app.core.database import Base
+from app.core.db_url import build_database_url, is_sqlite, sync_connect_args
+import app.models  # noqa: F401  全モデルを Base.metadata に登録する
 
-db_user = os.getenv("DB_USER")
-db_pass = os.getenv("DB_PASSWORD")
-db_host = os.getenv("DB_HOST")
-db_port = os.getenv("DB_PORT", "3306")
-db_name = os.getenv("DB_NAME")
-db_ssl_ca = os.getenv("DB_SSL_CA")
+config = context.config
 
-db_url = f"mysql+pymysql://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
-config.set_main_option("sqlalchemy.url", db_url)
+# アプリと同じ URL を使う（DATABASE_URL または DB_*）
+db_url = build_database_url(settings)
+config.set_main_option("sqlalchemy.url", db_url.replace("%", "%%"))
 
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
-target_metadata = None
+# --autogenerate でモデルとの差分を出せるようにする
+target_metadata = Base.metadata
 
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
-    context.configure(url=url, literal_binds=True)
+    context.configure(
+        url=url, target_metadata=target_metadata, literal_binds=True, render_as_batch=is_sqlite(url)
+    )
     with context.begin_transaction():
         context.run_migrations()
 
@@ -35,11 +38,14 @@ def run_migrations_online():
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
-        connect_args={"ssl": {"ca": db_ssl_ca}} if db_ssl_ca else {},
+        connect_args=sync_connect_args(db_url, settings.DB_SSL_CA),
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection)
+        # SQLite は ALTER が弱いので batch モードでテーブルを作り直す
+        context.configure(
+            connection=connection, target_metadata=target_metadata, render_as_batch=is_sqlite(db_url)
+        )
         with context.begin_transaction():
             context.run_migrations()
 
@@ -0,0 +1,113 @@
+"""初期スキーマ（idempotency_key 追加前のテーブル一式）
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0000"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade() -> None:
+    # create_all で作った既存の DB でも流せるよう、無いテーブルだけ作る
+    if not _has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("user_id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("email", sa.String(length=255), nullable=False, unique=True),
+            sa.Column("password_hash", sa.String(length=255), nullable=False),
+            sa.Column("auth_provider", sa.String(length=50), nullable=True),
+            sa.Column("provider_user_id", sa.String(length=255), nullable=True),
+            sa.Column("nickname", sa.String(length=100), nullable=True),
+            sa.Column("badge_id", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index("ix_users_user_id", "users", ["user_id"])
+
+    if not _has_table("eco_mission"):
+        op.create_table(
+            "eco_mission",
+            sa.Column("mission_id", sa.Integer(), primary_key=True),
+            sa.Column("title", sa.String(length=255), nullable=False),
+            sa.Column("description", sa.String(length=500), nullable=True),
+            sa.Column("base_co2_reduction", sa.Float(), nullable=True),
+            sa.Column("default_point", sa.Integer(), nullable=False),
+        )
+        op.create_index("ix_eco_mission_mission_id", "eco_mission", ["mission_id"])
+
+    if not _has_table("eco_badge"):
+        op.create_table(
+            "eco_badge",
+            sa.Column("badge_id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("badge_name", sa.String(length=100), nullable=False),
+            sa.Column("description", sa.String(length=255), nullable=True),
+            sa.Column("category_name", sa.String(length=100), nullable=True),
+            sa.Column("badge_image", sa.String(length=255), nullable=True),
+        )
+        op.create_index("ix_eco_badge_badge_id", "eco_badge", ["badge_id"])
+
+    if not _has_table("user_activity"):
+        op.create_table(
+            "user_activity",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.user_id"), nullable=False),
+            sa.Column("mission_id", sa.Integer(), nullable=True),
+            sa.Column("completed_at", sa.DateTime(), server_default=sa.func.now(), nullable=True),
+            sa.Column("badge_id", sa.Integer(), sa.ForeignKey("eco_badge.badge_id"), nullable=True),
+        )
+        op.create_index("ix_user_activity_id", "user_activity", ["id"])
+
+    if not _has_table("user_stats"):
+        op.create_table(
+            "user_stats",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.user_id"), primary_key=True),
+            sa.Column("missions_count", sa.Integer(), nullable=False),
+            sa.Column("total_points", sa.Integer(), nullable=False),
+            sa.Column("total_co2", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        )
+
+    if not _has_table("user_monthly_stats"):
+        op.create_table(
+            "user_monthly_stats",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.user_id"), primary_key=True),
+            sa.Column("month", sa.String(length=7), primary_key=True),
+            sa.Column("missions_count", sa.Integer(), nullable=False),
+            sa.Column("total_points", sa.Integer(), nullable=False),
+            sa.Column("total_co2", sa.Float(), nullable=False),
+        )
+
+    if not _has_table("token_revocations"):
+        op.create_table(
+            "token_revocations",
+            sa.Column("token_id", sa.String(length=32), primary_key=True),
+            sa.Column("kind", sa.String(length=10), nullable=False),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.user_id"), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.Column("revoked_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index("ix_token_revocations_revoked_at", "token_revocations", ["revoked_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("token_revocations")
+    op.drop_table("user_monthly_stats")
+    op.drop_table("user_stats")
+    op.drop_table("user_activity")
+    op.drop_table("eco_badge")
+    op.drop_table("eco_mission")
+    op.drop_table("users")
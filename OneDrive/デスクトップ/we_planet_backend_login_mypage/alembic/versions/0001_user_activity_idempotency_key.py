@@ -0,0 +1,38 @@
+"""user_activity に idempotency_key を追加
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = "0000"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    return column in {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # create_all で新しく作った DB には既に列があるので、無いときだけ足す
+    if _has_column("user_activity", "idempotency_key"):
+        return
+    with op.batch_alter_table("user_activity") as batch_op:
+        batch_op.add_column(sa.Column("idempotency_key", sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint(
+            "uq_user_activity_idempotency_key", ["user_id", "idempotency_key"]
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("user_activity") as batch_op:
+        batch_op.drop_constraint("uq_user_activity_idempotency_key", type_="unique")
+        batch_op.drop_column("idempotency_key")
@@ -0,0 +1,43 @@
+"""よく使うクエリ向けの複合インデックス
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (インデックス名, テーブル, 列)
+INDEXES = (
+    # 履歴のページング・エクスポート、月別の集計、ロールアップのバックフィル
+    ("ix_user_activity_user_completed", "user_activity", ["user_id", "completed_at", "id"]),
+    # 月別ランキングの読み込み（主キーは (user_id, month) なので month だけでは引けない）
+    ("ix_user_monthly_stats_month", "user_monthly_stats", ["month"]),
+    # 起動時の失効リスト読み込み
+    ("ix_token_revocations_expires_at", "token_revocations", ["expires_at"]),
+)
+
+
+def _has_index(table: str, name: str) -> bool:
+    return name in {i["name"] for i in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    # create_all で作った DB には既にあるので、無いものだけ作る
+    for name, table, columns in INDEXES:
+        if not _has_index(table, name):
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,29 @@
+"""既存ユーザーの user_stats / user_monthly_stats を user_activity から作る
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.db.backfill import backfill_statements
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 行が無いユーザーだけ作る（何度流しても同じ。python -m app.db.backfill でも流せる）
+    for statement in backfill_statements(op.get_context().dialect.name):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    # データの移行なので戻さない（ロールアップの行は残しても害が無い）
+    pass
@@ -0,0 +1,40 @@
+"""users に deleted_at（退会）と updated_at のインデックスを追加
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    return column in {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _has_index(table: str, name: str) -> bool:
+    return name in {i["name"] for i in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    # create_all で新しく作った DB には既にあるので、無いものだけ足す
+    if not _has_column("users", "deleted_at"):
+        with op.batch_alter_table("users") as batch_op:
+            batch_op.add_column(sa.Column("deleted_at", sa.DateTime(), nullable=True))
+    if not _has_index("users", "ix_users_updated_at"):
+        op.create_index("ix_users_updated_at", "users", ["updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_updated_at", table_name="users")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("deleted_at")
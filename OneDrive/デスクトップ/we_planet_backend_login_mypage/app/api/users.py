@@ -41,11 +41,18 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 def login(form_data: schemas.UserLogin, db: Session = Depends(get_db)):
     """ローカルアカウントログイン"""
     db_user = db.query(models.User).filter(models.User.email == form_data.email).first()
-    if not db_user or not security.verify_password(form_data.password, db_user.password_hash):
+    valid, new_hash = security.verify_and_update_password_sync(
+        form_data.password, db_user.password_hash if db_user else None
+    )
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # コストが古いハッシュはログイン成功時に更新
+        security.update_password_hash(db, db_user.user_id, new_hash)
 
-    access_token = security.create_access_token(data={"sub": str(db_user.user_id)})
-    return {"access_token": access_token, "token_type": "bearer"}
+    access_token = security.create_user_access_token(db_user)
+    refresh_token = security.create_refresh_token(db_user.user_id)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 
 # ==============================
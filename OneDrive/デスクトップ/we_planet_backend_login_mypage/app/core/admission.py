@@ -0,0 +1,197 @@
+"""
+ルートの種類ごとの同時実行数の上限（アドミッション制御）と過負荷時の 503
+
+    @router.post("/login")
+    @admission_class("auth")    # @router.post の下に付ける
+    async def login(...): ...
+
+- 種類は auth（bcrypt を使うログイン・登録）/ write / read / export（全件エクスポート。応答を返し終わるまで
+  接続を握る）と、制限しない exempt（/health, /metrics）
+- 付けていないルートは GET / HEAD なら read、それ以外は write
+- 上限に達したら種類ごとの待ち行列（ADMISSION_QUEUE_SIZE）に並ぶ。一杯のとき、
+  ADMISSION_QUEUE_TIMEOUT_SECONDS 待っても順番が来ないときは 503 + Retry-After ですぐ返す
+- 種類ごとに枠が別なので、/login が詰まっても /badge/badges や /health は通る
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+AUTH = "auth"
+WRITE = "write"
+READ = "read"
+EXPORT = "export"
+EXEMPT = "exempt"
+
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "admission_in_flight", "Requests currently admitted, by route class", ("route_class",)
+)
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    "admission_queue_depth", "Requests waiting for admission, by route class", ("route_class",)
+)
+ADMISSION_QUEUE_WAIT = registry.histogram(
+    "admission_queue_wait_seconds", "Time requests waited for admission", ("route_class",)
+)
+ADMISSION_REJECTED = registry.counter(
+    "admission_rejected_total", "Requests shed with 503 (queue_full / timeout)", ("route_class", "reason")
+)
+
+
+def admission_class(name: str):
+    """ルートの種類を宣言する（auth / write / read / export / exempt）"""
+    if name not in (AUTH, WRITE, READ, EXPORT, EXEMPT):
+        raise ValueError(f"unknown admission class: {name}")
+
+    def decorator(endpoint):
+        endpoint.__admission_class__ = name
+        return endpoint
+    return decorator
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# ==============================
+# 種類ごとの枠と待ち行列
+# ==============================
+class AdmissionLimiter:
+    """
+    同時実行数 limit の枠と、max_queue 件までの FIFO の待ち行列
+    - イベントループのスレッドからだけ使う（ロックは取らない）
+    - 枠が空いたら次の待ち手にそのまま渡す（後から来たリクエストに追い越されない）
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _update_gauges(self) -> None:
+        ADMISSION_IN_FLIGHT.set(self.active, route_class=self.name)
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters), route_class=self.name)
+
+    async def acquire(self) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._update_gauges()
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise AdmissionRejected("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionRejected("timeout") from None
+        except asyncio.CancelledError:
+            # 枠を渡された直後に切断された場合は次の待ち手に回す
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_gauges()
+            ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - started, route_class=self.name)
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # active はそのまま次の待ち手に引き継ぐ
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+
+# ==============================
+# ミドルウェア
+# ==============================
+class AdmissionMiddleware:
+    """
+    ルートの種類ごとに同時実行数を制限する（ASGI ミドルウェア）
+    ルーティングより先に動くので、router のルートを自分で照合して種類を決める
+    """
+
+    def __init__(self, app, router, limits: Optional[Dict[str, int]] = None,
+                 max_queue: Optional[int] = None, queue_timeout: Optional[float] = None):
+        self.app = app
+        self.router = router
+        limits = limits or {
+            AUTH: settings.ADMISSION_AUTH_CONCURRENCY,
+            WRITE: settings.ADMISSION_WRITE_CONCURRENCY,
+            READ: settings.ADMISSION_READ_CONCURRENCY,
+            EXPORT: settings.ADMISSION_EXPORT_CONCURRENCY,
+        }
+        max_queue = settings.ADMISSION_QUEUE_SIZE if max_queue is None else max_queue
+        queue_timeout = settings.ADMISSION_QUEUE_TIMEOUT_SECONDS if queue_timeout is None else queue_timeout
+        # 上限 0 の種類は制限しない
+        self.limiters = {
+            name: AdmissionLimiter(name, limit, max_queue, queue_timeout)
+            for name, limit in limits.items() if limit > 0
+        }
+
+    def _resolve(self, scope):
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    def _classify(self, scope, route) -> str:
+        name = getattr(getattr(route, "endpoint", None), "__admission_class__", None)
+        if name is not None:
+            return name
+        return READ if scope["method"] in ("GET", "HEAD") else WRITE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._resolve(scope)
+        limiter = self.limiters.get(self._classify(scope, route))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except AdmissionRejected as e:
+            ADMISSION_REJECTED.inc(route_class=limiter.name, reason=e.reason)
+            # 過負荷中は大量に出るので DEBUG（件数は admission_rejected_total で見る）
+            logger.debug("request shed: %s queue %s", limiter.name, e.reason,
+                         extra={"method": scope["method"], "path": scope["path"]})
+            if route is not None:
+                scope["route"] = route  # メトリクスをルート別に数えるため
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server is busy, please retry"},
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
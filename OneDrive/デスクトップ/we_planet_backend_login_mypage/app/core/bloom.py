@@ -0,0 +1,47 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    追加のみのブルームフィルタ
+    - 「含まれない」は確実、「含まれる」は error_rate の確率で誤検出
+    - count は入っていなかったキーだけ数える（同じキーを何度 add しても一杯にならない）
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, key: str) -> bool:
+        """入っていなかったら足して True（既に入っている・誤検出なら False）"""
+        bits = self._bits
+        added = False
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
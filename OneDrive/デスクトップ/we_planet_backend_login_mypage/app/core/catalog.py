@@ -0,0 +1,213 @@
+import abc
+import hashlib
+import json
+import random
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.eco_badge import EcoBadge
+from app.models.eco_mission import EcoMission
+
+
+# ==============================
+# ミッションカタログ
+# ==============================
+class MissionEntry(NamedTuple):
+    """eco_mission 1行分の読み取り専用スナップショット"""
+    mission_id: int
+    title: str
+    description: Optional[str]
+    base_co2_reduction: Optional[float]
+    default_point: int
+
+
+class _MissionSnapshot(NamedTuple):
+    missions: Tuple[MissionEntry, ...]
+    by_id: Dict[int, MissionEntry]
+    version: int
+    expires_at: float
+
+
+class _Catalog(abc.ABC):
+    """
+    マスターデータをプロセス内に保持するキャッシュの共通部分
+    - ttl_seconds が None なら invalidate() されるまで保持し続ける
+    - 期限切れ時は1スレッドだけが再読込し、その間は古いスナップショットを返す
+    - 初回読込が重なった場合だけは各自で読む（ここでは待ち合わせない。ルートは shared_read 経由で呼ぶのでプロセス内では1回にまとまる）
+    - version は再読込のたびに増える
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+
+    @abc.abstractmethod
+    def _build(self, db: Session, version: int, expires_at: float):
+        """DB から読んでスナップショット（expires_at を持つ NamedTuple）を作る"""
+
+    def _is_fresh(self, snapshot) -> bool:
+        return snapshot is not None and time.monotonic() < snapshot.expires_at
+
+    def _expires_at(self) -> float:
+        if self.ttl_seconds is None:
+            return float("inf")
+        return time.monotonic() + self.ttl_seconds
+
+    def _current(self, db: Session):
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            return snapshot
+
+        # ロックは待たない: async モードでは全リクエストが同じスレッド（イベントループ）上で
+        # 動くので、ここでブロックすると読込中の相手ごとループが止まる
+        if not self._lock.acquire(blocking=False):
+            if snapshot is not None:
+                # 他が再読込中なら古いデータを返す
+                return snapshot
+            # 初回読込中は返せるものが無いので自分でも読む（保存はしない）
+            return self._build(db, self._version, self._expires_at())
+        try:
+            snapshot = self._snapshot
+            if not self._is_fresh(snapshot):
+                self._version += 1
+                snapshot = self._build(db, self._version, self._expires_at())
+                self._snapshot = snapshot
+            return snapshot
+        finally:
+            self._lock.release()
+
+    def peek(self):
+        """期限内のスナップショットがあれば返す（DB もロックも使わない。無ければ None）"""
+        snapshot = self._snapshot
+        return snapshot if self._is_fresh(snapshot) else None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> None:
+        """次回アクセス時に再読込させる"""
+        self._snapshot = None
+
+
+class MissionCatalog(_Catalog):
+    """eco_mission のキャッシュ（TTL で再読込）"""
+
+    def _build(self, db: Session, version: int, expires_at: float) -> _MissionSnapshot:
+        rows = db.execute(
+            select(
+                EcoMission.mission_id,
+                EcoMission.title,
+                EcoMission.description,
+                EcoMission.base_co2_reduction,
+                EcoMission.default_point,
+            ).order_by(EcoMission.mission_id)
+        ).all()
+        missions = tuple(MissionEntry(*row) for row in rows)
+        return _MissionSnapshot(
+            missions=missions,
+            by_id={m.mission_id: m for m in missions},
+            version=version,
+            expires_at=expires_at,
+        )
+
+    def missions(self, db: Session) -> Tuple[MissionEntry, ...]:
+        """全ミッション（mission_id 順）"""
+        return self._current(db).missions
+
+    def random_choice(self, db: Session) -> Optional[MissionEntry]:
+        """ミッションをランダムに1つ返す（未登録なら None）"""
+        missions = self._current(db).missions
+        return random.choice(missions) if missions else None
+
+    def get(self, db: Session, mission_id: int) -> Optional[MissionEntry]:
+        """mission_id でミッションを返す（存在しなければ None）"""
+        return self._current(db).by_id.get(mission_id)
+
+    def by_id(self, db: Session) -> Dict[int, MissionEntry]:
+        """mission_id → ミッションの辞書（その時点のスナップショット。書き換えないこと）"""
+        return self._current(db).by_id
+
+
+# ==============================
+# バッジカタログ
+# ==============================
+class BadgeEntry(NamedTuple):
+    """eco_badge 1行分の読み取り専用スナップショット"""
+    badge_id: int
+    badge_name: str
+    description: Optional[str]
+    category_name: Optional[str]
+    badge_image: Optional[str]
+
+
+class BadgeSnapshot(NamedTuple):
+    badges: Tuple[BadgeEntry, ...]
+    by_id: Dict[int, BadgeEntry]
+    max_badge_id: Optional[int]
+    body: bytes  # GET /badge/badges のレスポンス（シリアライズ済み）
+    etag: str    # body から計算した strong ETag
+    version: int
+    expires_at: float
+
+
+class BadgeCatalog(_Catalog):
+    """
+    eco_badge のキャッシュ
+    - バッジはめったに変わらないので TTL なし（変更時は invalidate() を呼ぶ）
+    - 一覧 API 用の JSON と ETag を読込時に1回だけ作る
+    """
+
+    def _build(self, db: Session, version: int, expires_at: float) -> BadgeSnapshot:
+        rows = db.execute(
+            select(
+                EcoBadge.badge_id,
+                EcoBadge.badge_name,
+                EcoBadge.description,
+                EcoBadge.category_name,
+                EcoBadge.badge_image,
+            ).order_by(EcoBadge.badge_id)
+        ).all()
+        badges = tuple(BadgeEntry(*row) for row in rows)
+        body = json.dumps(
+            [dict(b._asdict(), unlock_order=b.badge_id) for b in badges],
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return BadgeSnapshot(
+            badges=badges,
+            by_id={b.badge_id: b for b in badges},
+            max_badge_id=badges[-1].badge_id if badges else None,
+            body=body,
+            etag='"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            version=version,
+            expires_at=expires_at,
+        )
+
+    def snapshot(self, db: Session) -> BadgeSnapshot:
+        return self._current(db)
+
+    def get(self, db: Session, badge_id: int) -> Optional[BadgeEntry]:
+        """badge_id でバッジを返す（存在しなければ None）"""
+        return self._current(db).by_id.get(badge_id)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match ヘッダーが etag と一致するか（弱い比較）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+mission_catalog = MissionCatalog(ttl_seconds=settings.MISSION_CACHE_TTL_SECONDS)
+badge_catalog = BadgeCatalog()
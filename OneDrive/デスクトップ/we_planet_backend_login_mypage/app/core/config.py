@@ -3,14 +3,40 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 class Settings(BaseSettings):
-    # --- Azure MySQL 接続情報 ---
-    DB_HOST: str
-    DB_PORT: int
-    DB_NAME: str
-    DB_USER: str
-    DB_PASSWORD: str
+    # --- DB 接続先 ---
+    # 指定するとこちらが優先（例: sqlite:///./dev.db, sqlite:// でインメモリ）
+    DATABASE_URL: Optional[str] = None
+
+    # --- Azure MySQL 接続情報（DATABASE_URL 未指定時に使う） ---
+    DB_HOST: Optional[str] = None
+    DB_PORT: int = 3306
+    DB_NAME: Optional[str] = None
+    DB_USER: Optional[str] = None
+    DB_PASSWORD: Optional[str] = None
     DB_SSL_CA: Optional[str] = None  # ← SSL証明書パス
 
+    # --- コネクションプール ---
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30       # 接続の空き待ちの上限（秒）
+    DB_POOL_RECYCLE: int = 3600     # この秒数より古い接続は張り直す
+
+    # --- スキーマ管理 ---
+    # 本番は alembic upgrade head で作る。True にすると起動時に create_all（ローカル開発・インメモリ SQLite 用）
+    DB_CREATE_ALL: bool = False
+
+    # --- 起動 ---
+    DB_POOL_WARMUP: int = 0         # 起動時に張っておく接続数（0 で無効。DB_POOL_SIZE が上限）
+    STARTUP_LOG_SETTINGS: bool = False  # 起動時に設定の要約を出す
+
+    # --- 読み取りレプリカ（任意） ---
+    DB_READ_REPLICA_URL: Optional[str] = None     # 例: mysql+pymysql://user:pw@replica-host:3306/weplanet
+    ASYNC_READ_REPLICA_URL: Optional[str] = None  # 未指定なら DB_READ_REPLICA_URL から組み立てる
+
+    # --- 非同期DBモード ---
+    DB_ASYNC: bool = False  # True で AsyncSession（aiomysql 等）を使う
+    ASYNC_DATABASE_URL: Optional[str] = None  # 未指定なら同期の URL から組み立てる（mysql+aiomysql / sqlite+aiosqlite）
+
     # --- CORS設定 ---
     API_CORS_ORIGINS: str = "*"  # デフォルトは全部許可（本番では適切に絞る）
 
@@ -18,30 +44,110 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    JWT_REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+
+    # --- リフレッシュトークンの失効リスト ---
+    REFRESH_REVOCATION_BLOOM_CAPACITY: int = 100000   # 超えたら自動で作り直す
+    REFRESH_REVOCATION_BLOOM_ERROR_RATE: float = 0.001
+    REFRESH_REVOCATION_SYNC_SECONDS: int = 5          # 他プロセスの失効を取り込む間隔
+
+    # --- パスワードハッシュ（bcrypt） ---
+    BCRYPT_ROUNDS: int = 12                        # これ未満のコストのハッシュはログイン時に再ハッシュ
+    PASSWORD_HASH_WORKERS: int = 2                 # bcrypt 専用スレッド数
+    PASSWORD_HASH_MAX_QUEUE: int = 32              # これ以上待たせず 503 を返す
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = 2.0
+
+    # --- 認証済みユーザーのキャッシュ ---
+    AUTH_CACHE_TTL_SECONDS: int = 60      # トークン→ユーザーを保持する秒数
+    AUTH_CACHE_MAX_ENTRIES: int = 10000   # 0 でキャッシュ無効
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False # True ならトークンのクレームを信用して users を引かない
+    AUTH_CACHE_SYNC_SECONDS: int = 5      # 前回以降に変わったユーザーを users から読み、キャッシュと突き合わせる間隔（0 で無効）
 
     # --- Google OAuth ---
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
     GOOGLE_REDIRECT_URI: str = "http://localhost:8001/auth/google/callback"
+    GOOGLE_OIDC_DISCOVERY_URL: str = "https://accounts.google.com/.well-known/openid-configuration"
+
+    # --- OpenID ディスカバリ / JWKS キャッシュ ---
+    OIDC_CACHE_TTL_SECONDS: int = 3600      # この間隔の半分ごとに裏で取り直す（0 で取り直さない）
+    OIDC_CACHE_PATH: Optional[str] = None   # 指定するとディスクにも保存し、再起動時に使う
+    OIDC_FETCH_TIMEOUT_SECONDS: float = 5.0
 
     # --- セッション管理 ---
     SESSION_SECRET_KEY: str  # ← ここを追加！
 
+    # --- ログ ---
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"                # json / text（ローカル開発向け）
+    LOG_DEBUG_SAMPLE_RATE: float = 1.0      # DEBUG ログを残す割合（0.01 で 1%）
+    LOG_QUEUE_SIZE: int = 10000             # 書き出し待ちの上限（超えた分は捨てる）
+
+    # --- イベントループの監視 ---
+    LOOP_MONITOR_ENABLED: bool = False      # イベントループの停止を検知してルートとスタックを出す
+    LOOP_STALL_THRESHOLD_MS: int = 100      # これ以上止まったら報告する
+    LOOP_AUDIT_STRICT: bool = False         # async ルートが同期の get_db に依存していたら起動を止める
+
+    # --- SQL 件数のバジェット（ルートの @query_budget） ---
+    QUERY_BUDGET_MODE: str = "log"          # off / log（超えたら WARNING）/ raise（テスト・CI 向け。超えたら例外）
+    QUERY_REPEAT_THRESHOLD: int = 3         # 同じ SQL がこの回数以上出たら N+1 の疑いとして報告（0 で無効）
+
+    # --- リクエスト単位のプロファイラ（どちらも未設定ならミドルウェアごと付けない） ---
+    PROFILE_SAMPLE_RATE: float = 0.0        # 計測するリクエストの割合（0.001 で 0.1%）
+    PROFILE_SECRET: Optional[str] = None    # X-Profile-Token の署名鍵（python -m app.core.profiler token で発行）
+    PROFILE_DIR: str = "./.profiles"        # 書き出し先（collapsed stack + JSON）
+    PROFILE_KEEP: int = 200                 # 残すプロファイル数（古いものから消す）
+    PROFILE_MIN_DURATION_MS: int = 0        # これより速く終わったリクエストは保存しない
+
+    # --- アドミッション制御（ルートの種類ごとの同時実行数。@admission_class） ---
+    # 合計をスレッドプール（既定 40）以下にしておくと、ある種類が詰まっても他の種類はスレッドを取れる
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_AUTH_CONCURRENCY: int = 4     # ログイン・登録（bcrypt）。0 でその種類は制限しない
+    ADMISSION_WRITE_CONCURRENCY: int = 12   # ミッション達成・トークン更新など
+    ADMISSION_READ_CONCURRENCY: int = 22    # /me, ランキングなどの読み取り
+    ADMISSION_EXPORT_CONCURRENCY: int = 2   # 履歴の全件エクスポート（ストリームの間ずっと枠と DB 接続を使う）
+    ADMISSION_QUEUE_SIZE: int = 64          # 種類ごとの待ち行列の上限（超えたらすぐ 503）
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 1.0  # これ以上待たせず 503 + Retry-After
+
+    # --- 同じ読み取りの同時実行をまとめる（shared_read） ---
+    SINGLEFLIGHT_ENABLED: bool = True
+    SINGLEFLIGHT_TIMEOUT_SECONDS: float = 5.0  # 待っている側の上限（超えたら 503 + Retry-After）
+
+    # --- メトリクス（/metrics） ---
+    METRICS_ENABLED: bool = True
+
+    # --- ミッション達成の一括送信 ---
+    MISSION_BATCH_MAX_ITEMS: int = 100      # POST /mission/complete/batch の1回あたりの上限
+
+    # --- ランキング（/ecoboard/leaderboard） ---
+    LEADERBOARD_RESYNC_SECONDS: int = 300   # 他プロセスの更新を取り込むため DB から作り直す間隔（0 で無効）
+    LEADERBOARD_MAX_MONTHS: int = 12        # プロセス内に保持する月別ランキングの数
+    LEADERBOARD_PAGE_MAX: int = 100         # 1ページの上限
+
+    # --- 達成履歴（/me/activities） ---
+    ACTIVITY_PAGE_MAX: int = 100            # 1ページの上限
+
+    # --- マスターデータキャッシュ ---
+    MISSION_CACHE_TTL_SECONDS: int = 300  # eco_mission を再読込するまでの秒数
+
     # --- .env 読み込み設定 ---
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 @lru_cache()
 def get_settings() -> Settings:
-    s = Settings()
-    # デバッグ用ログ（PWは長さだけ）
-    print(
-        f"[Settings Loaded] DB_HOST={s.DB_HOST}, DB_NAME={s.DB_NAME}, "
+    # import 時には何も出力しない（起動時の要約は describe_settings() を使う）
+    return Settings()
+
+
+def describe_settings(s: Settings) -> str:
+    """起動ログ用の設定の要約（パスワード・秘密鍵は長さだけ）"""
+    return (
+        f"DB_HOST={s.DB_HOST}, DB_NAME={s.DB_NAME}, "
         f"DB_USER={s.DB_USER}, PW_LEN={len(s.DB_PASSWORD) if s.DB_PASSWORD else 0}, "
         f"DB_SSL_CA={s.DB_SSL_CA}, API_CORS_ORIGINS={s.API_CORS_ORIGINS}, "
         f"JWT_ALGO={s.JWT_ALGORITHM}, JWT_EXPIRE={s.JWT_ACCESS_TOKEN_EXPIRE_MINUTES}, "
         f"GOOGLE_CLIENT_ID={'set' if s.GOOGLE_CLIENT_ID else 'missing'}, "
         f"SESSION_SECRET_KEY_LEN={len(s.SESSION_SECRET_KEY) if s.SESSION_SECRET_KEY else 0}"
     )
-    return s
 
 settings = get_settings()
@@ -1,28 +1,73 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, declarative_base
+import abc
+import ssl
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Hashable, TypeVar
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from starlette.concurrency import run_in_threadpool
 from .config import settings
+from .db_url import build_database_url, is_memory_sqlite, is_sqlite, sync_connect_args, to_async_url
+from .metrics import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool, instrument_engine
+from .profiler import profile_thread
+from .singleflight import SingleFlight
+
+T = TypeVar("T")
 
 # これが無いと models 側から Base が import できない
 Base = declarative_base()
 
-# DB接続URL
-DATABASE_URL = (
-    f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASSWORD}"
-    f"@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
-)
+# DB接続URL（DATABASE_URL が無ければ DB_* から MySQL の URL を組み立てる）
+DATABASE_URL = build_database_url(settings)
+
+# 読み取り専用ルート用のレプリカ（未設定ならプライマリを使う）
+READ_REPLICA_URL = settings.DB_READ_REPLICA_URL
+
+
+def _pool_kwargs(url: str) -> dict:
+    if is_memory_sqlite(url):
+        # インメモリ SQLite は接続ごとに別の DB になるので1本を共有する
+        return {"poolclass": StaticPool}
+    return {
+        "poolclass": InstrumentedQueuePool,  # 接続の取得待ち時間を計測する QueuePool
+        "pool_pre_ping": True,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+
+
+def _sqlite_on_connect(dbapi_connection, connection_record):
+    # MySQL と同じく外部キーを効かせ、同時書き込みはロック待ちさせる
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+
+def _make_engine(url: str, name: str):
+    new_engine = create_engine(
+        url,
+        connect_args=sync_connect_args(url, settings.DB_SSL_CA),
+        **_pool_kwargs(url),
+    )
+    if is_sqlite(url):
+        event.listen(new_engine, "connect", _sqlite_on_connect)
+    if settings.METRICS_ENABLED:
+        instrument_engine(new_engine, name=name)
+    return new_engine
+
 
 # エンジン作成
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    connect_args={
-        "ssl": {"ca": settings.DB_SSL_CA}
-    },
-)
+engine = _make_engine(DATABASE_URL, "primary")
+read_engine = _make_engine(READ_REPLICA_URL, "replica") if READ_REPLICA_URL else engine
 
 # セッション作成
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False)
 
 # DBセッションを取得する依存関数
 def get_db():
@@ -32,6 +77,217 @@ def get_db():
     finally:
         db.close()
 
+# 読み取り専用DBセッションを取得する依存関数
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# ==============================
+# 非同期モード（DB_ASYNC=true のときだけ作る）
+# ==============================
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or to_async_url(DATABASE_URL)
+ASYNC_READ_REPLICA_URL = settings.ASYNC_READ_REPLICA_URL or (
+    to_async_url(READ_REPLICA_URL) if READ_REPLICA_URL else None
+)
+
+
+def _make_async_engine(url: str, name: str):
+    connect_args = {}
+    pool_kwargs = {}
+    if url.startswith("mysql"):
+        if settings.DB_SSL_CA:
+            connect_args["ssl"] = ssl.create_default_context(cafile=settings.DB_SSL_CA)
+        pool_kwargs = dict(_pool_kwargs(url), poolclass=InstrumentedAsyncAdaptedQueuePool)
+    elif is_memory_sqlite(url):
+        # 注意: 同期エンジンのインメモリ DB とは別物になる
+        pool_kwargs = {"poolclass": StaticPool}
+
+    new_engine = create_async_engine(url, connect_args=connect_args, **pool_kwargs)
+    if is_sqlite(url):
+        event.listen(new_engine.sync_engine, "connect", _sqlite_on_connect)
+    if settings.METRICS_ENABLED:
+        instrument_engine(new_engine, name=name)
+    return new_engine
+
+
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+
+if settings.DB_ASYNC:
+    async_engine = _make_async_engine(ASYNC_DATABASE_URL, "async_primary")
+    async_read_engine = (
+        _make_async_engine(ASYNC_READ_REPLICA_URL, "async_replica")
+        if ASYNC_READ_REPLICA_URL
+        else async_engine
+    )
+    # commit 後に属性を再読込しに行くとイベントループ外で I/O が走るので expire しない
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+    AsyncReadSessionLocal = async_sessionmaker(
+        bind=async_read_engine, autoflush=False, expire_on_commit=False
+    )
+
+# 非同期DBセッションを取得する依存関数
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ==============================
+# sync / async 共通の実行口
+# ==============================
+class DBRunner(abc.ABC):
+    """
+    `await db.run(fn, *args)` で fn(session, *args) を実行する
+    fn は同期の Session を受け取る普通の関数で、どちらのモードでも同じものを使う
+    """
+
+    session: Any
+
+    @abc.abstractmethod
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """fn(session, *args, **kwargs) を実行して戻り値を返す"""
+
+
+class SyncDBRunner(DBRunner):
+    """sync モード: 従来の pymysql エンジンのセッションをスレッドプールで使う"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        # プロファイラで計測中のリクエストならワーカースレッドにもフックを掛ける
+        return await run_in_threadpool(profile_thread(fn), self.session, *args, **kwargs)
+
+
+class AsyncDBRunner(DBRunner):
+    """async モード: AsyncSession.run_sync でイベントループ上から実行する（スレッドを占有しない）"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        return await self.session.run_sync(fn, *args, **kwargs)
+
+
+@asynccontextmanager
+async def open_db_runner(async_factory, sync_factory):
+    if async_factory is not None:
+        async with async_factory() as db:
+            yield AsyncDBRunner(db)
+    else:
+        db = sync_factory()
+        try:
+            yield SyncDBRunner(db)
+        finally:
+            await run_in_threadpool(db.close)
+
+
+# 設定に応じて DBRunner を返す依存関数（async def のルートはこちらを使う）
+async def get_db_runner():
+    async with open_db_runner(AsyncSessionLocal, SessionLocal) as runner:
+        yield runner
+
+
+# 読み取り専用ルート用（レプリカがあればそちらに繋ぐ。書き込みには使わないこと）
+async def get_read_db_runner():
+    async with open_db_runner(AsyncReadSessionLocal, ReadSessionLocal) as runner:
+        yield runner
+
+
+def has_read_replica() -> bool:
+    """読み取りがレプリカに向いているか（未設定なら読み取りも primary のエンジンを使う）"""
+    if settings.DB_ASYNC:
+        return async_read_engine is not async_engine
+    return read_engine is not engine
+
+
+def open_primary_runner():
+    """依存関数の外で primary の DBRunner を開く（async with open_primary_runner() as db:）"""
+    return open_db_runner(AsyncSessionLocal, SessionLocal)
+
+# ==============================
+# 同時に来た同じ読み取りを1回にまとめる（single-flight）
+# ==============================
+_read_flight = SingleFlight(timeout=settings.SINGLEFLIGHT_TIMEOUT_SECONDS)
+
+
+async def shared_read(key: Hashable, fn: Callable[..., T], *args) -> T:
+    """
+    key が同じ読み取りが実行中ならそれを待って結果を共有する（fn(session, *args) を読み取りセッションで1回だけ実行）
+    - key はクエリとパラメータ（またはルートとユーザー）: ("leaderboard_page", metric, period, offset, limit)
+    - 結果は全員で共有するので、値（NamedTuple / dict）を返す fn に使う。ORM オブジェクトは返さない
+    - 先に終わったリクエストに閉じられないよう、リクエストのセッションではなく自前のセッションで読む
+    - fn の例外は待っていた全員に届く。SINGLEFLIGHT_TIMEOUT_SECONDS を過ぎたら SingleFlightTimeout（main で 503）
+    """
+    async def read():
+        async with open_db_runner(AsyncReadSessionLocal, ReadSessionLocal) as runner:
+            return await runner.run(fn, *args)
+
+    if not settings.SINGLEFLIGHT_ENABLED:
+        return await read()
+    return await _read_flight.do(key, read)
+
+
+def shared_read_sync(key: Hashable, fn: Callable[..., T], *args) -> T:
+    """def のルート・スレッドプール用の shared_read（イベントループのスレッドからは呼ばない）"""
+    def read():
+        db = ReadSessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    if not settings.SINGLEFLIGHT_ENABLED:
+        return read()
+    return _read_flight.do_sync(key, read)
+
+
+# ==============================
+# 起動時のプール温め（DB_POOL_WARMUP）
+# ==============================
+def warm_pool(target_engine, connections: int) -> int:
+    """connections 本を同時に張って SELECT 1 を流し、プールに戻す（初回リクエストが接続を待たない）"""
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = target_engine.connect()
+            opened.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
+
+async def warm_async_pool(target_engine, connections: int) -> int:
+    opened = []
+    try:
+        for _ in range(connections):
+            conn = await target_engine.connect()
+            opened.append(conn)
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            await conn.close()
+    return len(opened)
+
+
+async def warm_pools(connections: int) -> int:
+    """リクエストで使うエンジン（async モードなら非同期側）をすべて温める。張った本数を返す"""
+    connections = min(connections, settings.DB_POOL_SIZE)
+    if async_engine is not None:
+        targets = {id(e): e for e in (async_engine, async_read_engine)}.values()
+        return sum([await warm_async_pool(e, connections) for e in targets])
+    targets = {id(e): e for e in (engine, read_engine)}.values()
+    return sum([await run_in_threadpool(warm_pool, e, connections) for e in targets])
+
 # 接続テスト用関数
 def test_connection():
     with engine.connect() as conn:
@@ -39,8 +295,6 @@ def test_connection():
 
 def test_connection():
     with engine.connect() as conn:
-        db_name = conn.execute(text("SELECT DATABASE();")).scalar()
-        print(f"[DB TEST] Connected to database: {db_name}")
-        result = conn.execute(text("SHOW COLUMNS FROM users;"))
-        for row in result:
-            print(f"[DB TEST] Column: {row}")
+        print(f"[DB TEST] Connected to database: {engine.url.database}")
+        for column in inspect(conn).get_columns("users"):
+            print(f"[DB TEST] Column: {column}")
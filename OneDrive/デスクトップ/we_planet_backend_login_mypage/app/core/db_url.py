@@ -0,0 +1,69 @@
+from typing import Optional
+
+from sqlalchemy.engine import URL, make_url
+
+# ==============================
+# DB 接続 URL（アプリと alembic で共通）
+# ==============================
+
+
+def build_database_url(settings) -> str:
+    """
+    DATABASE_URL があればそれを使い、無ければ DB_* から MySQL の URL を組み立てる
+    例: sqlite:///./dev.db / sqlite:// （インメモリ）/ mysql+pymysql://...
+    """
+    if settings.DATABASE_URL:
+        return settings.DATABASE_URL
+
+    missing = [
+        name for name in ("DB_HOST", "DB_NAME", "DB_USER", "DB_PASSWORD")
+        if not getattr(settings, name)
+    ]
+    if missing:
+        raise ValueError(
+            "DATABASE_URL か DB_* を設定してください（未設定: " + ", ".join(missing) + "）"
+        )
+    # パスワードに @ や % が入っていても壊れないよう URL.create でエスケープする
+    return URL.create(
+        "mysql+pymysql",
+        username=settings.DB_USER,
+        password=settings.DB_PASSWORD,
+        host=settings.DB_HOST,
+        port=settings.DB_PORT,
+        database=settings.DB_NAME,
+    ).render_as_string(hide_password=False)
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_memory_sqlite(url: str) -> bool:
+    """sqlite:// / sqlite:///:memory: / file:...?mode=memory"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return False
+    database = parsed.database or ""
+    return database in ("", ":memory:") or "mode=memory" in str(url)
+
+
+def to_async_url(url: str) -> str:
+    """同期ドライバの URL を async ドライバの URL に変換する"""
+    parsed = make_url(url)
+    backend, driver = parsed.get_backend_name(), parsed.get_driver_name()
+    if backend == "mysql" and driver in ("pymysql", "mysqldb"):
+        return parsed.set(drivername="mysql+aiomysql").render_as_string(hide_password=False)
+    if backend == "sqlite" and driver == "pysqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url
+
+
+def sync_connect_args(url: str, ssl_ca: Optional[str]) -> dict:
+    """create_engine に渡す connect_args（MySQL は SSL、SQLite はスレッド間共有を許可）"""
+    backend = make_url(url).get_backend_name()
+    if backend == "mysql" and ssl_ca:
+        return {"ssl": {"ca": ssl_ca}}
+    if backend == "sqlite":
+        # DBRunner はスレッドプールから同じ接続を使う
+        return {"check_same_thread": False}
+    return {}
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, TypeVar
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+T = TypeVar("T")
+
+PASSWORD_HASH_SHED = registry.counter(
+    "password_hash_shed_total", "bcrypt jobs shed by the hashing pool", ("reason",)
+)
+
+
+class HashingOverloaded(Exception):
+    """bcrypt の待ち行列が一杯、または待ち時間が上限を超えた"""
+
+
+class PasswordHashPool:
+    """
+    bcrypt 専用の上限付きスレッドプール
+    - bcrypt は GIL を解放するのでスレッドでも CPU コア数まで並列に動く
+    - 実行中 + 待ち行列が max_workers + max_queue を超えたら即座に HashingOverloaded
+    - queue_timeout 秒以上待たされた仕事は実行せずに捨てる（クライアントは既に諦めている）
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, queue_timeout: float):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "expired": 0,
+            "in_flight": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "run_seconds_total": 0.0,
+        }
+
+    def _record(self, **deltas) -> None:
+        with self._stats_lock:
+            for name, value in deltas.items():
+                if name == "queue_wait_seconds_max":
+                    self._stats[name] = max(self._stats[name], value)
+                else:
+                    self._stats[name] += value
+
+    def submit(self, fn: Callable[..., T], *args) -> "Future[T]":
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            PASSWORD_HASH_SHED.inc(reason="queue_full")
+            raise HashingOverloaded("password hashing queue is full")
+
+        submitted_at = time.perf_counter()
+
+        def task() -> T:
+            started_at = time.perf_counter()
+            waited = started_at - submitted_at
+            self._record(queue_wait_seconds_total=waited, queue_wait_seconds_max=waited)
+            if waited > self.queue_timeout:
+                self._record(expired=1)
+                PASSWORD_HASH_SHED.inc(reason="queue_timeout")
+                raise HashingOverloaded("password hashing queue timeout")
+            try:
+                return fn(*args)
+            finally:
+                self._record(completed=1, run_seconds_total=time.perf_counter() - started_at)
+
+        def done(_: Future) -> None:
+            self._slots.release()
+            self._record(in_flight=-1)
+
+        self._record(submitted=1, in_flight=1)
+        future = self._executor.submit(task)
+        future.add_done_callback(done)
+        return future
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """async ルートから使う（イベントループはブロックしない）"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def run_sync(self, fn: Callable[..., T], *args) -> T:
+        """同期コードから使う（呼び出しスレッドは結果を待つ）"""
+        return self.submit(fn, *args).result()
+
+    def stats(self) -> Dict[str, float]:
+        """ログイン負荷の計測用スナップショット"""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["max_workers"] = self.max_workers
+        snapshot["max_queue"] = self.max_queue
+        return snapshot
+
+
+password_hash_pool = PasswordHashPool(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+    queue_timeout=settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS,
+)
+
+# /metrics 用（出力時に stats() を読む）
+registry.gauge(
+    "password_hash_in_flight", "bcrypt jobs running or queued",
+    callback=lambda: [({}, password_hash_pool.stats()["in_flight"])],
+)
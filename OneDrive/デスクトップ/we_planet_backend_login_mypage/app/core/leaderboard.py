@@ -0,0 +1,369 @@
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.user_stats import UserMonthlyStats, UserStats
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("co2", "points")
+ALL_TIME = "all"
+
+_MAX_LEVEL = 32
+_P = 0.25
+
+
+# ==============================
+# 順位付きスキップリスト
+# ==============================
+class _Node:
+    __slots__ = ("key", "next", "span")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * level
+        # span[i]: レベル i で次のノードまでに進む要素数（順位計算に使う）
+        self.span: List[int] = [0] * level
+
+
+class SkipList:
+    """
+    キーの昇順に並ぶスキップリスト（各リンクに span を持ち、順位を O(log n) で求める）
+    - insert / remove / rank / at_rank は O(log n)、slice は O(log n + k)
+    """
+
+    def __init__(self, rng: Optional[random.Random] = None):
+        self._rng = rng or random.Random()
+        self._head = _Node(None, _MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < _MAX_LEVEL and self._rng.random() < _P:
+            level += 1
+        return level
+
+    @classmethod
+    def from_sorted(cls, keys: Iterable, rng: Optional[random.Random] = None) -> "SkipList":
+        """昇順に並んだキーから O(n) で作る（起動時の一括構築用）"""
+        skiplist = cls(rng)
+        head = skiplist._head
+        last = [head] * _MAX_LEVEL
+        last_pos = [0] * _MAX_LEVEL
+        pos = 0
+        for key in keys:
+            pos += 1
+            level = skiplist._random_level()
+            node = _Node(key, level)
+            for i in range(level):
+                last[i].next[i] = node
+                last[i].span[i] = pos - last_pos[i]
+                last[i] = node
+                last_pos[i] = pos
+            if level > skiplist._level:
+                skiplist._level = level
+        for i in range(_MAX_LEVEL):
+            last[i].span[i] = pos - last_pos[i]
+        skiplist._length = pos
+        return skiplist
+
+    def insert(self, key) -> None:
+        update: List[_Node] = [self._head] * _MAX_LEVEL
+        rank = [0] * _MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while x.next[i] is not None and x.next[i].key < key:
+                rank[i] += x.span[i]
+                x = x.next[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                update[i].span[i] = self._length
+            self._level = level
+
+        node = _Node(key, level)
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = (rank[0] - rank[i]) + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._length += 1
+
+    def remove(self, key) -> bool:
+        update: List[_Node] = [self._head] * _MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key < key:
+                x = x.next[i]
+            update[i] = x
+        x = x.next[0]
+        if x is None or x.key != key:
+            return False
+
+        for i in range(self._level):
+            if update[i].next[i] is x:
+                update[i].span[i] += x.span[i] - 1
+                update[i].next[i] = x.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+        return True
+
+    def rank(self, key) -> Optional[int]:
+        """1始まりの順位（無ければ None）"""
+        traversed = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key <= key:
+                traversed += x.span[i]
+                x = x.next[i]
+            if x is not self._head and x.key == key:
+                return traversed
+        return None
+
+    def _node_at(self, rank: int) -> Optional[_Node]:
+        traversed = 0
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and traversed + x.span[i] <= rank:
+                traversed += x.span[i]
+                x = x.next[i]
+            if traversed == rank:
+                return x if x is not self._head else None
+        return None
+
+    def slice(self, offset: int, limit: int) -> List:
+        """順位 offset+1 から limit 件のキー"""
+        if offset < 0 or limit <= 0 or offset >= self._length:
+            return []
+        node = self._node_at(offset + 1)
+        keys = []
+        while node is not None and len(keys) < limit:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+# ==============================
+# ランキング
+# ==============================
+class RankedEntry(NamedTuple):
+    rank: int
+    user_id: int
+    score: float
+
+
+class Leaderboard:
+    """
+    user_id → スコアのランキング（スコアの降順、同点は user_id の昇順）
+    スキップリストのキーは (-score, user_id)
+    """
+
+    def __init__(self, scores: Optional[Dict[int, float]] = None):
+        self._lock = threading.Lock()
+        self._scores: Dict[int, float] = dict(scores or {})
+        self._list = SkipList.from_sorted(
+            sorted((-score, user_id) for user_id, score in self._scores.items())
+        )
+        self.loaded_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._list)
+
+    def add(self, user_id: int, delta: float) -> None:
+        if not delta:
+            return
+        with self._lock:
+            old = self._scores.get(user_id)
+            if old is not None:
+                self._list.remove((-old, user_id))
+            new = (old or 0) + delta
+            self._scores[user_id] = new
+            self._list.insert((-new, user_id))
+
+    def rank(self, user_id: int) -> Optional[RankedEntry]:
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            return RankedEntry(self._list.rank((-score, user_id)), user_id, score)
+
+    def page(self, offset: int, limit: int) -> List[RankedEntry]:
+        with self._lock:
+            keys = self._list.slice(offset, limit)
+        return [
+            RankedEntry(offset + i + 1, user_id, -neg_score)
+            for i, (neg_score, user_id) in enumerate(keys)
+        ]
+
+
+def _score_column(model, metric: str):
+    return model.total_co2 if metric == "co2" else model.total_points
+
+
+def load_scores(db: Session, metric: str, period: str) -> Dict[int, float]:
+    """ロールアップテーブルからスコアを読む（period は "all" か "YYYY-MM"）"""
+    if period == ALL_TIME:
+        query = select(UserStats.user_id, _score_column(UserStats, metric))
+    else:
+        query = select(UserMonthlyStats.user_id, _score_column(UserMonthlyStats, metric)).where(
+            UserMonthlyStats.month == period
+        )
+    rows = db.execute(query.execution_options(yield_per=10000))
+    return {user_id: score for user_id, score in rows if score}
+
+
+class LeaderboardSet:
+    """
+    指標（co2 / points）× 期間（累計 / 月）ごとのランキングをプロセス内に持つ
+    - 累計は起動時に読み込み、月別は初めて参照されたときに読む（max_months 個まで LRU で保持）
+    - complete_mission の commit 後に record_completions() で差分を足す
+    - 他プロセスでの更新は resync() で取り込む（LeaderboardSyncer が定期実行）
+    - DB から読んで差し替える間は、このプロセスの達成（recording() の中の commit と record_completions）を待たせる
+      （読み込みの前に commit した達成は読み込んだ値に入り、後に commit した達成は差し替え後のランキングに足される。
+        二重に数えることも取りこぼすことも無い。待つのは1つのランキングを読む間だけ）
+    """
+
+    def __init__(self, max_months: int, loader: Callable[[Session, str, str], Dict[int, float]] = load_scores):
+        self.max_months = max_months
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._boards: "OrderedDict[Tuple[str, str], Leaderboard]" = OrderedDict()
+        self._writes = threading.Condition()
+        self._writers = 0   # recording() の中にいる達成処理
+        self._builders = 0  # DB から読んで差し替えている最中のもの
+
+    @contextmanager
+    def recording(self):
+        """達成の commit から record_completions() までをこの中で行う"""
+        with self._writes:
+            while self._builders:
+                self._writes.wait()
+            self._writers += 1
+        try:
+            yield
+        finally:
+            with self._writes:
+                self._writers -= 1
+                self._writes.notify_all()
+
+    def _build(self, db: Session, key: Tuple[str, str], install: Callable[[Leaderboard], None]) -> Leaderboard:
+        """commit 済みで未反映の達成が無い状態で読み、新しい達成を待たせたまま差し替える"""
+        with self._writes:
+            self._builders += 1  # 先に立てて、新しい達成を入れない
+            while self._writers:
+                self._writes.wait()
+        try:
+            board = Leaderboard(self._loader(db, *key))
+            install(board)
+            return board
+        finally:
+            with self._writes:
+                self._builders -= 1
+                self._writes.notify_all()
+
+    def _install(self, key: Tuple[str, str], board: Leaderboard) -> Leaderboard:
+        with self._lock:
+            self._boards[key] = board
+            self._boards.move_to_end(key)
+            months = [k for k in self._boards if k[1] != ALL_TIME]
+            # 指標ごとに max_months 個まで（古く参照されたものから捨てる）
+            while len(months) > self.max_months * len(METRICS):
+                del self._boards[months.pop(0)]
+        return board
+
+    def get(self, db: Session, metric: str, period: str = ALL_TIME) -> Leaderboard:
+        key = (metric, period)
+        with self._lock:
+            board = self._boards.get(key)
+            if board is not None:
+                self._boards.move_to_end(key)
+                return board
+        # _lock の外で読む（初回が重なったときは各自で読み、後勝ち）
+        return self._build(db, key, lambda board: self._install(key, board))
+
+    def load(self, db: Session) -> None:
+        """累計ランキングを読み込む（起動時）"""
+        for metric in METRICS:
+            key = (metric, ALL_TIME)
+            self._build(db, key, lambda board, key=key: self._install(key, board))
+
+    def _replace(self, key: Tuple[str, str], board: Leaderboard) -> None:
+        with self._lock:
+            if key in self._boards:
+                self._boards[key] = board
+
+    def resync(self, db: Session) -> None:
+        """保持しているランキングを DB から作り直す"""
+        with self._lock:
+            keys = list(self._boards)
+        for key in keys:
+            self._build(db, key, lambda board, key=key: self._replace(key, board))
+
+    def record_completions(self, user_id: int, completions: Sequence[Tuple[int, float, str]]) -> None:
+        """commit 済みの達成 (point, co2, "YYYY-MM") を、読み込み済みのランキングに足す（recording() の中で呼ぶ）"""
+        with self._lock:
+            boards = dict(self._boards)
+        for point, co2, month in completions:
+            for metric, delta in (("co2", co2 or 0.0), ("points", point or 0)):
+                for period in (ALL_TIME, month):
+                    board = boards.get((metric, period))
+                    if board is not None:
+                        board.add(user_id, delta)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._boards.clear()
+
+
+class LeaderboardSyncer:
+    """resync() を interval 秒ごとに別スレッドで実行する（リクエストには負荷をかけない）"""
+
+    def __init__(self, leaderboards: LeaderboardSet, session_factory, interval: float):
+        self.leaderboards = leaderboards
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            db = self.session_factory()
+            try:
+                self.leaderboards.resync(db)
+            except Exception as e:
+                logger.warning("leaderboard resync failed: %s", e.__class__.__name__)
+            finally:
+                db.close()
+
+    def start(self) -> None:
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="leaderboard-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+leaderboards = LeaderboardSet(max_months=settings.LEADERBOARD_MAX_MONTHS)
@@ -0,0 +1,234 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+LOG_RECORDS_DROPPED = registry.counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+
+# リクエストごとの相関 ID（RequestIdMiddleware が入れる。スレッドプールにも引き継がれる）
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# LogRecord が元から持っている属性（これ以外は extra= で渡されたフィールドとして JSON に出す）
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+# ==============================
+# 秘密情報のマスク
+# ==============================
+REDACTED = "[REDACTED]"
+_SECRET_KEY = re.compile(r"pass(word)?|token|secret|authorization|cookie|api[_-]?key|credential", re.I)
+_SECRET_PATTERNS = (
+    (re.compile(r"eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]*"), REDACTED),                # JWT
+    (re.compile(r"(?i)\bbearer\s+[A-Za-z0-9._~+/=-]+"), f"Bearer {REDACTED}"),
+    (re.compile(r"(?i)\b(\w*(?:password|secret|token))=([^\s&,;]+)"), rf"\1={REDACTED}"),      # key=value
+)
+
+
+def redact_text(text: str) -> str:
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def redact_value(key: str, value):
+    if _SECRET_KEY.search(key):
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact_value(str(k), v) for k, v in value.items()}
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """メッセージ・例外・extra のフィールドからトークンやパスワードを消す"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact_text(record.getMessage())
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = redact_text(record.exc_text)
+        record.exc_info = None
+        for key in list(vars(record)):
+            if key not in _RESERVED:
+                setattr(record, key, redact_value(key, getattr(record, key)))
+        return True
+
+
+# ==============================
+# 相関 ID・サンプリング
+# ==============================
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    DEBUG 以下を rate の割合だけ残す（量の多いデバッグログ用）
+    extra={"sample_rate": 0.01} でレコードごとに上書きできる（WARNING 以上は常に残す）
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample_rate", self.rate if record.levelno <= logging.DEBUG else 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+# ==============================
+# 出力（JSON / テキスト）
+# ==============================
+class JsonFormatter(logging.Formatter):
+    """1レコード1行の JSON（extra= で渡したフィールドもそのまま入る）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key != "sample_rate":
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """ローカル開発用（[LEVEL] logger: msg key=value）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(
+            f"{k}={v}" for k, v in vars(record).items() if k not in _RESERVED and k != "sample_rate"
+        )
+        request_id = getattr(record, "request_id", None)
+        line = f"[{record.levelname}] {record.name}: {record.getMessage()}"
+        line += f" {fields}" if fields else ""
+        line += f" request_id={request_id}" if request_id else ""
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    リクエストのスレッドではキューに積むだけ（整形と書き出しは QueueListener のスレッド）
+    キューが一杯なら待たずに捨てて数える
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # フィルタ（RedactingFilter）でメッセージと例外は文字列化済み。整形はリスナー側で行う
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = None, fmt: str = None, sample_rate: float = None,
+                      stream=None) -> None:
+    """
+    app.* のロガーを キュー → 別スレッドで stdout に出す構成にする（lifespan の起動時に呼ぶ）
+    何度呼んでも1組だけ
+    """
+    global _listener
+    if _listener is not None:
+        return
+    level = (level or settings.LOG_LEVEL).upper()
+    fmt = fmt or settings.LOG_FORMAT
+    sample_rate = settings.LOG_DEBUG_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    # 捨てるものは先に捨て、相関 ID はリクエストのスレッドで読む
+    handler.addFilter(SamplingFilter(sample_rate))
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(RedactingFilter())
+
+    logger = logging.getLogger("app")
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+    # 計測用プール（app.core.metrics の QueuePool サブクラス）は SQLAlchemy の接続ごとのログを
+    # app.* の名前で出すので、DEBUG でも WARNING 以上に絞る
+    logging.getLogger("app.core.metrics").setLevel(max(logging.getLevelName(level), logging.WARNING))
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """キューに残っている分を書き出して止める（lifespan の終了時）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# ==============================
+# 相関 ID ミドルウェア
+# ==============================
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    X-Request-ID を受け取って（無ければ作って）ログの request_id に入れ、レスポンスにも返す（ASGI ミドルウェア）
+    """
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(self.header, b"").decode("latin-1")
+        request_id = incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        # 例外ハンドラはこのミドルウェアの外で動くので request.state からも読めるようにする
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,169 @@
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from typing import Callable, Iterable, List, Optional
+
+from app.core.metrics import DEFAULT_BUCKETS, registry
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_LAG = registry.histogram(
+    "event_loop_lag_seconds", "Delay of a periodic event loop tick behind its schedule",
+    buckets=(0.001,) + DEFAULT_BUCKETS,
+)
+EVENT_LOOP_STALLS = registry.counter(
+    "event_loop_stalls_total", "Times the event loop was blocked longer than the threshold", ("route",)
+)
+
+# 実行中のリクエスト（タスク → ASGI scope）。止まったときにどのルートが原因かを出すのに使う
+_request_scopes: "weakref.WeakKeyDictionary[asyncio.Task, dict]" = weakref.WeakKeyDictionary()
+
+
+def _describe_scope(scope: Optional[dict]) -> str:
+    if scope is None:
+        return "<no request>"
+    route = scope.get("route")
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}".strip()
+
+
+class LoopTaskMiddleware:
+    """リクエストを処理しているタスクと scope を対応付けておく（ASGI ミドルウェア）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        task = asyncio.current_task() if scope["type"] == "http" else None
+        if task is not None:
+            _request_scopes[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if task is not None:
+                _request_scopes.pop(task, None)
+
+
+# ==============================
+# イベントループの停止検知
+# ==============================
+class LoopStallMonitor:
+    """
+    イベントループが threshold 秒以上止まったら、止めているルートとスタックを出す
+    - ループ上のタスクが interval 秒ごとに時刻を記録し、遅れを event_loop_lag_seconds に入れる
+    - 別スレッドの見張りが記録の途絶えを検知し、ループのスレッドのスタックをその場で取る
+      （止まっている最中に取るので、同期 DB 呼び出しなど原因の行がそのまま出る）
+    """
+
+    STACK_DEPTH = 15  # 報告に出すフレーム数（内側から）
+
+    def __init__(self, threshold: float, interval: float = 0.05, report: Callable[[str], None] = logger.warning):
+        self.threshold = threshold
+        self.interval = interval
+        self.report = report
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _tick(self) -> None:
+        while True:
+            scheduled = time.monotonic()
+            self._heartbeat = scheduled
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, time.monotonic() - scheduled - self.interval))
+
+    def _blocking_task_scope(self) -> Optional[dict]:
+        # ループが止まっている間は current_task が止めている本人
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        return _request_scopes.get(task) if task is not None else None
+
+    def _watch(self) -> None:
+        stalled_since = None  # 報告済みの停止が始まった時刻（止まる直前の記録）
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold:
+                if stalled_since is not None:
+                    self.report(f"event loop resumed after {(heartbeat - stalled_since) * 1000:.0f}ms")
+                    stalled_since = None
+                continue
+            if stalled_since is not None:
+                continue  # 同じ停止は1回だけ報告する
+            stalled_since = heartbeat
+            route = _describe_scope(self._blocking_task_scope())
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = (
+                "".join(traceback.format_list(traceback.extract_stack(frame)[-self.STACK_DEPTH:]))
+                if frame is not None else "  <no stack>\n"
+            )
+            EVENT_LOOP_STALLS.inc(route=route)
+            self.report(
+                f"event loop blocked for {blocked * 1000:.0f}ms+ in {route}\n{stack.rstrip()}"
+            )
+
+    def start(self) -> None:
+        """イベントループ上から呼ぶ（lifespan の起動処理）"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-stall-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._watchdog = None
+
+
+# ==============================
+# 起動時の監査（async ルートが同期セッションに依存していないか）
+# ==============================
+def _is_async(call) -> bool:
+    return inspect.iscoroutinefunction(call) or inspect.iscoroutinefunction(getattr(call, "__call__", None))
+
+
+def _blocking_dependencies(dependant, blocking: Iterable[Callable]) -> List[str]:
+    """
+    async の関数が直接受け取る同期セッション依存を探す
+    （同期の依存関数はスレッドプールで動くので、その中で使う分には問題ない。async の依存関数だけ辿る）
+    """
+    found = []
+    for sub in dependant.dependencies:
+        if sub.call in blocking:
+            found.append(sub.call.__name__)
+        elif _is_async(sub.call):
+            found.extend(f"{sub.call.__name__} -> {name}" for name in _blocking_dependencies(sub, blocking))
+    return found
+
+
+def audit_async_routes(app, blocking: Iterable[Callable]) -> List[str]:
+    """async def のエンドポイントが同期の get_db などに依存していたら 'METHOD path: 依存' を返す"""
+    from fastapi.routing import APIRoute
+
+    blocking = tuple(blocking)
+    problems = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or not _is_async(route.endpoint):
+            continue
+        for name in _blocking_dependencies(route.dependant, blocking):
+            methods = ",".join(sorted(route.methods or ()))
+            problems.append(f"{methods} {route.path}: async endpoint {route.endpoint.__name__} depends on {name}")
+    return problems
@@ -0,0 +1,340 @@
+import abc
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+
+
+# ==============================
+# メトリクス本体（Prometheus テキスト形式で出力）
+# ==============================
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterable[str]:
+        """HELP / TYPE の後に続くサンプル行"""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """現在値（ベンチマークで前後の差分を取る用）"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """値を set() するか、callback で出力時に読む"""
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callbacks: List[Callable[[], Iterable[Tuple[Dict[str, str], float]]]] = []
+        if callback is not None:
+            self._callbacks.append(callback)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def add_callback(self, callback: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+        self._callbacks.append(callback)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for callback in self._callbacks:
+            for labels, value in callback():
+                values[self._key(labels)] = value
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket ごとの件数..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def totals(self, **labels) -> Tuple[float, int]:
+        """(sum, count) を返す（ベンチマークで前後の差分を取る用）"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (state[-2], state[-1]) if state is not None else (0.0, 0)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+HTTP_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements issued per request", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+HTTP_DB_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL per request", ("method", "route")
+)
+DB_QUERIES = registry.counter("db_queries_total", "SQL statements executed", ("engine",))
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "SQL statement latency", ("engine",)
+)
+DB_POOL_CHECKOUT_SECONDS = registry.histogram(
+    "db_pool_checkout_seconds", "Time waiting for a pooled connection", ("engine",)
+)
+DB_POOL_TIMEOUTS = registry.counter(
+    "db_pool_timeouts_total", "Pool checkouts that timed out", ("engine",)
+)
+DB_POOL_CHECKED_OUT = registry.gauge(
+    "db_pool_checked_out", "Connections currently checked out", ("engine",)
+)
+DB_POOL_OVERFLOW = registry.gauge(
+    "db_pool_overflow", "Connections opened beyond pool_size", ("engine",)
+)
+DB_POOL_SIZE = registry.gauge("db_pool_size", "Configured pool_size", ("engine",))
+
+
+# ==============================
+# リクエスト単位の DB 集計
+# ==============================
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+# ==============================
+# SQLAlchemy 計測
+# ==============================
+class _TimedCheckoutMixin:
+    """接続の取得待ち時間を計る（QueuePool の _do_get を包む）"""
+
+    metrics_engine_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc(engine=self.metrics_engine_name)
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(
+                time.perf_counter() - start, engine=self.metrics_engine_name
+            )
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_engine(engine, name: str = "primary") -> None:
+    """SQL の件数・時間とコネクションプールの状態を計測する"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    pool = sync_engine.pool
+    if isinstance(pool, _TimedCheckoutMixin):
+        pool.metrics_engine_name = name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERIES.inc(engine=name)
+        DB_QUERY_SECONDS.observe(elapsed, engine=name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # 失敗した SQL の開始時刻を捨てる
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    if hasattr(pool, "checkedout"):
+        labels = {"engine": name}
+        DB_POOL_CHECKED_OUT.add_callback(lambda: [(labels, pool.checkedout())])
+        DB_POOL_OVERFLOW.add_callback(lambda: [(labels, max(pool.overflow(), 0))])
+        DB_POOL_SIZE.add_callback(lambda: [(labels, pool.size())])
+
+
+# ==============================
+# ミドルウェア
+# ==============================
+class MetricsMiddleware:
+    """ルートごとのレイテンシ・ステータス・SQL 件数を記録する（ASGI ミドルウェア）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            # マッチしなかったパスはラベルを増やさないようにまとめる
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method=method, route=route_path, status=str(status_code))
+            HTTP_LATENCY.observe(elapsed, method=method, route=route_path)
+            HTTP_DB_QUERIES.observe(stats.queries, method=method, route=route_path)
+            HTTP_DB_SECONDS.observe(stats.db_seconds, method=method, route=route_path)
+            _request_stats.reset(token)
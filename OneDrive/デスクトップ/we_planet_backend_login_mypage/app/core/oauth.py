@@ -1,12 +1,46 @@
-from authlib.integrations.starlette_client import OAuth
+import logging
+from functools import lru_cache
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core import oidc
 from app.core.config import settings
 
-oauth = OAuth()
+logger = logging.getLogger(__name__)
+
+
+@lru_cache()
+def get_oauth():
+    """Google OAuth クライアント（authlib の import が重いので、初めてログインに使うときに作る）"""
+    from authlib.integrations.starlette_client import OAuth
+
+    oauth = OAuth()
+    # server_metadata_url は渡さない（メタデータと JWKS は oidc.google_oidc のキャッシュから入れる）
+    oauth.register(
+        name="google",
+        client_id=settings.GOOGLE_CLIENT_ID,
+        client_secret=settings.GOOGLE_CLIENT_SECRET,
+        client_kwargs={"scope": "openid email profile"},
+    )
+    return oauth
+
+
+async def get_google_client():
+    """キャッシュ済みのメタデータを入れた Google クライアント（ログイン中に外へ取りに行かない）"""
+    provider = oidc.google_oidc
+    if not provider.loaded:
+        # 起動直後でまだ取れていないときだけ（スレッドで待つ）
+        try:
+            await run_in_threadpool(provider.ensure_loaded)
+        except Exception as e:
+            logger.warning("OIDC metadata is unavailable: %s", e.__class__.__name__)
+            raise HTTPException(status_code=503, detail="Google login is temporarily unavailable")
+    client = get_oauth().google
+    client.server_metadata = provider.server_metadata()
+    return client
+
 
-oauth.register(
-    name="google",
-    client_id=settings.GOOGLE_CLIENT_ID,
-    client_secret=settings.GOOGLE_CLIENT_SECRET,
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={"scope": "openid email profile"},
-)
+def use_google_provider(provider: "oidc.OIDCProvider") -> None:
+    """Google の代わりの発行者を使う（テストでローカルの発行者を立てるとき）"""
+    oidc.google_oidc = provider
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Fetcher = Callable[[str], dict]
+
+
+def _http_fetch(url: str) -> dict:
+    import httpx  # 取りに行くときだけ読み込む
+
+    response = httpx.get(url, timeout=settings.OIDC_FETCH_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json()
+
+
+# ==============================
+# OpenID Connect のディスカバリ / JWKS キャッシュ
+# ==============================
+class OIDCProvider:
+    """
+    ディスカバリ文書と JWKS（ID トークンの署名鍵）を TTL 付きでプロセス内に持つ
+    - ログイン処理はキャッシュだけを使う（authlib にはメタデータを取りに行かせない）
+    - 取り直しは OIDCRefresher が別スレッドで行い、失敗しても古いものを使い続ける
+    - cache_path を指定するとディスクにも保存し、再起動直後はそれを使う（ネットワーク無しで起動できる）
+    - fetcher を差し替えるとローカルの発行者（テスト用）に向けられる
+    """
+
+    def __init__(self, discovery_url: str, ttl: float, cache_path: Optional[str] = None,
+                 fetcher: Fetcher = _http_fetch):
+        self.discovery_url = discovery_url
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self._fetch = fetcher
+        self._lock = threading.Lock()
+        self._metadata: Optional[dict] = None
+        self._jwks: Optional[dict] = None
+        self._fetched_at = 0.0  # time.time()（ディスクに保存するので壁時計）
+
+    @property
+    def loaded(self) -> bool:
+        return self._metadata is not None and self._jwks is not None
+
+    def is_stale(self) -> bool:
+        return not self.loaded or time.time() - self._fetched_at >= self.ttl
+
+    def _store(self, metadata: dict, jwks: dict, fetched_at: float) -> None:
+        with self._lock:
+            self._metadata, self._jwks, self._fetched_at = metadata, jwks, fetched_at
+
+    def load_cache(self) -> bool:
+        """ディスクのキャッシュを読む（期限切れでも読み込み、取り直しは refresher に任せる）"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("discovery_url") != self.discovery_url:
+                return False
+            self._store(data["metadata"], data["jwks"], float(data["fetched_at"]))
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("failed to read OIDC cache: %s", e.__class__.__name__)
+            return False
+
+    def _save_cache(self) -> None:
+        tmp_path = f"{self.cache_path}.tmp"
+        with self._lock:
+            data = {
+                "discovery_url": self.discovery_url,
+                "metadata": self._metadata,
+                "jwks": self._jwks,
+                "fetched_at": self._fetched_at,
+            }
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)  # 書きかけのファイルを読ませない
+        except OSError as e:
+            logger.warning("failed to write OIDC cache: %s", e.__class__.__name__)
+
+    def refresh(self) -> None:
+        """ディスカバリ文書と JWKS を取り直す（失敗したら例外。キャッシュはそのまま）"""
+        metadata = self._fetch(self.discovery_url)
+        jwks_uri = metadata.get("jwks_uri")
+        if not jwks_uri:
+            raise ValueError('Missing "jwks_uri" in discovery document')
+        jwks = self._fetch(jwks_uri)
+        self._store(metadata, jwks, time.time())
+        if self.cache_path:
+            self._save_cache()
+
+    def ensure_loaded(self) -> None:
+        """まだ何も持っていないときだけ取りに行く（起動直後に refresher より先にログインが来た場合）"""
+        if not self.loaded and not self.load_cache():
+            self.refresh()
+
+    def server_metadata(self) -> dict:
+        """authlib の client.server_metadata にそのまま渡せる形（jwks 同梱・取得済み扱い）"""
+        with self._lock:
+            if self._metadata is None:
+                raise RuntimeError("OIDC metadata is not loaded")
+            return dict(self._metadata, jwks=self._jwks, _loaded_at=self._fetched_at)
+
+
+class OIDCRefresher:
+    """
+    TTL が切れる前に別スレッドで取り直す（失敗したら retry 秒後にもう一度）
+    provider を渡さなければ毎回 google_oidc を見る（use_google_provider で差し替えた発行者を取り直す）
+    """
+
+    def __init__(self, provider: Optional[OIDCProvider] = None, retry_seconds: float = 30.0):
+        self._provider = provider
+        self.retry_seconds = retry_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def provider(self) -> OIDCProvider:
+        return self._provider if self._provider is not None else google_oidc
+
+    def _refresh_once(self) -> bool:
+        try:
+            self.provider.refresh()
+            return True
+        except Exception as e:
+            logger.warning("OIDC metadata refresh failed: %s", e.__class__.__name__)
+            return False
+
+    def _run(self) -> None:
+        ok = True
+        if self.provider.is_stale():
+            ok = self._refresh_once()
+        while True:
+            # TTL の半分で取り直す（失敗中は retry_seconds ごと）
+            delay = self.provider.ttl / 2 if ok else self.retry_seconds
+            if self._stop.wait(delay):
+                return
+            ok = self._refresh_once()
+
+    def start(self) -> None:
+        if self.provider.ttl > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="oidc-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+google_oidc = OIDCProvider(
+    discovery_url=settings.GOOGLE_OIDC_DISCOVERY_URL,
+    ttl=settings.OIDC_CACHE_TTL_SECONDS,
+    cache_path=settings.OIDC_CACHE_PATH,
+)
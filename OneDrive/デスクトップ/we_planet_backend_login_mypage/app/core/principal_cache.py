@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """認証済みユーザーのスナップショット（get_current_user が返す）"""
+    user_id: int
+    email: str
+    nickname: Optional[str] = None
+    badge_id: Optional[int] = None
+    auth_provider: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            user_id=user.user_id,
+            email=user.email,
+            nickname=user.nickname,
+            badge_id=user.badge_id,
+            auth_provider=user.auth_provider,
+        )
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> Optional["Principal"]:
+        """署名済みトークンのクレームから作る（必要なクレームが無ければ None）"""
+        if "email" not in payload:
+            return None
+        return cls(
+            user_id=int(payload["sub"]),
+            email=payload["email"],
+            nickname=payload.get("nickname"),
+            badge_id=payload.get("badge_id"),
+            auth_provider=payload.get("auth_provider"),
+        )
+
+    def claims(self) -> dict:
+        """アクセストークンに埋め込むクレーム"""
+        return {
+            "sub": str(self.user_id),
+            "email": self.email,
+            "nickname": self.nickname,
+            "badge_id": self.badge_id,
+            "auth_provider": self.auth_provider,
+        }
+
+
+class PrincipalCache:
+    """
+    検証済みトークン → Principal の TTL/LRU キャッシュ
+    - キーはトークンの SHA-256（生のトークンは保持しない）
+    - エントリの寿命は TTL とトークンの exp の早い方
+    - invalidate_user() でそのユーザーのエントリを捨てる（プロセス内のみ）
+    - 他プロセスや DB の直接編集での変更・退会は revalidate() で拾う（PrincipalCacheSyncer が定期実行）
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, token_lifetime_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.token_lifetime_seconds = token_lifetime_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, Tuple[Principal, float]]" = OrderedDict()
+        self._keys_by_user: Dict[int, Set[bytes]] = {}
+        self._invalidated_at: Dict[int, float] = {}
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def _drop(self, key: bytes) -> None:
+        principal, _ = self._entries.pop(key)
+        keys = self._keys_by_user.get(principal.user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[principal.user_id]
+
+    def get(self, token: str) -> Optional[Principal]:
+        if self.max_entries <= 0:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if time.time() >= expires_at:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return principal
+
+    def put(self, token: str, principal: Principal, token_exp: Optional[float] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+        key = self._key(token)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (principal, expires_at)
+            self._keys_by_user.setdefault(principal.user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        """ユーザー更新・退会時に呼ぶ"""
+        now = time.time()
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._drop(key)
+            self._invalidated_at[user_id] = now
+            # 発行済みトークンがすべて失効した古い記録は捨てる
+            horizon = now - self.token_lifetime_seconds
+            for uid in [u for u, t in self._invalidated_at.items() if t < horizon]:
+                del self._invalidated_at[uid]
+
+    def is_invalidated(self, user_id: int, issued_at: Optional[float]) -> bool:
+        """issued_at 以降に invalidate_user されていれば True（クレームを信用できない）"""
+        invalidated_at = self._invalidated_at.get(user_id)
+        if invalidated_at is None:
+            return False
+        return issued_at is None or issued_at <= invalidated_at
+
+    def user_ids(self) -> List[int]:
+        """キャッシュに載っているユーザー"""
+        with self._lock:
+            return list(self._keys_by_user)
+
+    def revalidate(self, user_ids: List[int], current: Dict[int, Principal]) -> int:
+        """
+        DB から読み直した current（user_ids のうち見つかったユーザー）と食い違うエントリを捨てる
+        current に無いユーザーは削除済みとして捨てる。捨てたユーザー数を返す
+        """
+        stale = []
+        with self._lock:
+            for user_id in user_ids:
+                keys = self._keys_by_user.get(user_id)
+                if not keys:
+                    continue
+                fresh = current.get(user_id)
+                if fresh is None or any(self._entries[key][0] != fresh for key in keys):
+                    stale.append(user_id)
+        for user_id in stale:
+            self.invalidate_user(user_id)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self._invalidated_at.clear()
+
+
+principal_cache = PrincipalCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    token_lifetime_seconds=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+
+class PrincipalCacheSyncer:
+    """
+    revalidate(db) を起動時と interval 秒ごとに別スレッドで実行する
+    ユーザーの変更・退会がキャッシュに残るのはおおむね interval 秒になる（TTL まで待たない）
+    """
+
+    def __init__(self, revalidate: Callable[..., int], session_factory, interval: float):
+        self.revalidate = revalidate
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        # 起動直後にも1回流す（キャッシュが空のうちに変更を拾い始める目印を決める）
+        while True:
+            db = self.session_factory()
+            try:
+                self.revalidate(db)
+            except Exception as e:
+                logger.warning("principal cache revalidation failed: %s", e.__class__.__name__)
+            finally:
+                db.close()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="principal-cache-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,474 @@
+"""
+リクエスト単位のプロファイラ（本番で遅いリクエストの内訳を見る用）
+
+    PROFILE_SAMPLE_RATE=0.01              # 1% のリクエストを計測
+    PROFILE_SECRET=...                    # 署名付きヘッダで狙って計測
+    python -m app.core.profiler token --ttl 600   # X-Profile-Token の値を発行
+
+- sys.setprofile で関数の出入りを記録し、スタックごとの時間を collapsed stack 形式
+  （flamegraph.pl / speedscope にそのまま渡せる）で PROFILE_DIR に書き出す。単位はマイクロ秒
+- 同じ名前の .json にルート・所要時間と、そのリクエストが発行した SQL（文・開始位置・時間）を書く
+- フックはそのリクエストのコルーチンを進めている間（とスレッドプールで動く DB 処理の間）だけ掛ける。
+  同じイベントループの他のリクエストには掛からない
+- await で待っている時間（ループが他のことをしている間）はスタックに入らない。SQL の待ち時間は JSON を見る
+- リクエストが別タスクに任せた処理（shared_read の読み取りなど）はスタックに入らない
+- どちらも未設定ならミドルウェアも SQL のフックも付けないので、無効時の負荷は無い
+"""
+import argparse
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from types import CodeType
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.log import request_id_var
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Stack = Tuple[str, ...]
+
+TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+SQL_MAX_CHARS = 500     # JSON に残す SQL の長さ（パラメータは残さない）
+SQL_MAX_QUERIES = 1000  # 1リクエストで記録する SQL の上限（超えた分は件数だけ）
+
+
+def enabled() -> bool:
+    return settings.PROFILE_SAMPLE_RATE > 0 or bool(settings.PROFILE_SECRET)
+
+
+# ==============================
+# 計測中のリクエスト
+# ==============================
+class RequestProfile:
+    def __init__(self, trigger: str):
+        self.trigger = trigger  # "sample" / "header"
+        self.started = time.perf_counter()
+        self.root = _StackNode(None, None)
+        self.queries: List[dict] = []
+        self.queries_dropped = 0
+
+    def add_sql(self, engine: str, statement: str, start: float, elapsed: float) -> None:
+        if len(self.queries) >= SQL_MAX_QUERIES:
+            self.queries_dropped += 1
+            return
+        self.queries.append({
+            "engine": engine,
+            "offset_ms": round((start - self.started) * 1000, 3),
+            "duration_ms": round(elapsed * 1000, 3),
+            "statement": statement[:SQL_MAX_CHARS],
+        })
+
+    def stacks(self) -> Dict[Stack, float]:
+        """スタックごとの時間（秒）"""
+        result: Dict[Stack, float] = {}
+        pending = [((), self.root)]
+        while pending:
+            stack, node = pending.pop()
+            if node.label is not None:
+                stack = stack + (node.label,)
+                if node.seconds > 0:
+                    result[stack] = node.seconds
+            pending.extend((stack, child) for child in list(node.children.values()))
+        return result
+
+    def collapsed(self) -> str:
+        """1行1スタック（"a;b;c <マイクロ秒>"）"""
+        lines = []
+        for stack, seconds in self.stacks().items():
+            micros = round(seconds * 1_000_000)
+            if micros > 0:
+                lines.append(f"{';'.join(stack)} {micros}")
+        lines.sort()
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+# 実行中のリクエストの計測（スレッドプールにも引き継がれる）
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+# ==============================
+# sys.setprofile のフック
+# ==============================
+class _StackNode:
+    """呼び出しスタックの木の1段（同じスタックは同じノード。時間はノードに足す）"""
+    __slots__ = ("parent", "label", "children", "seconds")
+
+    def __init__(self, parent: Optional["_StackNode"], label: Optional[str]):
+        self.parent = parent
+        self.label = label
+        self.children: Dict[str, "_StackNode"] = {}
+        self.seconds = 0.0
+
+    def child(self, label: str) -> "_StackNode":
+        node = self.children.get(label)
+        if node is None:
+            node = self.children[label] = _StackNode(self, label)
+        return node
+
+
+class _ThreadState:
+    """
+    フックを掛けている間のスレッドごとの状態
+    entries は (フレームまたは C 関数, ノード) の列で、出入りのイベントごとに1段だけ積む・降ろす
+    """
+    __slots__ = ("profile", "node", "entries", "last")
+
+    def __init__(self, profile: "RequestProfile"):
+        self.profile = profile
+        self.node: Optional[_StackNode] = None  # 最初のイベントで実際のフレームから作る
+        self.entries: List[Tuple[object, _StackNode]] = []
+        self.last = 0.0
+
+
+_code_labels: Dict[CodeType, str] = {}
+_local = threading.local()
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    label = _code_labels.get(code)
+    if label is None:
+        module = frame.f_globals.get("__name__", "?")
+        # co_qualname は 3.11 から（3.10 ではクラス名の付かない co_name になる）
+        name = getattr(code, "co_qualname", code.co_name)
+        label = _code_labels[code] = f"{module}.{name}".replace(";", ":")
+    return label
+
+
+def _c_label(func) -> str:
+    module = getattr(func, "__module__", None)
+    if module is None:  # C の型のメソッド（sqlite3.Connection.commit など）
+        module = type(getattr(func, "__self__", None)).__module__
+    return f"{module}.{getattr(func, '__qualname__', repr(func))}".replace(";", ":").replace(" ", "_")
+
+
+def _resync(state: _ThreadState, frame, c_func=None) -> None:
+    """実際のフレームを辿ってスタックを作り直す（フックを掛けた直後と、出入りが合わなかったときだけ）"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    node = state.profile.root
+    entries = []
+    for f in reversed(frames):
+        node = node.child(_label(f))
+        entries.append((f, node))
+    if c_func is not None:
+        node = node.child(_c_label(c_func))
+        entries.append((c_func, node))
+    state.node = node
+    state.entries = entries
+
+
+def _pop(state: _ThreadState, key, frame, c_func=None) -> None:
+    if state.entries and state.entries[-1][0] is key:
+        state.entries.pop()
+        state.node = state.node.parent
+    else:
+        _resync(state, frame, c_func)
+
+
+def _hook(frame, event_name, arg) -> None:
+    now = time.perf_counter()
+    state = getattr(_local, "state", None)
+    if state is None:
+        return
+    if state.node is None:
+        # 掛けた直後: イベント後のスタックを作るだけで、時間はまだ数えない
+        if event_name == "return":
+            _resync(state, frame.f_back)
+        elif event_name == "c_call":
+            _resync(state, frame, arg)
+        else:
+            _resync(state, frame)
+    else:
+        # 直前のイベントからの時間を、その間実行していたスタックに足す
+        state.node.seconds += now - state.last
+        if event_name == "call":
+            state.node = state.node.child(_label(frame))
+            state.entries.append((frame, state.node))
+        elif event_name == "return":
+            _pop(state, frame, frame.f_back)
+        elif event_name == "c_call":
+            state.node = state.node.child(_c_label(arg))
+            state.entries.append((arg, state.node))
+        else:  # c_return / c_exception
+            _pop(state, arg, frame)
+    # スタックを組み立てた時間は足さない
+    state.last = time.perf_counter()
+
+
+def _start(profile: "RequestProfile"):
+    previous = sys.getprofile()
+    _local.state = _ThreadState(profile)
+    sys.setprofile(_hook)
+    return previous
+
+
+def _stop(previous) -> None:
+    sys.setprofile(previous)
+    _local.state = None
+
+
+class _ProfiledCoroutine:
+    """
+    計測するリクエストのコルーチンを1ステップずつ進め、その間だけフックを掛ける
+    （await で止まっている間は外すので、同じイベントループの他のリクエストには掛からない）
+    """
+
+    def __init__(self, coro, profile: "RequestProfile"):
+        self._coro = coro
+        self._profile = profile
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def _step(self, method, *args):
+        previous = _start(self._profile)
+        try:
+            return method(*args)
+        finally:
+            _stop(previous)
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        self._coro.close()
+
+
+def profile_thread(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    スレッドプールで実行する関数を、計測中のリクエストのときだけフック付きで包む（SyncDBRunner.run）
+    計測していなければ fn をそのまま返す
+    """
+    profile = _current.get()
+    if profile is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = _start(profile)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _stop(previous)
+
+    return wrapper
+
+
+# ==============================
+# SQL の記録
+# ==============================
+def capture_sql(engines: Dict[str, object]) -> None:
+    """計測中のリクエストが発行した SQL を記録する（プロファイラが有効なときだけ main から呼ぶ）"""
+    seen = set()
+    for name, engine in engines.items():
+        if engine is None:
+            continue
+        sync_engine = getattr(engine, "sync_engine", engine)
+        if id(sync_engine) in seen:
+            continue  # レプリカ未設定なら primary と同じエンジン
+        seen.add(id(sync_engine))
+        _listen(sync_engine, name)
+
+
+def _listen(sync_engine, name: str) -> None:
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        if profile is not None and conn.info.get("profile_query_start"):
+            start = conn.info["profile_query_start"].pop()
+            profile.add_sql(name, statement, start, time.perf_counter() - start)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("profile_query_start"):
+            conn.info["profile_query_start"].pop()
+
+
+# ==============================
+# 署名付きヘッダ（X-Profile-Token: <期限の UNIX 秒>.<HMAC-SHA256>）
+# ==============================
+def _signature(secret: str, expires: str) -> str:
+    return hmac.new(secret.encode("utf-8"), expires.encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def sign_token(secret: str, ttl_seconds: int = 600, now: Optional[float] = None) -> str:
+    expires = str(int((time.time() if now is None else now) + ttl_seconds))
+    return f"{expires}.{_signature(secret, expires)}"
+
+
+def verify_token(secret: str, token: str, now: Optional[float] = None) -> bool:
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(signature, _signature(secret, expires))
+
+
+# ==============================
+# 書き出し（PROFILE_DIR に <時刻>-<メソッド>-<ルート>-<request_id>.collapsed / .json）
+# ==============================
+def _profile_name(scope: dict, started_at: float) -> str:
+    route = getattr(scope.get("route"), "path", None) or "unmatched"
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(started_at)) + f"{int(started_at * 1000) % 1000:03d}"
+    request_id = request_id_var.get() or os.urandom(4).hex()
+    return f"{stamp}-{scope['method']}-{slug}-{request_id}"
+
+
+def _rotate(directory: str, keep: int) -> None:
+    names = sorted(f[:-len(".json")] for f in os.listdir(directory) if f.endswith(".json"))
+    for name in names[:max(len(names) - keep, 0)]:
+        for suffix in (".json", ".collapsed"):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def write_profile(directory: str, name: str, profile: RequestProfile, meta: dict, keep: int) -> str:
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, name)
+    with open(base + ".collapsed", "w", encoding="utf-8") as f:
+        f.write(profile.collapsed())
+    meta = dict(meta, trigger=profile.trigger, queries=profile.queries, queries_dropped=profile.queries_dropped,
+                db_ms=round(sum(q["duration_ms"] for q in profile.queries), 3))
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    _rotate(directory, keep)
+    return base
+
+
+# ==============================
+# ミドルウェア
+# ==============================
+class ProfilerMiddleware:
+    """サンプリングまたは署名付きヘッダで選ばれたリクエストだけ計測する（ASGI ミドルウェア）"""
+
+    def __init__(self, app, sample_rate: Optional[float] = None, secret: Optional[str] = None,
+                 directory: Optional[str] = None, keep: Optional[int] = None,
+                 min_duration_ms: Optional[int] = None):
+        self.app = app
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.secret = settings.PROFILE_SECRET if secret is None else secret
+        self.directory = directory or settings.PROFILE_DIR
+        self.keep = settings.PROFILE_KEEP if keep is None else keep
+        self.min_duration_ms = settings.PROFILE_MIN_DURATION_MS if min_duration_ms is None else min_duration_ms
+
+    def _trigger(self, scope) -> Optional[str]:
+        if self.secret:
+            for key, value in scope["headers"]:
+                if key == TOKEN_HEADER:
+                    if verify_token(self.secret, value.decode("latin-1")):
+                        return "header"
+                    break
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        profile = RequestProfile(trigger)
+        name = None
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal name, status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                name = _profile_name(scope, started_at)
+                if trigger == "header":
+                    # ヘッダで頼んだ人にはどのファイルかを返す
+                    message["headers"] = list(message.get("headers", [])) + [(PROFILE_ID_HEADER, name.encode("latin-1"))]
+            await send(message)
+
+        token = _current.set(profile)
+        try:
+            await _ProfiledCoroutine(self.app(scope, receive, send_wrapper), profile)
+        finally:
+            _current.reset(token)
+            duration_ms = (time.perf_counter() - profile.started) * 1000
+            if duration_ms >= self.min_duration_ms:
+                await self._save(scope, profile, name or _profile_name(scope, started_at), status_code,
+                                 started_at, duration_ms)
+
+    async def _save(self, scope, profile: RequestProfile, name: str, status_code: int,
+                    started_at: float, duration_ms: float) -> None:
+        meta = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(scope.get("route"), "path", None),
+            "status": status_code,
+            "request_id": request_id_var.get(),
+            "started_at": started_at,
+            "duration_ms": round(duration_ms, 3),
+        }
+        try:
+            path = await run_in_threadpool(write_profile, self.directory, name, profile, meta, self.keep)
+        except OSError as e:
+            logger.warning("failed to write profile: %s", e.__class__.__name__)
+            return
+        logger.info("request profiled", extra={
+            "profile": path, "trigger": profile.trigger, "duration_ms": round(duration_ms, 1),
+            "queries": len(profile.queries) + profile.queries_dropped,
+        })
+
+
+# ==============================
+# CLI（ヘッダの値を発行する）
+# ==============================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Request profiler helpers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    token = sub.add_parser("token", help="X-Profile-Token ヘッダの値を発行する（PROFILE_SECRET で署名）")
+    token.add_argument("--ttl", type=int, default=600, help="有効期限（秒）")
+    args = parser.parse_args(argv)
+
+    if not settings.PROFILE_SECRET:
+        print("PROFILE_SECRET is not set", file=sys.stderr)
+        return 1
+    print(sign_token(settings.PROFILE_SECRET, args.ttl))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
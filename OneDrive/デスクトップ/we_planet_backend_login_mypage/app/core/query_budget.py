@@ -0,0 +1,162 @@
+"""
+ルートごとの SQL 件数の上限（クエリバジェット）と N+1 の検知
+
+    @router.get("/me")
+    @query_budget(2)            # @router.get の下に付ける
+    async def get_me(...): ...
+
+- エンジンのイベントで1リクエストに発行された SQL を数え、上限を超えたら報告する
+- 同じ SQL（パラメータ違い）が QUERY_REPEAT_THRESHOLD 回以上出たら N+1 の疑いとして報告する
+- QUERY_BUDGET_MODE=log（本番）は WARNING を出して数えるだけ、raise（テスト・CI）は例外にする
+"""
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_EXCEEDED = registry.counter(
+    "db_query_budget_exceeded_total", "Requests that issued more SQL statements than their route's budget",
+    ("method", "route"),
+)
+QUERY_REPEATS = registry.counter(
+    "db_query_repeats_total", "Requests that repeated the same SQL statement (suspected N+1)", ("method", "route")
+)
+
+STATEMENT_MAX_CHARS = 200  # 報告に出す SQL の長さ
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """QUERY_BUDGET_MODE=raise のときに上限超え・N+1 の疑いで投げる"""
+
+
+class QueryBudget(NamedTuple):
+    max_queries: int
+    max_repeats: Optional[int]  # None なら QUERY_REPEAT_THRESHOLD
+
+
+def query_budget(max_queries: int, max_repeats: Optional[int] = None):
+    """
+    ルートの SQL 件数の上限を宣言する
+    件数が入力に比例するルート（一括登録など）は max_repeats で同じ SQL の繰り返しを許す
+    """
+    def decorator(endpoint):
+        endpoint.__query_budget__ = QueryBudget(max_queries, max_repeats)
+        return endpoint
+    return decorator
+
+
+# ==============================
+# リクエスト単位の SQL の記録
+# ==============================
+class QueryLog:
+    __slots__ = ("count", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str) -> None:
+        self.count += 1
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        return [(s, n) for s, n in self.statements.most_common() if n >= threshold]
+
+
+_current: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+
+
+def track_queries(engines: Dict[str, object]) -> None:
+    """エンジンに SQL を数えるフックを付ける（QUERY_BUDGET_MODE が off 以外のとき main から呼ぶ）"""
+    seen = set()
+    for engine in engines.values():
+        if engine is None:
+            continue
+        sync_engine = getattr(engine, "sync_engine", engine)
+        if id(sync_engine) in seen:
+            continue
+        seen.add(id(sync_engine))
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _current.get()
+    if log is not None:
+        log.record(statement)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryLog]:
+    """with count_queries() as log: の中で発行した SQL を数える（track_queries 済みのエンジンのみ。スクリプト・テスト用）"""
+    log = QueryLog()
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+
+
+def check(log: QueryLog, budget: Optional[QueryBudget], repeat_threshold: int) -> List[str]:
+    """上限超えと N+1 の疑いを文字列で返す（問題なければ空）"""
+    problems = []
+    if budget is not None and log.count > budget.max_queries:
+        problems.append(f"{log.count} queries (budget {budget.max_queries})")
+    if budget is not None and budget.max_repeats is not None:
+        repeat_threshold = budget.max_repeats + 1
+    if repeat_threshold > 0:
+        problems.extend(
+            f"suspected N+1: {n}x {statement[:STATEMENT_MAX_CHARS]}"
+            for statement, n in log.repeated(repeat_threshold)
+        )
+    return problems
+
+
+# ==============================
+# ミドルウェア
+# ==============================
+class QueryBudgetMiddleware:
+    """リクエストごとに SQL を数え、ルートの @query_budget と照らし合わせる（ASGI ミドルウェア）"""
+
+    def __init__(self, app, mode: Optional[str] = None, repeat_threshold: Optional[int] = None):
+        self.app = app
+        self.mode = mode or settings.QUERY_BUDGET_MODE
+        self.repeat_threshold = settings.QUERY_REPEAT_THRESHOLD if repeat_threshold is None else repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = _current.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+        self._check(scope, log)
+
+    def _check(self, scope, log: QueryLog) -> None:
+        route = scope.get("route")
+        budget = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+        problems = check(log, budget, self.repeat_threshold)
+        if not problems:
+            return
+
+        labels = {"method": scope["method"], "route": getattr(route, "path", None) or "<unmatched>"}
+        if budget is not None and log.count > budget.max_queries:
+            QUERY_BUDGET_EXCEEDED.inc(**labels)
+        if any(p.startswith("suspected N+1") for p in problems):
+            QUERY_REPEATS.inc(**labels)
+        message = f"{labels['method']} {labels['route']}: " + "; ".join(problems)
+        if self.mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning("SQL budget check failed: %s", message,
+                       extra={"queries": log.count, "budget": budget.max_queries if budget else None})
@@ -0,0 +1,123 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.bloom import BloomFilter
+from app.core.config import settings
+from app.models.token_revocation import TokenRevocation
+
+
+class RevocationList:
+    """
+    リフレッシュトークンの失効リスト
+    - token_revocations テーブルをブルームフィルタに載せ、失効していないトークンは DB を見ずに通す
+    - フィルタに当たったときだけ DB で確認する（誤検出対策）
+    - 他プロセスでの失効は sync_seconds ごとの差分読込で取り込む
+      目印は読み込んだ revoked_at の最大値。revoked_at は DB の now() で入るので、プロセス間の時計のずれに左右されない
+    """
+
+    # 失効の INSERT から commit まで（_refresh / _revoke の数文）が遅れても取りこぼさないよう、目印から遡って読む
+    # 遡った分は既にフィルタに入っているので、数え直さない（BloomFilter.add）
+    SYNC_OVERLAP = timedelta(seconds=30)
+
+    def __init__(self, capacity: int, error_rate: float, sync_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._filter = BloomFilter(capacity, error_rate)
+        self._watermark: Optional[datetime] = None
+        self._synced_at = 0.0
+        self.loaded = False
+
+    def _add_rows(self, bloom: BloomFilter, rows) -> Optional[datetime]:
+        latest = None
+        for token_id, revoked_at in rows:
+            bloom.add(token_id)
+            if latest is None or revoked_at > latest:
+                latest = revoked_at
+        return latest
+
+    def load(self, db: Session) -> None:
+        """有効期限内の失効をすべて読み直す（起動時・フィルタが一杯になったとき）"""
+        rows = db.execute(
+            select(TokenRevocation.token_id, TokenRevocation.revoked_at)
+            .where(TokenRevocation.expires_at > datetime.utcnow())
+            .execution_options(yield_per=10000)
+        ).all()
+        bloom = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+        latest = self._add_rows(bloom, rows)
+        with self._lock:
+            self._filter = bloom
+            self._watermark = latest
+            self._synced_at = time.monotonic()
+            self.loaded = True
+
+    def sync(self, db: Session) -> None:
+        """前回以降に他プロセスで失効したものを取り込む（sync_seconds に1回まで）"""
+        if not self.loaded:
+            self.load(db)
+            return
+        if time.monotonic() - self._synced_at < self.sync_seconds:
+            return
+        self._synced_at = time.monotonic()
+
+        query = select(TokenRevocation.token_id, TokenRevocation.revoked_at)
+        if self._watermark is not None:
+            query = query.where(TokenRevocation.revoked_at >= self._watermark - self.SYNC_OVERLAP)
+        rows = db.execute(query).all()
+        with self._lock:
+            latest = self._add_rows(self._filter, rows)
+            if latest is not None and (self._watermark is None or latest > self._watermark):
+                self._watermark = latest
+            full = self._filter.is_full
+        if full:
+            self.load(db)
+
+    def might_be_revoked(self, *token_ids: str) -> bool:
+        """False なら確実に失効していない（DB を見なくてよい）"""
+        bloom = self._filter
+        return any(token_id in bloom for token_id in token_ids)
+
+    def is_revoked(self, db: Session, *token_ids: str) -> bool:
+        """DB で確認する（might_be_revoked が True のときだけ呼ぶ）"""
+        row = db.execute(
+            select(TokenRevocation.token_id).where(TokenRevocation.token_id.in_(token_ids)).limit(1)
+        ).first()
+        return row is not None
+
+    def revoke(
+        self, db: Session, token_id: str, kind: str, user_id: int, expires_at: datetime
+    ) -> bool:
+        """
+        失効を記録する（commit は呼び出し側）
+        既に失効済みなら False を返し、トランザクションはロールバックされる
+        （主キー衝突で判定するので同時実行でも1回しか成功しない）
+        """
+        # revoked_at は DB の now()（差分読込の目印になるので、アプリの時計では入れない）
+        db.add(TokenRevocation(
+            token_id=token_id,
+            kind=kind,
+            user_id=user_id,
+            expires_at=expires_at,
+        ))
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            return False
+        with self._lock:
+            self._filter.add(token_id)
+        return True
+
+
+revocation_list = RevocationList(
+    capacity=settings.REFRESH_REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.REFRESH_REVOCATION_BLOOM_ERROR_RATE,
+    sync_seconds=settings.REFRESH_REVOCATION_SYNC_SECONDS,
+)
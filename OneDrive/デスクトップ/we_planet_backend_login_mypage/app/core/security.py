@@ -1,78 +1,273 @@
+import logging
+import threading
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.core.database import get_db
+from app.core.database import DBRunner, get_read_db_runner, has_read_replica, open_primary_runner
+from app.core.hashing import HashingOverloaded, password_hash_pool
+from app.core.principal_cache import Principal, principal_cache
 from app import models
 
+logger = logging.getLogger(__name__)
+
 # --- パスワードハッシュ用設定 ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# BCRYPT_ROUNDS 未満のハッシュは needs_update 扱い（ログイン成功時に再ハッシュ）
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many login requests, please retry",
+        headers={"Retry-After": "1"},
+    )
 
 
 def get_password_hash(password: str) -> str:
-    """平文パスワードをハッシュ化"""
-    return pwd_context.hash(password)
+    """平文パスワードをハッシュ化（bcrypt 専用プールで実行して結果を待つ）"""
+    try:
+        return password_hash_pool.run_sync(pwd_context.hash, password)
+    except HashingOverloaded:
+        raise _hashing_busy()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """平文パスワードとハッシュを照合"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """平文パスワードとハッシュを照合（bcrypt 専用プールで実行して結果を待つ）"""
+    if not hashed_password:
+        return False
+    try:
+        return password_hash_pool.run_sync(pwd_context.verify, plain_password, hashed_password)
+    except HashingOverloaded:
+        raise _hashing_busy()
+
+
+def verify_and_update_password_sync(
+    plain_password: str, hashed_password: Optional[str]
+) -> Tuple[bool, Optional[str]]:
+    """同期コード用: verify_and_update_password と同じ（結果を待つ）"""
+    if not hashed_password:
+        return False, None
+    try:
+        return password_hash_pool.run_sync(pwd_context.verify_and_update, plain_password, hashed_password)
+    except HashingOverloaded:
+        raise _hashing_busy()
+
+
+async def hash_password_async(password: str) -> str:
+    """async ルート用: 平文パスワードをハッシュ化"""
+    try:
+        return await password_hash_pool.run(pwd_context.hash, password)
+    except HashingOverloaded:
+        raise _hashing_busy()
+
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: Optional[str]
+) -> Tuple[bool, Optional[str]]:
+    """
+    async ルート用: パスワードを照合し、ハッシュが古ければ新しいハッシュも返す
+    戻り値は (一致したか, 保存し直すハッシュ or None)
+    """
+    if not hashed_password:
+        return False, None
+    try:
+        return await password_hash_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+    except HashingOverloaded:
+        raise _hashing_busy()
 
 
 # --- JWT 関連設定 ---
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """JWT アクセストークン生成"""
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": now})
     return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
 
 
+def create_user_access_token(user: models.User) -> str:
+    """ユーザーのアクセストークン生成（AUTH_TRUST_TOKEN_CLAIMS 用のクレームも載せる）"""
+    return create_access_token(data=Principal.from_user(user).claims())
+
+
+def create_refresh_token(user_id: int, family_id: Optional[str] = None) -> str:
+    """
+    JWT リフレッシュトークン生成
+    - jti: トークンごとの ID（使用済みになったら失効リストへ）
+    - fam: ローテーションで引き継ぐファミリー ID（再利用検知時はファミリーごと失効）
+    """
+    now = datetime.utcnow()
+    to_encode = {
+        "sub": str(user_id),
+        "type": "refresh",
+        "jti": uuid.uuid4().hex,
+        "fam": family_id or uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + timedelta(days=settings.JWT_REFRESH_TOKEN_EXPIRE_DAYS),
+    }
+    return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+
+
+def decode_refresh_token(token: str) -> Optional[dict]:
+    """JWT リフレッシュトークンをデコード（署名・期限・種別を確認）"""
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "refresh" or not all(k in payload for k in ("sub", "jti", "fam", "exp")):
+        return None
+    return payload
+
+
 def decode_access_token(token: str) -> Optional[dict]:
     """JWT アクセストークンをデコード"""
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         return payload
     except JWTError as e:
-        print(f"[DEBUG] JWT decode error: {e}")
+        logger.debug("JWT decode error: %s", e)
         return None
 
 
 # --- ユーザー認証関連 ---
+def get_user_by_id(db: Session, user_id: int) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.user_id == user_id).first()
+
+
+def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def get_active_user_by_id(db: Session, user_id: int) -> Optional[models.User]:
+    """退会していないユーザー（認証・トークン再発行はこちらを使う）"""
+    return (
+        db.query(models.User)
+        .filter(models.User.user_id == user_id, models.User.deleted_at.is_(None))
+        .first()
+    )
+
+
+def update_password_hash(db: Session, user_id: int, password_hash: str) -> None:
+    """ログイン成功時の再ハッシュを保存"""
+    db.query(models.User).filter(models.User.user_id == user_id).update(
+        {models.User.password_hash: password_hash}, synchronize_session=False
+    )
+    db.commit()
+    # users を書き換えたらこのプロセスのキャッシュを捨てる（他プロセスは PrincipalCacheSyncer が拾う）
+    principal_cache.invalidate_user(user_id)
+
+
+def set_user_deleted(db: Session, user_id: int, deleted: bool) -> None:
+    """退会・再登録（updated_at も DB の時刻で更新されるので、他プロセスは PrincipalCacheSyncer が拾う）"""
+    db.query(models.User).filter(models.User.user_id == user_id).update(
+        {models.User.deleted_at: func.now() if deleted else None}, synchronize_session=False
+    )
+    db.commit()
+    principal_cache.invalidate_user(user_id)
+
+
 def authenticate_user(db: Session, email: str, password: str) -> Optional[models.User]:
     """メールアドレスとパスワードでユーザー認証"""
-    user = db.query(models.User).filter(models.User.email == email).first()
-    if not user:
+    user = get_user_by_email(db, email)
+    if not user or user.deleted_at is not None:
         return None
     if not verify_password(password, user.password_hash):
         return None
     return user
 
 
+def _load_principal(db: Session, user_id: int) -> Optional[Principal]:
+    user = get_active_user_by_id(db, user_id)
+    principal = Principal.from_user(user) if user is not None else None
+    # 読み取りトランザクションを終えて接続をプールに返す
+    # （ルート側が別の runner を使うと、1リクエストで接続を2本握ったままになるため）
+    db.rollback()
+    return principal
+
+
+class PrincipalRevalidator:
+    """
+    前回以降に updated_at が変わったユーザーを users から読み、キャッシュ中のエントリと食い違えば捨てる
+    - 読むのは変わった行だけ（ix_users_updated_at）。キャッシュの大きさには比例しない
+    - 目印は DB の now()（updated_at を入れるのと同じ時計。アプリの時計は使わない）
+      commit が遅れた行を拾うため LATE_COMMIT 分さかのぼる
+    - それより遅れた commit や、updated_at を変えない直接の編集・物理削除は拾えないが、AUTH_CACHE_TTL_SECONDS で切れる
+    """
+
+    LATE_COMMIT = timedelta(seconds=5)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.since: Optional[datetime] = None
+
+    def _changed_users(self, db: Session) -> List[Tuple[int, Optional[Principal]]]:
+        """前回以降に変わったユーザー (user_id, Principal or 退会済みなら None)"""
+        users = db.query(models.User).filter(models.User.updated_at >= self.since - self.LATE_COMMIT).all()
+        # rollback で属性が失効する前に読んでおく
+        return [(u.user_id, Principal.from_user(u) if u.deleted_at is None else None) for u in users]
+
+    def __call__(self, db: Session) -> int:
+        """捨てたユーザー数を返す（初回は目印を決めるだけ）"""
+        with self._lock:
+            try:
+                now = db.scalar(select(func.now()))
+                changed = self._changed_users(db) if self.since is not None else []
+            finally:
+                db.rollback()
+            self.since = now
+            cached = set(principal_cache.user_ids())
+            changed = [(user_id, principal) for user_id, principal in changed if user_id in cached]
+            invalidated = principal_cache.revalidate(
+                [user_id for user_id, _ in changed],
+                {user_id: principal for user_id, principal in changed if principal is not None},
+            )
+        if invalidated:
+            logger.debug("principal cache revalidated", extra={"invalidated": invalidated})
+        return invalidated
+
+
+revalidate_principals = PrincipalRevalidator()
+
+
 # --- JWT Bearer 用 ---
 bearer_scheme = HTTPBearer()
 
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db: Session = Depends(get_db)
-) -> models.User:
-    """JWT から現在のユーザーを取得"""
+    db: DBRunner = Depends(get_read_db_runner)
+) -> Principal:
+    """
+    JWT から現在のユーザーを取得
+    - 検証済みトークンは principal_cache に載せ、次回からは JWT 検証も DB 参照もしない
+    - AUTH_TRUST_TOKEN_CLAIMS=true ならトークンのクレームから作り、users を引かない
+    - users はレプリカから読む。見つからなければ登録直後でレプリカが遅れているだけかもしれないので primary で確かめる
+    """
     token = credentials.credentials
-    print("=== [DEBUG] get_current_user called ===")
-    print(f"[DEBUG] Token received: {token}")
+
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
 
     payload = decode_access_token(token)
-    print(f"[DEBUG] Decoded payload: {payload}")
 
-    if payload is None:
-        print("[DEBUG] payload is None → Invalid token")
+    # リフレッシュトークンはアクセストークンとして使えない
+    if payload is None or payload.get("type") == "refresh":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
@@ -80,10 +275,8 @@ def get_current_user(
         )
 
     user_id: str = payload.get("sub")
-    print(f"[DEBUG] User ID from token (sub): {user_id}")
 
     if user_id is None:
-        print("[DEBUG] sub missing in token")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token: no sub",
@@ -93,23 +286,29 @@ def get_current_user(
     try:
         user_id_int = int(user_id)
     except ValueError:
-        print(f"[DEBUG] sub is not an int: {user_id}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token: sub not int",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = db.query(models.User).filter(models.User.user_id == user_id_int).first()
-    print(f"[DEBUG] User fetched from DB: {user}")
+    if settings.AUTH_TRUST_TOKEN_CLAIMS and not principal_cache.is_invalidated(
+        user_id_int, payload.get("iat")
+    ):
+        principal = Principal.from_claims(payload)
 
-    if user is None:
-        print(f"[DEBUG] No user found in DB with user_id={user_id_int}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    if principal is None:
+        principal = await db.run(_load_principal, user_id_int)
+        if principal is None and has_read_replica():
+            async with open_primary_runner() as primary:
+                principal = await primary.run(_load_principal, user_id_int)
 
-    print(f"[DEBUG] Authenticated user: id={user.user_id}, email={user.email}")
-    return user
+        if principal is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
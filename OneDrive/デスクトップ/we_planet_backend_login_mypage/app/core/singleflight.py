@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from app.core.metrics import registry
+
+T = TypeVar("T")
+
+SINGLEFLIGHT_CALLS = registry.counter(
+    "singleflight_calls_total", "Coalesced calls by key name (leader ran the work, follower shared its result)",
+    ("name", "role"),
+)
+
+
+class SingleFlightTimeout(TimeoutError):
+    """待っていた処理が timeout 秒以内に終わらなかった（処理自体は続き、他の待ち手には結果が返る）"""
+
+
+def _name(key: Hashable) -> str:
+    # メトリクスのラベルはキーの先頭（"leaderboard_page" など）だけにする
+    return str(key[0] if isinstance(key, tuple) and key else key)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+# ==============================
+# 同じキーの同時実行を1回にまとめる
+# ==============================
+class SingleFlight:
+    """
+    同じキーの処理が実行中なら、新しく実行せずにその結果（または例外）を待って共有する
+    - 結果はキャッシュしない（実行中の間だけまとめる。終わった後の呼び出しはもう一度実行する）
+    - 結果は全員で共有するので、ORM オブジェクトではなく値（NamedTuple / dict など）を返す処理に使う
+    - do() は async 用。処理は別タスクで動くので、待ち手がキャンセル・タイムアウトしても他の待ち手には影響しない
+    - do_sync() はスレッド用（def のルートやスレッドプール内）。イベントループのスレッドでは使わない
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # 全員がタイムアウトした後に失敗しても警告を出さない
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        task = self._tasks.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            role = "leader"
+        else:
+            role = "follower"
+        SINGLEFLIGHT_CALLS.inc(name=_name(key), role=role)
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            # shield: 待ち手のキャンセル・タイムアウトで共有の処理を止めない
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            if task.done():
+                raise  # 処理そのものが TimeoutError を出した
+            raise SingleFlightTimeout(f"{_name(key)} did not finish within {timeout}s") from None
+
+    def do_sync(self, key: Hashable, fn: Callable[..., T], *args, timeout: Optional[float] = None) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        SINGLEFLIGHT_CALLS.inc(name=_name(key), role="leader" if leader else "follower")
+
+        if leader:
+            try:
+                call.result = fn(*args)
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        timeout = self.timeout if timeout is None else timeout
+        if not call.done.wait(timeout):
+            raise SingleFlightTimeout(f"{_name(key)} did not finish within {timeout}s")
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -0,0 +1,113 @@
+"""
+既存ユーザーのロールアップ（user_stats / user_monthly_stats）を user_activity から作る
+
+    python -m app.db.backfill   # DATABASE_URL / DB_* の DB で実行（alembic upgrade の 0003 でも1回流れる）
+
+- user_stats の行が無いユーザーだけが対象。行があるユーザーは達成記録のたびに加算済みなので触らない
+- 達成が1件も無いユーザーにも 0 の行を作る（/me や達成記録で集計・バックフィルのクエリが走らないように）
+- INSERT ... SELECT を2回流すだけなので、何度流しても結果は同じ
+"""
+import argparse
+import sys
+from typing import List
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Executable
+
+from app.models.eco_mission import EcoMission
+from app.models.user import User
+from app.models.user_activity import UserActivity
+from app.models.user_stats import UserMonthlyStats, UserStats
+
+
+def month_expr(dialect: str, column):
+    """日時の列を "YYYY-MM" にする SQL 式（user_stats.month_key と同じ形）"""
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m", column)
+    if dialect == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.date_format(column, "%Y-%m")
+
+
+def _has_stats(user_id_column):
+    return select(UserStats.user_id).where(UserStats.user_id == user_id_column).exists()
+
+
+def backfill_statements(dialect: str) -> List[Executable]:
+    """
+    user_stats の行が無いユーザーのロールアップを作る INSERT ... SELECT（この順で流す）
+    月次が先（user_stats を作った後だと対象のユーザーを見分けられない）
+    """
+    month = month_expr(dialect, UserActivity.completed_at)
+    point = func.coalesce(func.sum(EcoMission.default_point), 0)
+    co2 = func.coalesce(func.sum(EcoMission.base_co2_reduction), 0)
+    activity = (
+        select()
+        .select_from(UserActivity)
+        .outerjoin(EcoMission, EcoMission.mission_id == UserActivity.mission_id)
+        .where(~_has_stats(UserActivity.user_id))
+    )
+
+    monthly = insert(UserMonthlyStats).from_select(
+        ["user_id", "month", "missions_count", "total_points", "total_co2"],
+        activity.add_columns(UserActivity.user_id, month, func.count(UserActivity.id), point, co2)
+        .where(UserActivity.completed_at.is_not(None))
+        .group_by(UserActivity.user_id, month),
+    )
+
+    totals = (
+        activity.add_columns(
+            UserActivity.user_id.label("user_id"),
+            func.count(UserActivity.id).label("missions_count"),
+            point.label("total_points"),
+            co2.label("total_co2"),
+        )
+        .group_by(UserActivity.user_id)
+        .subquery()
+    )
+    stats = insert(UserStats).from_select(
+        ["user_id", "missions_count", "total_points", "total_co2"],
+        select(
+            User.user_id,
+            func.coalesce(totals.c.missions_count, 0),
+            func.coalesce(totals.c.total_points, 0),
+            func.coalesce(totals.c.total_co2, 0),
+        )
+        .select_from(User)
+        .outerjoin(totals, totals.c.user_id == User.user_id)
+        .where(~_has_stats(User.user_id)),
+    )
+    return [monthly, stats]
+
+
+def backfill_rollups(conn: Connection) -> int:
+    """ロールアップが無いユーザーの行を作り、作った user_stats の行数を返す（commit は呼び出し側）"""
+    result = None
+    for statement in backfill_statements(conn.dialect.name):
+        result = conn.execute(statement)
+    return result.rowcount
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build missing user_stats / user_monthly_stats rows")
+    parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.core.config import settings
+    from app.core.db_url import build_database_url, sync_connect_args
+
+    url = build_database_url(settings)
+    engine = create_engine(url, connect_args=sync_connect_args(url, settings.DB_SSL_CA), poolclass=NullPool)
+    with engine.begin() as conn:
+        created = backfill_rollups(conn)
+    engine.dispose()
+
+    print(f"[backfill] created rollups for {created} user(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
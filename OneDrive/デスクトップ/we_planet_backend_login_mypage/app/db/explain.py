@@ -0,0 +1,202 @@
+"""
+よく使うクエリの実行計画チェック（インデックスが効かずにフルスキャンになっていないか）
+
+    python -m app.db.explain            # DATABASE_URL / DB_* の DB で確認
+    python -m app.db.explain --verbose  # 実行計画もすべて表示
+
+- 各クエリに EXPLAIN（SQLite は EXPLAIN QUERY PLAN）をかけ、
+  checked に挙げたテーブルを全件走査していたら失敗として終了コード 1 を返す
+- MySQL は行数が少ないとインデックスがあっても全件走査を選ぶので、
+  python -m app.db.seed で投入した DB に対して流す
+- クエリを追加・変更したら HOT_QUERIES も合わせて直す
+"""
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.engine import Connection
+
+from app.models.eco_mission import EcoMission
+from app.models.token_revocation import TokenRevocation
+from app.models.user import User
+from app.models.user_activity import UserActivity
+from app.models.user_stats import UserMonthlyStats, UserStats
+
+_SAMPLE_USER = 1
+_SAMPLE_AT = datetime(2026, 1, 15, 12, 0, 0)
+
+
+class HotQuery(NamedTuple):
+    name: str
+    build: Callable[[], object]  # SQLAlchemy の select を返す
+    checked: Tuple[str, ...]     # 全件走査してはいけないテーブル
+
+
+# ==============================
+# 対象のクエリ（アプリ側と同じ形で組み立てる）
+# ==============================
+HOT_QUERIES: Sequence[HotQuery] = (
+    HotQuery(
+        "login_by_email",  # /login, /users/register
+        lambda: select(User).where(User.email == "user1@example.com"),
+        ("users",),
+    ),
+    HotQuery(
+        "principal_sync",  # security.PrincipalRevalidator（AUTH_CACHE_SYNC_SECONDS ごと）
+        lambda: select(User).where(User.updated_at >= _SAMPLE_AT),
+        ("users",),
+    ),
+    HotQuery(
+        "activity_page",  # GET /me/activities（2ページ目以降）
+        lambda: select(UserActivity.id, UserActivity.mission_id, UserActivity.badge_id, UserActivity.completed_at)
+        .where(UserActivity.user_id == _SAMPLE_USER, UserActivity.completed_at.is_not(None))
+        .where(or_(
+            UserActivity.completed_at < _SAMPLE_AT,
+            and_(UserActivity.completed_at == _SAMPLE_AT, UserActivity.id < 1000),
+        ))
+        .order_by(UserActivity.completed_at.desc(), UserActivity.id.desc())
+        .limit(21),
+        ("user_activity",),
+    ),
+    HotQuery(
+        "activity_export",  # GET /me/activities/export
+        lambda: select(UserActivity.id, UserActivity.mission_id, UserActivity.badge_id, UserActivity.completed_at)
+        .where(UserActivity.user_id == _SAMPLE_USER, UserActivity.completed_at.is_not(None))
+        .order_by(UserActivity.completed_at, UserActivity.id),
+        ("user_activity",),
+    ),
+    HotQuery(
+        "activity_month_totals",  # user_stats._aggregate_activity（ロールアップが無いユーザーの月別集計）
+        lambda: select(
+            func.count(UserActivity.id),
+            func.coalesce(func.sum(EcoMission.default_point), 0),
+            func.coalesce(func.sum(EcoMission.base_co2_reduction), 0),
+        )
+        .select_from(UserActivity)
+        .outerjoin(EcoMission, EcoMission.mission_id == UserActivity.mission_id)
+        .where(UserActivity.user_id == _SAMPLE_USER)
+        .where(UserActivity.completed_at >= _SAMPLE_AT, UserActivity.completed_at < _SAMPLE_AT + timedelta(days=31)),
+        ("user_activity", "eco_mission"),
+    ),
+    HotQuery(
+        "completion_idempotency",  # completion._read_counter
+        lambda: select(UserStats.missions_count, UserActivity.id, UserActivity.mission_id)
+        .select_from(UserStats)
+        .outerjoin(UserActivity, and_(
+            UserActivity.user_id == UserStats.user_id,
+            UserActivity.idempotency_key == "sample-key",
+        ))
+        .where(UserStats.user_id == _SAMPLE_USER),
+        ("user_stats", "user_activity"),
+    ),
+    HotQuery(
+        "monthly_stats",  # /ecoboard/summary/me
+        lambda: select(UserMonthlyStats)
+        .where(UserMonthlyStats.user_id == _SAMPLE_USER, UserMonthlyStats.month == "2026-01"),
+        ("user_monthly_stats",),
+    ),
+    HotQuery(
+        "leaderboard_month",  # leaderboard.load_scores（月別）
+        lambda: select(UserMonthlyStats.user_id, UserMonthlyStats.total_co2)
+        .where(UserMonthlyStats.month == "2026-01"),
+        ("user_monthly_stats",),
+    ),
+    HotQuery(
+        "revocation_load",  # revocation_list.load（起動時）
+        lambda: select(TokenRevocation.token_id, TokenRevocation.revoked_at)
+        .where(TokenRevocation.expires_at > _SAMPLE_AT),
+        ("token_revocations",),
+    ),
+    HotQuery(
+        "revocation_sync",  # revocation_list.sync
+        lambda: select(TokenRevocation.token_id, TokenRevocation.revoked_at)
+        .where(TokenRevocation.revoked_at >= _SAMPLE_AT),
+        ("token_revocations",),
+    ),
+)
+
+
+# ==============================
+# EXPLAIN の実行と判定
+# ==============================
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+
+def explain(conn: Connection, statement) -> List[str]:
+    """実行計画を1行1ステップの文字列で返す"""
+    dialect = conn.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if dialect.name == "sqlite":
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        return [row[-1] for row in rows]
+    result = conn.exec_driver_sql(f"EXPLAIN {compiled}", params)
+    keys = list(result.keys())
+    return [
+        " ".join(f"{k}={v}" for k, v in zip(keys, row) if k in ("table", "type", "key", "rows", "Extra"))
+        for row in result
+    ]
+
+
+def full_scans(dialect_name: str, plan: Sequence[str]) -> List[str]:
+    """全件走査しているテーブル名（SQLite: SCAN <table> / MySQL: type=ALL）"""
+    tables = []
+    for step in plan:
+        if dialect_name == "sqlite":
+            match = _SQLITE_SCAN.match(step)
+            if match:
+                tables.append(match.group(1))
+        else:
+            fields = dict(part.split("=", 1) for part in step.split(" ") if "=" in part)
+            if fields.get("type") == "ALL":
+                tables.append(fields.get("table"))
+    return tables
+
+
+def check(conn: Connection, queries: Sequence[HotQuery] = HOT_QUERIES, out=sys.stdout,
+          verbose: bool = False) -> List[str]:
+    """各クエリを確認し、失敗したものを "name: table" の形で返す"""
+    failures = []
+    for query in queries:
+        plan = explain(conn, query.build())
+        scanned = [t for t in full_scans(conn.dialect.name, plan) if t in query.checked]
+        status = "FULL SCAN " + ", ".join(scanned) if scanned else "ok"
+        print(f"[explain] {query.name:<24} {status}", file=out)
+        if verbose or scanned:
+            for step in plan:
+                print(f"           {step}", file=out)
+        failures.extend(f"{query.name}: {table}" for table in scanned)
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check query plans of the hot queries")
+    parser.add_argument("--verbose", action="store_true", help="問題が無いクエリの実行計画も表示する")
+    args = parser.parse_args(argv)
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.core.config import settings
+    from app.core.db_url import build_database_url, sync_connect_args
+
+    url = build_database_url(settings)
+    engine = create_engine(url, connect_args=sync_connect_args(url, settings.DB_SSL_CA), poolclass=NullPool)
+    with engine.connect() as conn:
+        failures = check(conn, verbose=args.verbose)
+    engine.dispose()
+
+    if failures:
+        print(f"[explain] {len(failures)} full table scan(s): {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
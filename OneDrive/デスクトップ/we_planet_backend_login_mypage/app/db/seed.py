@@ -0,0 +1,390 @@
+"""
+合成データの一括投入（容量見積もり・負荷試験用）
+
+    python -m app.db.seed --users 1000000 --activities 100000000 --days 730 --truncate
+
+- ORM を通さず Core の executemany をチャンク単位で流す
+- MySQL では LOAD DATA LOCAL INFILE を使う（サーバー側で local_infile が無効なら executemany に切り替える）
+- user_stats / user_monthly_stats は投入後に INSERT ... SELECT で1回で作る
+- 進捗と rows/sec を標準エラーに出す
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import create_engine, delete, event, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+from app.db.backfill import backfill_rollups
+from app.models.eco_badge import EcoBadge
+from app.models.eco_mission import EcoMission
+from app.models.token_revocation import TokenRevocation
+from app.models.user import User
+from app.models.user_activity import UserActivity
+from app.models.user_stats import UserMonthlyStats, UserStats
+
+DEFAULT_PASSWORD = "password"
+BADGE_CATEGORIES = ("節電", "節水", "移動", "食事", "リサイクル")
+
+
+@dataclass
+class SeedConfig:
+    users: int = 1000
+    missions: int = 50
+    badges: int = 20
+    activities: int = 100000
+    days: int = 730                     # user_activity を散らす期間
+    user_skew: float = 1.1              # ユーザーごとの活動量の偏り（Zipf の指数、0 で一様）
+    mission_skew: float = 0.8           # ミッションの人気の偏り（同上）
+    time_distribution: str = "growth"   # "uniform" または "growth"（最近ほど多い）
+    chunk_size: int = 10000
+    method: str = "auto"                # "auto" / "executemany" / "load-data"
+    rng_seed: int = 42
+    email_prefix: str = "user"          # {email_prefix}{user_id}@example.com
+    password_hash: Optional[str] = None # 未指定なら DEFAULT_PASSWORD をハッシュする（全ユーザー共通）
+    rollups: bool = True
+    truncate: bool = False
+
+
+# ==============================
+# 進捗表示
+# ==============================
+class Progress:
+    def __init__(self, label: str, total: int, out=sys.stderr, interval: float = 1.0):
+        self.label = label
+        self.total = total
+        self.out = out
+        self.interval = interval
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_report = 0.0
+
+    def add(self, rows: int) -> None:
+        self.done += rows
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval or self.done >= self.total:
+            self._last_report = now
+            self.report()
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def report(self) -> None:
+        rate = self.rows_per_sec
+        pct = 100.0 * self.done / self.total if self.total else 100.0
+        eta = (self.total - self.done) / rate if rate else 0.0
+        print(
+            f"[seed] {self.label:<14} {self.done:>12,}/{self.total:,} ({pct:5.1f}%) "
+            f"{rate:>10,.0f} rows/s  eta {eta:6.0f}s",
+            file=self.out,
+            flush=True,
+        )
+
+
+# ==============================
+# 分布
+# ==============================
+def zipf_cum_weights(n: int, s: float) -> List[float]:
+    """順位 k の重みを 1/k^s とした累積重み（random.choices 用）"""
+    total = 0.0
+    cum = []
+    for k in range(1, n + 1):
+        total += 1.0 / (k ** s) if s > 0 else 1.0
+        cum.append(total)
+    return cum
+
+
+def _age_seconds(rng: random.Random, days: int, distribution: str) -> int:
+    u = rng.random()
+    if distribution == "growth":
+        # 密度が現在に向かって線形に増える（サービスの成長を模す）
+        u = 1.0 - math.sqrt(u)
+    return int(u * days * 86400)
+
+
+# ==============================
+# 行の生成
+# ==============================
+def mission_rows(config: SeedConfig, rng: random.Random) -> List[dict]:
+    return [
+        {
+            "mission_id": i,
+            "title": f"エコミッション {i}",
+            "description": "合成データ",
+            "base_co2_reduction": float(rng.randint(50, 2000)),
+            "default_point": rng.randint(1, 10),
+        }
+        for i in range(1, config.missions + 1)
+    ]
+
+
+def badge_rows(config: SeedConfig) -> List[dict]:
+    return [
+        {
+            "badge_id": i,
+            "badge_name": f"バッジ {i}",
+            "category_name": BADGE_CATEGORIES[(i - 1) % len(BADGE_CATEGORIES)],
+        }
+        for i in range(1, config.badges + 1)
+    ]
+
+
+def iter_user_rows(config: SeedConfig, password_hash: str) -> Iterator[dict]:
+    for i in range(1, config.users + 1):
+        yield {
+            "user_id": i,
+            "email": f"{config.email_prefix}{i}@example.com",
+            "password_hash": password_hash,
+            "auth_provider": "local",
+            "nickname": f"{config.email_prefix}{i}",
+        }
+
+
+def iter_activity_chunks(config: SeedConfig, rng: random.Random) -> Iterator[List[tuple]]:
+    """(user_id, mission_id, completed_at) をチャンクごとに返す（全件をメモリに載せない）"""
+    user_ids = range(1, config.users + 1)
+    mission_ids = range(1, config.missions + 1)
+    user_cw = zipf_cum_weights(config.users, config.user_skew)
+    mission_cw = zipf_cum_weights(config.missions, config.mission_skew)
+    # 人気順とID順が揃わないように並びを混ぜる
+    user_order = list(user_ids)
+    rng.shuffle(user_order)
+
+    now = datetime.utcnow().replace(microsecond=0)
+    remaining = config.activities
+    while remaining > 0:
+        size = min(config.chunk_size, remaining)
+        remaining -= size
+        ranks = rng.choices(range(config.users), cum_weights=user_cw, k=size)
+        missions = rng.choices(mission_ids, cum_weights=mission_cw, k=size)
+        yield [
+            (
+                user_order[rank],
+                mission_id,
+                now - timedelta(seconds=_age_seconds(rng, config.days, config.time_distribution)),
+            )
+            for rank, mission_id in zip(ranks, missions)
+        ]
+
+
+def _chunks(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    chunk: List[dict] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ==============================
+# 書き込み
+# ==============================
+def _executemany(engine, table, rows: Sequence[dict]) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(table), rows)
+
+
+def _load_data(engine, table_name: str, columns: Sequence[str], rows: Sequence[tuple]) -> None:
+    """MySQL の LOAD DATA LOCAL INFILE（CSV を一時ファイルに書いて流し込む）"""
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            for row in rows:
+                writer.writerow(
+                    v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v for v in row
+                )
+        quoted = path.replace("\\", "\\\\").replace("'", "\\'")
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                f"LOAD DATA LOCAL INFILE '{quoted}' INTO TABLE {table_name} "
+                "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                f"LINES TERMINATED BY '\\n' ({', '.join(columns)})"
+            )
+    finally:
+        os.unlink(path)
+
+
+def build_rollups(engine) -> None:
+    """user_activity から user_stats / user_monthly_stats を作り直す（達成が無いユーザーも 0 の行を作る）"""
+    with engine.begin() as conn:
+        conn.execute(delete(UserMonthlyStats))
+        conn.execute(delete(UserStats))
+        backfill_rollups(conn)
+
+
+def _truncate(engine) -> None:
+    with engine.begin() as conn:
+        for model in (TokenRevocation, UserMonthlyStats, UserStats, UserActivity, User, EcoBadge, EcoMission):
+            conn.execute(delete(model))
+
+
+def _is_empty(engine) -> bool:
+    with engine.connect() as conn:
+        return all(
+            conn.execute(select(model).limit(1)).first() is None
+            for model in (User, EcoMission, EcoBadge, UserActivity)
+        )
+
+
+def seed_database(engine, config: SeedConfig, log: Callable[[str], None] = None) -> dict:
+    """
+    合成データを投入して、テーブルごとの件数と rows/sec を返す
+    テーブルは作成済みであること（alembic / create_all）
+    """
+    log = log or (lambda msg: print(msg, file=sys.stderr, flush=True))
+    rng = random.Random(config.rng_seed)
+    dialect = engine.dialect.name
+
+    if config.truncate:
+        _truncate(engine)
+    elif not _is_empty(engine):
+        raise RuntimeError("テーブルが空ではありません（--truncate で消してから投入する）")
+
+    password_hash = config.password_hash
+    if password_hash is None:
+        from app.core.security import get_password_hash
+        password_hash = get_password_hash(DEFAULT_PASSWORD)
+
+    use_load_data = config.method == "load-data" or (config.method == "auto" and dialect == "mysql")
+    report = {}
+
+    missions = mission_rows(config, rng)
+    _executemany(engine, EcoMission, missions)
+    _executemany(engine, EcoBadge, badge_rows(config))
+
+    progress = Progress("users", config.users)
+    for chunk in _chunks(iter_user_rows(config, password_hash), config.chunk_size):
+        _executemany(engine, User, chunk)
+        progress.add(len(chunk))
+    report["users"] = {"rows": progress.done, "rows_per_sec": round(progress.rows_per_sec)}
+
+    progress = Progress("user_activity", config.activities)
+    columns = ("user_id", "mission_id", "completed_at")
+    for chunk in iter_activity_chunks(config, rng):
+        if use_load_data:
+            try:
+                _load_data(engine, UserActivity.__tablename__, columns, chunk)
+            except OperationalError as e:
+                if config.method == "load-data" or progress.done:
+                    raise
+                # サーバー/クライアントで local_infile が無効
+                log(f"[seed] LOAD DATA unavailable ({e.orig}); falling back to executemany")
+                use_load_data = False
+        if not use_load_data:
+            _executemany(engine, UserActivity, [dict(zip(columns, row)) for row in chunk])
+        progress.add(len(chunk))
+    report["user_activity"] = {
+        "rows": progress.done,
+        "rows_per_sec": round(progress.rows_per_sec),
+        "method": "load-data" if use_load_data else "executemany",
+    }
+
+    if config.rollups:
+        started = time.perf_counter()
+        build_rollups(engine)
+        report["rollups_seconds"] = round(time.perf_counter() - started, 2)
+        log(f"[seed] rollups built in {report['rollups_seconds']}s")
+
+    report["missions"] = len(missions)
+    report["badges"] = config.badges
+    return report
+
+
+def make_seed_engine(url: str, ssl_ca: Optional[str] = None):
+    """投入専用のエンジン（プールしない。MySQL は LOAD DATA LOCAL を許可、SQLite は同期書き込みを省く）"""
+    from app.core.db_url import is_sqlite, sync_connect_args
+
+    connect_args = sync_connect_args(url, ssl_ca)
+    if url.startswith("mysql"):
+        connect_args["local_infile"] = True
+    engine = create_engine(url, connect_args=connect_args, poolclass=NullPool)
+
+    if is_sqlite(url):
+        @event.listens_for(engine, "connect")
+        def _fast_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.close()
+
+    return engine
+
+
+def parse_args(argv=None) -> SeedConfig:
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser(description="WePlanet synthetic data seeder")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--missions", type=int, default=defaults.missions)
+    parser.add_argument("--badges", type=int, default=defaults.badges)
+    parser.add_argument("--activities", type=int, default=defaults.activities)
+    parser.add_argument("--days", type=int, default=defaults.days)
+    parser.add_argument("--user-skew", type=float, default=defaults.user_skew)
+    parser.add_argument("--mission-skew", type=float, default=defaults.mission_skew)
+    parser.add_argument("--time-distribution", choices=("uniform", "growth"), default=defaults.time_distribution)
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunk_size)
+    parser.add_argument("--method", choices=("auto", "executemany", "load-data"), default=defaults.method)
+    parser.add_argument("--seed", type=int, default=defaults.rng_seed)
+    parser.add_argument("--email-prefix", default=defaults.email_prefix)
+    parser.add_argument("--no-rollups", action="store_true")
+    parser.add_argument("--truncate", action="store_true", help="既存データを消してから投入する")
+    args = parser.parse_args(argv)
+    return SeedConfig(
+        users=args.users,
+        missions=args.missions,
+        badges=args.badges,
+        activities=args.activities,
+        days=args.days,
+        user_skew=args.user_skew,
+        mission_skew=args.mission_skew,
+        time_distribution=args.time_distribution,
+        chunk_size=args.chunk_size,
+        method=args.method,
+        rng_seed=args.seed,
+        email_prefix=args.email_prefix,
+        rollups=not args.no_rollups,
+        truncate=args.truncate,
+    )
+
+
+def main(argv=None) -> int:
+    config = parse_args(argv)
+
+    from app.core.config import settings
+    from app.core.database import Base
+    from app.core.db_url import build_database_url
+
+    url = build_database_url(settings)
+    engine = make_seed_engine(url, settings.DB_SSL_CA)
+    Base.metadata.create_all(bind=engine)
+
+    started = time.perf_counter()
+    try:
+        report = seed_database(engine, config)
+    except RuntimeError as e:
+        print(f"[seed] {e}", file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - started
+    total = config.users + config.activities
+    print(
+        f"[seed] done in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s overall): {report}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
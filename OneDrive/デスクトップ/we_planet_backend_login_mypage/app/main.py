@@ -1,32 +1,126 @@
 from fastapi import FastAPI, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.openapi.utils import get_openapi
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.cors import CORSMiddleware
-import traceback
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+import logging
+import time
 
-from app.core.database import engine, get_db
+from app.core.database import (
+    engine, DBRunner, get_db, get_read_db, get_db_runner, SessionLocal, ReadSessionLocal,
+    shared_read, warm_pools,
+)
+from app.core import database, profiler
+from app.core.query_budget import QueryBudgetMiddleware, query_budget, track_queries
+from app.core.singleflight import SingleFlightTimeout
+from app.core.admission import AdmissionMiddleware, admission_class
+from app.core.revocation import revocation_list
+from app.core.leaderboard import LeaderboardSyncer, leaderboards
+from app.core.metrics import MetricsMiddleware, registry as metrics_registry
+from app.core.loop_monitor import LoopStallMonitor, LoopTaskMiddleware, audit_async_routes
+from app.core.log import RequestIdMiddleware, configure_logging, shutdown_logging
 from app.models import user as models
-from app.models.eco_mission import EcoMission
-from app.models.user_activity import UserActivity
 from app.core import security
-from app.core.oauth import oauth  # Google OAuth
-from app.core.config import settings  # ← ここで settings を使う
+from app.core.principal_cache import Principal, PrincipalCacheSyncer
+from app.core import oidc
+from app.core.oauth import get_google_client  # Google OAuth（authlib は初回ログイン時に読み込む）
+from app.core.config import describe_settings, settings  # ← ここで settings を使う
 from app.schemas.user import UserLogin  # ✅ 追加
+from app.services import user_stats
 
 # Base は models 側で import
 from app.models.user import Base
 from app.models.eco_badge import EcoBadge
 
 # ✅ 各 API ルーターを import
-from app.routers import users, ecoboard, mission, badge
+from app.routers import users, ecoboard, mission, badge, token, activity
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# 起動・終了処理（lifespan）
+# import 時には DB に触らない。DB に繋がらなくても起動は続け、各キャッシュは初回参照時に読み直す
+# ==============================
+leaderboard_syncer = LeaderboardSyncer(leaderboards, ReadSessionLocal, settings.LEADERBOARD_RESYNC_SECONDS)
+# 変更・退会したユーザーをキャッシュから捨てる（読むのは変わった行だけ。レプリカの遅れで取り違えないよう primary を読む）
+principal_syncer = PrincipalCacheSyncer(security.revalidate_principals, SessionLocal, settings.AUTH_CACHE_SYNC_SECONDS)
+# provider は渡さない（use_google_provider で差し替えた発行者を取り直すため、毎回 oidc.google_oidc を見る）
+oidc_refresher = oidc.OIDCRefresher()
+loop_monitor = LoopStallMonitor(settings.LOOP_STALL_THRESHOLD_MS / 1000)
+
+def audit_routes(app: FastAPI):
+    # async def のルートで同期セッションを使うと、クエリの間イベントループ全体が止まる
+    problems = audit_async_routes(app, blocking=(get_db, get_read_db))
+    for problem in problems:
+        logger.warning("blocking DB dependency: %s", problem)
+    if problems and settings.LOOP_AUDIT_STRICT:
+        raise RuntimeError(f"{len(problems)} async route(s) depend on a sync DB session")
+
+def create_tables():
+    # スキーマは alembic で管理。ローカル開発だけ create_all を使える（DB_CREATE_ALL）
+    try:
+        models.Base.metadata.create_all(bind=engine)
+    except Exception as e:
+        logger.warning("create_all failed: %s", e.__class__.__name__)
 
-# DB のテーブル作成
-models.Base.metadata.create_all(bind=engine)
+def load_token_revocations():
+    # 失効リストを読み込んでおく（失敗しても初回リクエスト時に再読込する）
+    db = SessionLocal()
+    try:
+        revocation_list.load(db)
+    except Exception:
+        logger.warning("failed to load token revocations", exc_info=True)
+    finally:
+        db.close()
+
+def load_leaderboards():
+    # 累計ランキングを読み込む（失敗しても初回参照時に読む）
+    db = ReadSessionLocal()
+    try:
+        leaderboards.load(db)
+    except Exception:
+        logger.warning("failed to load leaderboards", exc_info=True)
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    started = time.perf_counter()
+    audit_routes(app)
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    if settings.STARTUP_LOG_SETTINGS:
+        logger.info("settings loaded: %s", describe_settings(settings))
+    if settings.DB_CREATE_ALL:
+        await run_in_threadpool(create_tables)
+    await run_in_threadpool(load_token_revocations)
+    await run_in_threadpool(load_leaderboards)
+    if settings.DB_POOL_WARMUP > 0:
+        try:
+            warmed = await warm_pools(settings.DB_POOL_WARMUP)
+            logger.info("warmed up DB pool", extra={"connections": warmed})
+        except Exception as e:
+            logger.warning("failed to warm up the DB pool: %s", e.__class__.__name__)
+    leaderboard_syncer.start()
+    principal_syncer.start()
+    # Google のメタデータはディスクのキャッシュがあれば使い、取り直しは裏で行う（起動を待たせない）
+    oidc.google_oidc.load_cache()
+    oidc_refresher.start()
+    logger.info("startup completed", extra={"elapsed_ms": round((time.perf_counter() - started) * 1000)})
+    yield
+    leaderboard_syncer.stop()
+    principal_syncer.stop()
+    oidc_refresher.stop()
+    if settings.LOOP_MONITOR_ENABLED:
+        await loop_monitor.stop()
+    shutdown_logging()
 
 # FastAPI アプリ
-app = FastAPI(title="FastAPI", version="0.1.0")
+app = FastAPI(title="FastAPI", version="0.1.0", lifespan=lifespan)
 
 # ==============================
 # Session Middleware
@@ -36,6 +130,12 @@ app.add_middleware(
     secret_key=settings.SESSION_SECRET_KEY,
 )
 
+# ==============================
+# アドミッション制御（ルートの種類ごとの同時実行数。CORS の内側に置き、503 にも CORS ヘッダーを付ける）
+# ==============================
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, router=app.router)
+
 # ==============================
 # CORS Middleware
 # ==============================
@@ -49,6 +149,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ==============================
+# Metrics Middleware（ルート別レイテンシ・SQL件数）
+# ==============================
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# ==============================
+# イベントループ監視（どのリクエストがループを止めたかを記録する）
+# ==============================
+if settings.LOOP_MONITOR_ENABLED:
+    app.add_middleware(LoopTaskMiddleware)
+
+# ==============================
+# SQL 件数のバジェット（@query_budget の上限超え・N+1 の疑いを報告する）
+# ==============================
+if settings.QUERY_BUDGET_MODE != "off":
+    track_queries({
+        "primary": database.engine, "replica": database.read_engine,
+        "async_primary": database.async_engine, "async_replica": database.async_read_engine,
+    })
+    app.add_middleware(QueryBudgetMiddleware)
+
+# ==============================
+# プロファイラ（PROFILE_SAMPLE_RATE / PROFILE_SECRET のどちらかがあるときだけ付ける）
+# ==============================
+if profiler.enabled():
+    profiler.capture_sql({
+        "primary": database.engine, "replica": database.read_engine,
+        "async_primary": database.async_engine, "async_replica": database.async_read_engine,
+    })
+    app.add_middleware(profiler.ProfilerMiddleware)
+
+# ==============================
+# 相関 ID（一番外側に置き、以降のログすべてに request_id を付ける）
+# ==============================
+app.add_middleware(RequestIdMiddleware)
+
 # ==============================
 # OpenAPI カスタマイズ
 # ==============================
@@ -84,39 +221,59 @@ app.include_router(users.router, tags=["users"])
 app.include_router(ecoboard.router, prefix="/ecoboard", tags=["ecoboard"])
 app.include_router(mission.router, prefix="/mission", tags=["mission"])
 app.include_router(badge.router, prefix="/badge", tags=["badge"])
+app.include_router(token.router, prefix="/token", tags=["auth"])
+app.include_router(activity.router, prefix="/me", tags=["activity"])
 
 # ==============================
 # エンドポイント
 # ==============================
 @app.get("/")
+@admission_class("exempt")
 def root():
     return {"message": "Hello FastAPI"}
 
 @app.get("/health")
+@admission_class("exempt")  # 過負荷中もヘルスチェックは通す
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+@admission_class("exempt")
+def metrics():
+    """Prometheus テキスト形式のメトリクス（プロセス単位）"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 # ==============================
 # ローカルログイン（修正版）
 # ==============================
 @app.post("/login")
-def login(user_in: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user_in.email).first()
-    if not db_user or not security.verify_password(user_in.password, db_user.password_hash):
+@query_budget(2)
+@admission_class("auth")
+async def login(user_in: UserLogin, db: DBRunner = Depends(get_db_runner)):
+    db_user = await db.run(security.get_user_by_email, user_in.email)
+    if db_user is not None and db_user.deleted_at is not None:
+        db_user = None  # 退会済み
+    # bcrypt は専用プールで照合し、コストが古いハッシュはここで更新する
+    valid, new_hash = await security.verify_and_update_password(
+        user_in.password, db_user.password_hash if db_user else None
+    )
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        await db.run(security.update_password_hash, db_user.user_id, new_hash)
 
-    access_token = security.create_access_token(data={"sub": str(db_user.user_id)})
-    return {"access_token": access_token, "token_type": "bearer"}
+    access_token = security.create_user_access_token(db_user)
+    refresh_token = security.create_refresh_token(db_user.user_id)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 @app.get("/me")
-def get_me(current_user: models.User = Depends(security.get_current_user), db: Session = Depends(get_db)):
-    total_points = (
-        db.query(EcoMission.default_point)
-        .join(UserActivity, UserActivity.mission_id == EcoMission.mission_id)
-        .filter(UserActivity.user_id == current_user.user_id)
-        .all()
-    )
-    points = sum([p[0] for p in total_points]) if total_points else 0
+@query_budget(2)
+async def get_me(current_user: Principal = Depends(security.get_current_user)):
+    # 累計ポイントは user_stats ロールアップから取得（同じユーザーの同時リクエストは1回の読み取りにまとめる）
+    user_id = current_user.user_id
+    points = (await shared_read(("user_totals", user_id), user_stats.get_totals, user_id)).total_points
 
     return {
         "user_id": current_user.user_id,
@@ -133,33 +290,45 @@ def get_me(current_user: models.User = Depends(security.get_current_user), db: S
 async def login_google(request: Request):
     # .env から読み込んだ redirect_uri を使う
     redirect_uri = settings.GOOGLE_REDIRECT_URI
-    return await oauth.google.authorize_redirect(request, redirect_uri)
-
-@app.get("/auth/google/callback")
-async def auth_google_callback(request: Request, db: Session = Depends(get_db)):
-    token = await oauth.google.authorize_access_token(request)
-    user_info = token.get("userinfo")
-    print("DEBUG user_info:", user_info)  # ★デバッグ追加
-    
-    if not user_info:
-        raise HTTPException(status_code=400, detail="Google login failed")
-
-    email = user_info["email"]
-    db_user = db.query(models.User).filter(models.User.email == email).first()
+    client = await get_google_client()
+    return await client.authorize_redirect(request, redirect_uri)
 
+def _get_or_create_google_user(db: Session, user_info: dict) -> models.User:
+    db_user = security.get_user_by_email(db, user_info["email"])
     if not db_user:
         db_user = models.User(
-            email=email,
+            email=user_info["email"],
+            password_hash="",  # Google ユーザーはパスワードでログインできない（空なら照合は常に失敗）
             auth_provider="google",
             provider_user_id=user_info["sub"],
             nickname=user_info.get("name"),
         )
         db.add(db_user)
+        db.flush()
+        user_stats.create_empty(db, db_user.user_id)
         db.commit()
         db.refresh(db_user)
+    elif db_user.deleted_at is not None:
+        # 退会後に Google でログインし直したら再登録
+        security.set_user_deleted(db, db_user.user_id, False)
+        db.refresh(db_user)
+    return db_user
+
+@app.get("/auth/google/callback")
+@admission_class("auth")  # ログインの枠で数える（コードの交換で外部へ出る）
+async def auth_google_callback(request: Request, db: DBRunner = Depends(get_db_runner)):
+    # ID トークンはキャッシュ済みの JWKS で検証する（外へ取りに行くのはコードの交換だけ）
+    client = await get_google_client()
+    token = await client.authorize_access_token(request)
+    user_info = token.get("userinfo")
+
+    if not user_info:
+        raise HTTPException(status_code=400, detail="Google login failed")
+
+    db_user = await db.run(_get_or_create_google_user, user_info)
 
     # JWT発行
-    access_token = security.create_access_token(data={"sub": str(db_user.user_id)})
+    access_token = security.create_user_access_token(db_user)
 
     # 開発環境は localhost:3000 へリダイレクト
     redirect_url = f"http://localhost:3000/auth/callback?token={access_token}"
@@ -168,9 +337,24 @@ async def auth_google_callback(request: Request, db: Session = Depends(get_db)):
 # ==============================
 # グローバル例外ハンドラ
 # ==============================
+@app.exception_handler(SingleFlightTimeout)
+async def singleflight_timeout_handler(request: Request, exc: SingleFlightTimeout):
+    # まとめた読み取りが詰まっている（DB が遅い）ので、待たせ続けずに再試行してもらう
+    logger.warning("shared read timed out: %s", exc, extra={"path": request.url.path})
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.exception_handler(Exception)
-async def global_exception_handler(request, exc: Exception):
-    print("".join(traceback.format_exception(type(exc), exc, exc.__traceback__)))
+async def global_exception_handler(request: Request, exc: Exception):
+    logger.error(
+        "unhandled exception", exc_info=exc,
+        extra={"method": request.method, "path": request.url.path,
+               "request_id": getattr(request.state, "request_id", None)},
+    )
     return JSONResponse(
         status_code=500,
         content={"detail": str(exc)},
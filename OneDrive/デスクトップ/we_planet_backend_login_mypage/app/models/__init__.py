@@ -2,4 +2,7 @@
 from .user import User
 from app.models.user import User
 from app.models.eco_mission import EcoMission
+from app.models.eco_badge import EcoBadge
 from app.models.user_activity import UserActivity
+from app.models.user_stats import UserStats, UserMonthlyStats
+from app.models.token_revocation import TokenRevocation
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, func
+from app.core.database import Base
+
+
+class TokenRevocation(Base):
+    """失効したリフレッシュトークン（kind="token"）とトークンファミリー（kind="family"）"""
+    __tablename__ = "token_revocations"
+
+    token_id = Column(String(32), primary_key=True)   # jti またはファミリーID
+    kind = Column(String(10), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # これ以降は JWT 自体が期限切れ
+    revoked_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Column, Integer, String, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # PrincipalCacheSyncer が前回以降に変わったユーザーだけを引く
+        Index("ix_users_updated_at", "updated_at"),
+    )
 
     user_id = Column(Integer, primary_key=True, index=True, autoincrement=True)  # ✅ id → user_id
     email = Column(String(255), unique=True, nullable=False)
@@ -17,6 +21,8 @@ class User(Base):
     # ✅ 追加: 作成日時・更新日時
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    # 退会日時（NULL なら有効）。退会済みのユーザーは認証・ログイン・トークン再発行を通さない
+    deleted_at = Column(DateTime, nullable=True)
 
-    # リレーション
-    activities = relationship("UserActivity", back_populates="user")
+    # リレーション（暗黙の遅延ロードは N+1 になるので禁止。読むときは selectinload などで明示する）
+    activities = relationship("UserActivity", back_populates="user", lazy="raise")
@@ -1,15 +1,22 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, func
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
 
 class UserActivity(Base):
     __tablename__ = "user_activity"
+    __table_args__ = (
+        # 同じキーでの再送は1件として扱う（NULL は制約の対象外）
+        UniqueConstraint("user_id", "idempotency_key", name="uq_user_activity_idempotency_key"),
+        # 履歴のページング・月別集計・バックフィル（user_id で絞って completed_at 順 / 範囲）
+        Index("ix_user_activity_user_completed", "user_id", "completed_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)  # ✅ 外部キー追加
     mission_id = Column(Integer, nullable=True)
     completed_at = Column(DateTime, server_default=func.now())
     badge_id = Column(Integer, ForeignKey("eco_badge.badge_id"), nullable=True)
+    idempotency_key = Column(String(64), nullable=True)  # クライアントが付ける Idempotency-Key
 
-    user = relationship("User", back_populates="activities")
+    user = relationship("User", back_populates="activities", lazy="raise")  # 暗黙の遅延ロードは禁止
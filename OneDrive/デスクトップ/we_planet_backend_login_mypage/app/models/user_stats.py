@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Index, func
+from app.core.database import Base
+
+
+class UserStats(Base):
+    """ユーザーごとの累計（complete_mission で加算していくロールアップ）"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    missions_count = Column(Integer, nullable=False, default=0)   # 達成ミッション数
+    total_points = Column(Integer, nullable=False, default=0)     # 獲得ポイント合計
+    total_co2 = Column(Float, nullable=False, default=0)          # CO2削減量合計(g)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class UserMonthlyStats(Base):
+    """ユーザー×月ごとの集計（month は "YYYY-MM"）"""
+    __tablename__ = "user_monthly_stats"
+    __table_args__ = (
+        # 月別ランキングの読み込み（month だけで絞る）
+        Index("ix_user_monthly_stats_month", "month"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    month = Column(String(7), primary_key=True)
+    missions_count = Column(Integer, nullable=False, default=0)
+    total_points = Column(Integer, nullable=False, default=0)
+    total_co2 = Column(Float, nullable=False, default=0)
@@ -0,0 +1,182 @@
+import base64
+import csv
+import io
+import json
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.admission import admission_class
+from app.core.catalog import MissionEntry, mission_catalog
+from app.core.config import settings
+from app.core.database import DBRunner, ReadSessionLocal, get_read_db_runner
+from app.core.query_budget import query_budget
+from app.core.principal_cache import Principal
+from app.core.security import get_current_user
+from app.models.user_activity import UserActivity
+
+router = APIRouter()
+
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_FIELDS = ("id", "mission_id", "title", "point", "co2", "badge_id", "completed_at")
+
+
+# ==============================
+# カーソル（(completed_at, id) を URL に載せられる形にする）
+# ==============================
+def encode_cursor(completed_at: datetime, activity_id: int) -> str:
+    raw = json.dumps([completed_at.isoformat(), activity_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        completed_at, activity_id = json.loads(raw)
+        return datetime.fromisoformat(completed_at), int(activity_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _row_dict(missions: Dict[int, MissionEntry], activity_id, mission_id, badge_id, completed_at) -> dict:
+    mission = missions.get(mission_id) if mission_id is not None else None
+    return {
+        "id": activity_id,
+        "mission_id": mission_id,
+        "title": mission.title if mission else None,
+        "point": mission.default_point if mission else None,
+        "co2": mission.base_co2_reduction if mission else None,
+        "badge_id": badge_id,
+        "completed_at": completed_at.isoformat() if completed_at else None,
+    }
+
+
+def _completed_activities(user_id: int):
+    """一覧とエクスポートで共通の対象（completed_at の無い行は (completed_at, id) の順に並べられないので除く）"""
+    return (
+        select(UserActivity.id, UserActivity.mission_id, UserActivity.badge_id, UserActivity.completed_at)
+        .where(UserActivity.user_id == user_id, UserActivity.completed_at.is_not(None))
+    )
+
+
+# ==============================
+# 履歴一覧（キーセットページング）
+# ==============================
+def _list_activities(db: Session, user_id: int, cursor: Optional[str], limit: int):
+    missions = mission_catalog.by_id(db)
+    query = (
+        _completed_activities(user_id)
+        .order_by(UserActivity.completed_at.desc(), UserActivity.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        # (completed_at, id) が前ページの最後より小さいもの（OFFSET を使わないので深いページでも遅くならない）
+        after_at, after_id = decode_cursor(cursor)
+        query = query.where(or_(
+            UserActivity.completed_at < after_at,
+            and_(UserActivity.completed_at == after_at, UserActivity.id < after_id),
+        ))
+    rows = db.execute(query).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [_row_dict(missions, *row) for row in rows],
+        "next_cursor": encode_cursor(rows[-1].completed_at, rows[-1].id) if has_more else None,
+    }
+
+
+@router.get("/activities")
+@query_budget(3)
+async def list_my_activities(
+    cursor: Optional[str] = Query(None, description="前のレスポンスの next_cursor"),
+    limit: int = Query(20, ge=1, le=settings.ACTIVITY_PAGE_MAX),
+    db: DBRunner = Depends(get_read_db_runner),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    ミッション達成履歴（新しい順）
+    - next_cursor を cursor に渡すと続きを返す（最後のページでは null）
+    """
+    return await db.run(_list_activities, current_user.user_id, cursor, limit)
+
+
+# ==============================
+# 全件エクスポート（ストリーミング）
+# ==============================
+def _iter_export_rows(user_id: int) -> Iterator[list]:
+    """
+    サーバーサイドカーソルで EXPORT_CHUNK_ROWS 件ずつ読む（履歴の長さに関わらずメモリは一定）
+    レスポンスを返し終わるまで接続を握るので、リクエストの DB セッションとは別に開く
+    ミッションのカタログは読み始める前に取っておく（ストリーム中に同じセッションで再読込の SELECT を流さない）
+    途中で close() されても（クライアントの切断）カーソルとセッションを閉じて接続をプールに返す
+    """
+    db = ReadSessionLocal()
+    try:
+        missions = mission_catalog.by_id(db)
+        result = db.execute(
+            _completed_activities(user_id)
+            .order_by(UserActivity.completed_at, UserActivity.id)
+            .execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS)
+        )
+        try:
+            for partition in result.partitions():
+                yield [_row_dict(missions, *row) for row in partition]
+        finally:
+            result.close()
+    finally:
+        db.close()
+
+
+def _ndjson_chunks(user_id: int) -> Iterator[bytes]:
+    # closing: 外側が close() されたら内側のジェネレーターもその場で閉じる（GC 任せにしない）
+    with closing(_iter_export_rows(user_id)) as batches:
+        for rows in batches:
+            yield "".join(
+                json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in rows
+            ).encode("utf-8")
+
+
+def _csv_chunks(user_id: int) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    yield buffer.getvalue().encode("utf-8")
+    with closing(_iter_export_rows(user_id)) as batches:
+        for rows in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+
+
+@router.get("/activities/export")
+@query_budget(3)
+@admission_class("export")  # 長く続くストリームで read の枠を埋めない
+async def export_my_activities(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    ミッション達成履歴の全件エクスポート（データポータビリティ用）
+    - NDJSON（1行1件）または CSV をストリーミングで返す
+    - 途中で切断されても、レスポンスの後処理でストリームを閉じて DB セッションを返す
+    """
+    if format == "csv":
+        chunks, media_type = _csv_chunks(current_user.user_id), "text/csv; charset=utf-8"
+    else:
+        chunks, media_type = _ndjson_chunks(current_user.user_id), "application/x-ndjson"
+    filename = f"weplanet-activities-{current_user.user_id}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        # Starlette は切断時に body_iterator を閉じないので、後処理（切断時も走る）で閉じる
+        background=BackgroundTask(chunks.close),
+    )
@@ -1,47 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.models.user import User
-from app.models.eco_badge import EcoBadge
-from app.models.user_activity import UserActivity
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from app.core.database import shared_read
+from app.core.query_budget import query_budget
+from app.core.principal_cache import Principal
 from app.core.security import get_current_user
+from app.core.catalog import badge_catalog, etag_matches
+from app.services import user_stats
 
 router = APIRouter()
 
 @router.get("/badges")
-def get_all_badges(db: Session = Depends(get_db)):
+@query_budget(1)
+async def get_all_badges(request: Request):
     """
     バッジマスターデータをすべて返す（加工せずそのまま）
+    - バッジカタログのシリアライズ済み JSON を返す
+    - If-None-Match が ETag と一致すれば 304（DBアクセスなし）
+    - カタログが温まっていればそのまま使い、読み込みが要るときだけ同時リクエストで1回にまとめる
     """
-    badges = db.query(EcoBadge).order_by(EcoBadge.badge_id).all()
-    return [
-        {
-            "badge_id": b.badge_id,
-            "badge_name": b.badge_name,
-            "description": b.description,
-            "category_name": b.category_name,
-            "badge_image": b.badge_image,
-            "unlock_order": b.badge_id
-        }
-        for b in badges
-    ]
+    snapshot = badge_catalog.peek()
+    if snapshot is None:
+        snapshot = await shared_read(("badge_catalog",), badge_catalog.snapshot)
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 
 @router.get("/user-progress/me")
-def get_user_progress_me(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@query_budget(2)
+async def get_user_progress_me(
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     ログインユーザーの進捗状況を返す
-    - current_badge_count = UserActivity のレコード数
+    - current_badge_count = UserActivity のレコード数（user_stats ロールアップから取得）
     - total_points, total_co2_reduction は今回は不要なので 0 固定
     """
     user_id = current_user.user_id
 
-    mission_count = db.query(UserActivity).filter(
-        UserActivity.user_id == user_id
-    ).count()
+    mission_count = (await shared_read(("user_totals", user_id), user_stats.get_totals, user_id)).missions_count
 
     return {
         "current_badge_count": mission_count,
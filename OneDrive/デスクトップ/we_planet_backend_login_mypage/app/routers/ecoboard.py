@@ -1,20 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import shared_read
+from app.core.query_budget import query_budget
+from app.core.leaderboard import ALL_TIME, leaderboards
 from app.models.user import User
-from app.models.eco_mission import EcoMission
-from app.models.user_activity import UserActivity
+from app.core.principal_cache import Principal
 from app.core.security import get_current_user
+from app.services import user_stats
 
 router = APIRouter()
 
 @router.get("/summary/me")
-def get_ecoboard_summary(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user) 
+@query_budget(2)
+async def get_ecoboard_summary(
+    current_user: Principal = Depends(get_current_user) 
 ):
     """
     ログインユーザーの今月のCO2削減量を返す
@@ -24,21 +29,11 @@ def get_ecoboard_summary(
     """
     user_id = current_user.user_id
 
-    # 今月の開始日
     now = datetime.now()
-    month_start = datetime(now.year, now.month, 1)
-
-    # user_activity × eco_mission JOINで合計値を取得
-    result = (
-        db.query(
-            func.sum(EcoMission.base_co2_reduction).label("total_co2"),
-            func.count(UserActivity.id).label("missions_count"),
-        )
-        .join(EcoMission, EcoMission.mission_id == UserActivity.mission_id)
-        .filter(UserActivity.user_id == user_id)
-        .filter(UserActivity.completed_at >= month_start)
-        .first()
-    )
+    month = user_stats.month_key(now)
+
+    # user_monthly_stats ロールアップから今月の集計を取得（同じユーザーの同時リクエストは1回の読み取りにまとめる）
+    result = await shared_read(("monthly_stats", user_id, month), user_stats.get_month, user_id, month)
 
     total_co2 = result.total_co2 or 0
     missions_count = result.missions_count or 0
@@ -52,3 +47,74 @@ def get_ecoboard_summary(
         "co2_g": int(total_co2),
         "missions_done": int(missions_count),
     }
+
+
+# ==============================
+# ランキング
+# ==============================
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+
+
+def _leaderboard_page(db: Session, metric: str, period: str, offset: int, limit: int):
+    board = leaderboards.get(db, metric, period)
+    entries = board.page(offset, limit)
+    # 表示名はページ分だけ引く（1クエリ）
+    nicknames = dict(db.execute(
+        select(User.user_id, User.nickname).where(User.user_id.in_([e.user_id for e in entries]))
+    ).all()) if entries else {}
+    return {
+        "metric": metric,
+        "period": period,
+        "total": len(board),
+        "offset": offset,
+        "entries": [
+            {"rank": e.rank, "user_id": e.user_id, "nickname": nicknames.get(e.user_id), "score": e.score}
+            for e in entries
+        ],
+    }
+
+
+def _my_rank(db: Session, metric: str, period: str, user_id: int):
+    board = leaderboards.get(db, metric, period)
+    entry = board.rank(user_id)
+    return {
+        "metric": metric,
+        "period": period,
+        "total": len(board),
+        "rank": entry.rank if entry else None,
+        "score": entry.score if entry else 0,
+    }
+
+
+@router.get("/leaderboard")
+@query_budget(3)  # 認証 + ランキングの読み込み + 表示名
+async def get_leaderboard(
+    metric: str = Query("co2", pattern="^(co2|points)$"),
+    month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="YYYY-MM（省略で累計）"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=settings.LEADERBOARD_PAGE_MAX),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    CO2削減量 / ポイントのランキング（累計または月別）
+    - プロセス内のランキングから返すので集計クエリは走らない
+    - 結果はユーザーによらないので、同じページの同時リクエストは1回の読み取りにまとめる
+    """
+    period = month or ALL_TIME
+    return await shared_read(
+        ("leaderboard_page", metric, period, offset, limit), _leaderboard_page, metric, period, offset, limit
+    )
+
+
+@router.get("/leaderboard/me")
+@query_budget(2)
+async def get_my_rank(
+    metric: str = Query("co2", pattern="^(co2|points)$"),
+    month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="YYYY-MM（省略で累計）"),
+    current_user: Principal = Depends(get_current_user),
+):
+    """ログインユーザーの順位（まだ達成が無ければ rank は null）"""
+    period = month or ALL_TIME
+    return await shared_read(
+        ("leaderboard_rank", metric, period, current_user.user_id), _my_rank, metric, period, current_user.user_id
+    )
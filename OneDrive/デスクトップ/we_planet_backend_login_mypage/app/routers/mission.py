@@ -1,95 +1,118 @@
 # app/routers/mission.py
-from fastapi import APIRouter, Depends, HTTPException
+import random
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.core.database import get_db
-from app.models.eco_mission import EcoMission
-from app.models.user_activity import UserActivity
-from app.models.user import User
-from app.models.eco_badge import EcoBadge
+from app.core.database import DBRunner, get_db_runner, shared_read
+from app.core.query_budget import query_budget
+from app.core.principal_cache import Principal
 from app.core.security import get_current_user
-from datetime import datetime
-import random
+from app.core.catalog import mission_catalog
+from app.schemas.mission import MissionCompletionBatch, MissionCompletionBatchResponse
+from app.services import completion
 
 router = APIRouter()
 
+def _completion_body(result: completion.CompletionResult) -> dict:
+    badge = result.badge
+    return {
+        "message": "Mission completed",
+        "mission_id": result.mission_id,
+        "point": result.point,
+        "co2": result.co2,
+        "badge": {
+            "id": badge.badge_id,
+            "name": badge.badge_name,
+            "image": badge.badge_image,
+        } if badge else None
+    }
+
+
+def _complete_mission(db: Session, user_id: int, mission_id: int, idempotency_key: Optional[str]):
+    try:
+        return completion.complete_mission(db, user_id, mission_id, idempotency_key)
+    except completion.MissionNotFound:
+        raise HTTPException(status_code=404, detail="Mission not found")
+    except completion.IdempotencyKeyReused:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was used for another mission")
+
+
 @router.get("/today")
-def get_today_mission(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@query_budget(2)
+async def get_today_mission(
+    current_user: Principal = Depends(get_current_user)
 ):
     """
-    今日のミッションをランダムで1つ返す
+    今日のミッションをランダムで1つ返す（ミッションカタログから選ぶのでDBは読まない）
+    - カタログが温まっていればそのまま使い、読み込みが要るときだけ同時リクエストで1回にまとめる
     """
-    missions = db.query(EcoMission).all()
+    snapshot = mission_catalog.peek()
+    if snapshot is not None:
+        missions = snapshot.missions
+    else:
+        missions = await shared_read(("mission_catalog",), mission_catalog.missions)
     if not missions:
         raise HTTPException(status_code=404, detail="No missions found")
 
-    mission = random.choice(missions)
+    return random.choice(missions)._asdict()
 
+def _complete_batch(db: Session, user_id: int, body: MissionCompletionBatch):
+    items = [
+        completion.BatchItem(item.mission_id, item.completed_at, item.idempotency_key)
+        for item in body.items
+    ]
+    results = completion.complete_missions(db, user_id, items)
     return {
-        "mission_id": mission.mission_id,
-        "title": mission.title,
-        "description": mission.description,
-        "base_co2_reduction": mission.base_co2_reduction,
-        "default_point": mission.default_point,
+        "created": sum(1 for r in results if r.status == "created"),
+        "results": [
+            {
+                "index": r.index,
+                "mission_id": r.mission_id,
+                "status": r.status,
+                **({
+                    "point": r.result.point,
+                    "co2": r.result.co2,
+                    "completed_at": r.result.completed_at,
+                    "badge": _completion_body(r.result)["badge"],
+                } if r.result else {}),
+            }
+            for r in results
+        ],
     }
 
+
+# /complete/{mission_id} より先に登録する（"batch" が mission_id として解釈されないように）
+@router.post("/complete/batch", response_model=MissionCompletionBatchResponse)
+@query_budget(11)  # 認証 + カタログ2つ + 行ロック・件数 + 再送の確認 + user_stats / 月次（月の数によらず3回）+ INSERT
+async def complete_missions_batch(
+    body: MissionCompletionBatch,
+    db: DBRunner = Depends(get_db_runner),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    オフライン中に溜めたミッション達成をまとめて記録する
+    - 1トランザクション・1回の INSERT で記録し、バッジは completed_at の順に付与する
+    - 結果は items と同じ順（記録済みの idempotency_key は replayed）
+    """
+    return await db.run(_complete_batch, current_user.user_id, body)
+
+
 @router.post("/complete/{mission_id}")
-def complete_mission(
+@query_budget(8)  # 認証 + カタログ2つの再読込 + user_stats / 月次の加算（月初は INSERT も）+ 件数 + INSERT
+async def complete_mission(
     mission_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user) ,
+    response: Response,
+    db: DBRunner = Depends(get_db_runner),
+    current_user: Principal = Depends(get_current_user) ,
+    idempotency_key: Optional[str] = Header(None, max_length=64),
 ):
 
     """
     ミッション完了を記録し、ポイント・削減量・バッジを返す
+    - Idempotency-Key ヘッダーを付けた再送は二重に記録せず、前回と同じ結果を返す
     """
-    user = current_user
-
-    mission = db.query(EcoMission).filter(EcoMission.mission_id == mission_id).first()
-    if not mission:
-        raise HTTPException(status_code=404, detail="Mission not found")
-
-    # ✅ ユーザーの達成済みミッション数をカウント
-    completed_count = db.query(UserActivity).filter(
-        UserActivity.user_id == user.user_id
-    ).count()
-
-    # eco_badge の最大 badge_id を取得
-    max_badge_id = db.query(func.max(EcoBadge.badge_id)).scalar()
-
-    badge = None
-    if completed_count == 0:
-        # ✅ 1回目の達成時は必ず badge_id=1 を付与
-        badge = db.query(EcoBadge).filter(EcoBadge.badge_id == 1).first()
-    else:
-        # ✅ 2回目以降は達成数+1のバッジを付与
-        next_badge_id = completed_count + 1
-        if next_badge_id <= max_badge_id:
-            badge = db.query(EcoBadge).filter(EcoBadge.badge_id == next_badge_id).first()
-
-    # user_activity に記録
-    activity = UserActivity(
-        user_id=user.user_id,
-        mission_id=mission.mission_id,
-        completed_at=datetime.now(),
-        badge_id=badge.badge_id if badge else None
-    )
-    db.add(activity)
-    db.commit()
-
-    # ✅ デバッグログ
-    print(f"[DEBUG] user_id={user.user_id}, completed_count={completed_count}, badge_id={(badge.badge_id if badge else None)}")
-
-    return {
-        "message": "Mission completed",
-        "mission_id": mission_id,
-        "point": mission.default_point,
-        "co2": mission.base_co2_reduction,
-        "badge": {
-            "id": badge.badge_id if badge else None,
-            "name": badge.badge_name if badge else None,
-            "image": badge.badge_image if badge else None,
-        } if badge else None
-    }
+    result = await db.run(_complete_mission, current_user.user_id, mission_id, idempotency_key)
+    if result.replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return _completion_body(result)
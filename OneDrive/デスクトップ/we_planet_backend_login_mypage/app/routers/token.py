@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.core import security
+from app.core.config import settings
+from app.core.database import DBRunner, get_db_runner
+from app.core.query_budget import query_budget
+from app.core.revocation import revocation_list
+from app.schemas.auth import RefreshRequest, TokenResponse
+
+router = APIRouter()
+
+
+def _invalid_refresh_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _family_expires_at() -> datetime:
+    # ファミリーの最後のトークンが切れるまで失効を保持する
+    return datetime.utcnow() + timedelta(days=settings.JWT_REFRESH_TOKEN_EXPIRE_DAYS)
+
+
+def _refresh(db: Session, claims: dict):
+    user_id = int(claims["sub"])
+    jti, family_id = claims["jti"], claims["fam"]
+
+    # 失効していないトークンはブルームフィルタだけで判定（DB は見ない）
+    revocation_list.sync(db)
+    if revocation_list.might_be_revoked(family_id) and revocation_list.is_revoked(db, family_id):
+        raise _invalid_refresh_token()
+
+    # 使用済みにする。既に使用済み（主キー衝突）なら再利用
+    reused = revocation_list.might_be_revoked(jti) and revocation_list.is_revoked(db, jti)
+    if reused or not revocation_list.revoke(
+        db, jti, "token", user_id, datetime.utcfromtimestamp(claims["exp"])
+    ):
+        # 盗用の可能性があるのでファミリーごと失効させる
+        revocation_list.revoke(db, family_id, "family", user_id, _family_expires_at())
+        db.commit()
+        raise _invalid_refresh_token()
+
+    user = security.get_active_user_by_id(db, user_id)  # 退会済みなら再発行しない
+    if user is None:
+        db.rollback()
+        raise _invalid_refresh_token()
+    db.commit()
+
+    return {
+        "access_token": security.create_user_access_token(user),
+        "token_type": "bearer",
+        "refresh_token": security.create_refresh_token(user_id, family_id),
+    }
+
+
+def _revoke(db: Session, claims: dict):
+    revocation_list.revoke(db, claims["fam"], "family", int(claims["sub"]), _family_expires_at())
+    db.commit()
+    return {"message": "Refresh token revoked"}
+
+
+# ==============================
+# アクセストークン再発行（bcrypt を使わない）
+# ==============================
+@router.post("/refresh", response_model=TokenResponse)
+@query_budget(5)
+async def refresh_access_token(body: RefreshRequest, db: DBRunner = Depends(get_db_runner)):
+    """
+    リフレッシュトークンから新しいアクセストークンを発行する
+    - リフレッシュトークンはローテーション（使えるのは1回だけ）
+    """
+    claims = security.decode_refresh_token(body.refresh_token)
+    if claims is None:
+        raise _invalid_refresh_token()
+    return await db.run(_refresh, claims)
+
+
+# ==============================
+# ログアウト（リフレッシュトークン失効）
+# ==============================
+@router.post("/revoke")
+@query_budget(1)
+async def revoke_refresh_token(body: RefreshRequest, db: DBRunner = Depends(get_db_runner)):
+    """リフレッシュトークンをファミリーごと失効させる"""
+    claims = security.decode_refresh_token(body.refresh_token)
+    if claims is None:
+        raise _invalid_refresh_token()
+    return await db.run(_revoke, claims)
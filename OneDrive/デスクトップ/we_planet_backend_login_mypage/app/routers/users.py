@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from datetime import datetime
 
-from app.core.database import get_db
+from app.core.admission import admission_class
+from app.core.database import DBRunner, get_db_runner
+from app.core.query_budget import query_budget
 from app import models
-from app.core.security import get_password_hash
+from app.core.principal_cache import Principal
+from app.core.security import get_current_user, get_user_by_email, hash_password_async, set_user_deleted
 from app.schemas.user import GoogleUserCreate, LocalUserCreate, UserResponse
+from app.services import user_stats
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -13,42 +16,48 @@ router = APIRouter(prefix="/users", tags=["users"])
 # -----------------------------
 # Googleログイン用: 新規作成 or 既存取得
 # -----------------------------
-@router.post("", response_model=UserResponse)   # ← /users に対応
-@router.post("/", response_model=UserResponse)  # ← /users/ に対応
-def create_or_get_user(
-    user_in: GoogleUserCreate,
-    db: Session = Depends(get_db)
-):
+def _create_or_get_user(db: Session, user_in: GoogleUserCreate):
     user = db.query(models.User).filter(models.User.email == user_in.email).first()
 
     if user:
+        if user.deleted_at is not None:
+            # 退会済みなら再登録
+            set_user_deleted(db, user.user_id, False)
+            return {"message": "User re-activated", "user_id": user.user_id}
         # 既存ユーザーがいればそのまま返す
         return {"message": "User already exists", "user_id": user.user_id}
 
     # 新規作成
     new_user = models.User(
         email=user_in.email,
+        password_hash="",  # Google ユーザーはパスワードでログインできない（空なら照合は常に失敗）
         nickname=user_in.name,
         auth_provider=user_in.provider,
         provider_user_id=user_in.provider_id,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow(),
     )
     db.add(new_user)
+    db.flush()  # user_id を確定させる（commit 後に refresh で読み直さない）
+    user_id = new_user.user_id
+    user_stats.create_empty(db, user_id)
     db.commit()
-    db.refresh(new_user)
 
-    return {"message": "User created", "user_id": new_user.user_id}
+    return {"message": "User created", "user_id": user_id}
+
+
+@router.post("", response_model=UserResponse)   # ← /users に対応
+@router.post("/", response_model=UserResponse)  # ← /users/ に対応
+@query_budget(3)
+async def create_or_get_user(
+    user_in: GoogleUserCreate,
+    db: DBRunner = Depends(get_db_runner)
+):
+    return await db.run(_create_or_get_user, user_in)
 
 
 # -----------------------------
 # ローカル登録用
 # -----------------------------
-@router.post("/register", response_model=UserResponse)
-def register_local_user(
-    user_in: LocalUserCreate,
-    db: Session = Depends(get_db)
-):
+def _register_local_user(db: Session, user_in: LocalUserCreate, password_hash: str):
     user = db.query(models.User).filter(models.User.email == user_in.email).first()
 
     if user:
@@ -57,14 +66,44 @@ def register_local_user(
     # 新規作成
     new_user = models.User(
         email=user_in.email,
-        password_hash=get_password_hash(user_in.password),
+        password_hash=password_hash,
         nickname=user_in.nickname,
         auth_provider="local",
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow(),
     )
     db.add(new_user)
+    db.flush()  # user_id を確定させる（commit 後に refresh で読み直さない）
+    user_id = new_user.user_id
+    user_stats.create_empty(db, user_id)
     db.commit()
-    db.refresh(new_user)
 
-    return {"message": "Local user created", "user_id": new_user.user_id}
+    return {"message": "Local user created", "user_id": user_id}
+
+
+@router.post("/register", response_model=UserResponse)
+@query_budget(4)  # 登録済みか（bcrypt の前と後）+ users / user_stats の INSERT
+@admission_class("auth")
+async def register_local_user(
+    user_in: LocalUserCreate,
+    db: DBRunner = Depends(get_db_runner)
+):
+    if await db.run(get_user_by_email, user_in.email):
+        raise HTTPException(status_code=400, detail="User already exists")
+
+    # bcrypt は専用プールで計算する（混雑時は 503）
+    password_hash = await hash_password_async(user_in.password)
+    return await db.run(_register_local_user, user_in, password_hash)
+
+
+
+# -----------------------------
+# 退会
+# -----------------------------
+@router.delete("/me")
+@query_budget(2)  # users の読み込み（キャッシュが冷えているとき）+ UPDATE
+async def delete_me(
+    current_user: Principal = Depends(get_current_user),
+    db: DBRunner = Depends(get_db_runner)
+):
+    """退会: deleted_at に現在時刻を入れる（発行済みのトークンはこのプロセスではすぐ、他プロセスでも同期の間隔で使えなくなる）"""
+    await db.run(set_user_deleted, current_user.user_id, True)
+    return {"message": "User deleted", "user_id": current_user.user_id}
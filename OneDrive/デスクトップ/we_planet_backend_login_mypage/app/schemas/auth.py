@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 class LoginRequest(BaseModel):
@@ -7,3 +8,7 @@ class LoginRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
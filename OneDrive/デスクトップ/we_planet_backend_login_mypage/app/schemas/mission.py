@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+
+
+# -----------------------------
+# オフライン中に溜めた達成の一括送信
+# -----------------------------
+class MissionCompletionItem(BaseModel):
+    mission_id: int
+    completed_at: Optional[datetime] = None   # 未指定ならサーバー時刻
+    idempotency_key: Optional[str] = Field(None, max_length=64)
+
+
+class MissionCompletionBatch(BaseModel):
+    items: List[MissionCompletionItem] = Field(
+        ..., min_length=1, max_length=settings.MISSION_BATCH_MAX_ITEMS
+    )
+
+
+class BadgeInfo(BaseModel):
+    id: int
+    name: str
+    image: Optional[str] = None
+
+
+class MissionCompletionItemResult(BaseModel):
+    index: int                  # リクエストの items での位置
+    mission_id: int
+    status: str                 # created / replayed / not_found / conflict
+    point: Optional[int] = None
+    co2: Optional[float] = None
+    completed_at: Optional[datetime] = None
+    badge: Optional[BadgeInfo] = None
+
+
+class MissionCompletionBatchResponse(BaseModel):
+    created: int
+    results: List[MissionCompletionItemResult]
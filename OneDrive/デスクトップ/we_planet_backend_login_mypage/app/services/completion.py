@@ -0,0 +1,277 @@
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import and_, insert, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from app.core.catalog import BadgeEntry, MissionEntry, badge_catalog, mission_catalog
+from app.core.leaderboard import leaderboards
+from app.models.user_activity import UserActivity
+from app.models.user_stats import UserStats
+from app.services import user_stats
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAX_ATTEMPTS = 3
+# MySQL のデッドロック（1213）とロック待ちタイムアウト（1205）。トランザクションごとやり直せば通る
+RETRYABLE_MYSQL_ERRORS = (1213, 1205)
+
+
+class MissionNotFound(LookupError):
+    pass
+
+
+class IdempotencyKeyReused(ValueError):
+    """同じ Idempotency-Key が別のミッションに使われた"""
+
+
+class CompletionResult(NamedTuple):
+    mission_id: int
+    point: int
+    co2: Optional[float]
+    badge: Optional[BadgeEntry]
+    completed_at: datetime
+    replayed: bool  # 同じ Idempotency-Key の再送（新しくは記録していない）
+
+
+def _result(db: Session, mission: Optional[MissionEntry], mission_id: int, badge_id: Optional[int],
+            completed_at: datetime, replayed: bool) -> CompletionResult:
+    return CompletionResult(
+        mission_id=mission_id,
+        point=mission.default_point if mission else 0,
+        co2=mission.base_co2_reduction if mission else None,
+        badge=badge_catalog.get(db, badge_id) if badge_id is not None else None,
+        completed_at=completed_at,
+        replayed=replayed,
+    )
+
+
+def _read_counter(db: Session, user_id: int, idempotency_key: Optional[str]):
+    """
+    加算後の達成数と、同じキーで記録済みの達成を1回の SELECT で読む
+    （record_completions の UPDATE で行ロック済みなので、他の達成処理と競合しない）
+    """
+    if idempotency_key is None:
+        count = db.execute(
+            select(UserStats.missions_count).where(UserStats.user_id == user_id)
+        ).scalar_one()
+        return count, None
+    row = db.execute(
+        select(
+            UserStats.missions_count,
+            UserActivity.id,
+            UserActivity.mission_id,
+            UserActivity.badge_id,
+            UserActivity.completed_at,
+        )
+        .select_from(UserStats)
+        .outerjoin(UserActivity, and_(
+            UserActivity.user_id == UserStats.user_id,
+            UserActivity.idempotency_key == idempotency_key,
+        ))
+        .where(UserStats.user_id == user_id)
+    ).one()
+    return row.missions_count, (row if row.id is not None else None)
+
+
+def _complete_once(db: Session, user_id: int, mission: MissionEntry,
+                   idempotency_key: Optional[str]) -> CompletionResult:
+    completed_at = datetime.now()
+
+    # ロールアップを加算（ここで user_stats の行ロックを取る）
+    user_stats.record_completions(
+        db, user_id, [(mission.default_point, mission.base_co2_reduction, completed_at)]
+    )
+    count, previous = _read_counter(db, user_id, idempotency_key)
+    if previous is not None:
+        # 再送: 加算を取り消して前回の結果を返す
+        db.rollback()
+        if previous.mission_id != mission.mission_id:
+            raise IdempotencyKeyReused(idempotency_key)
+        return _result(
+            db, mission_catalog.get(db, previous.mission_id), previous.mission_id,
+            previous.badge_id, previous.completed_at, replayed=True,
+        )
+
+    # 達成数と同じ番号のバッジを付与（1回目は badge_id=1）。存在しなければ付与なし
+    badge = badge_catalog.get(db, count)
+    db.execute(insert(UserActivity).values(
+        user_id=user_id,
+        mission_id=mission.mission_id,
+        completed_at=completed_at,
+        badge_id=badge.badge_id if badge else None,
+        idempotency_key=idempotency_key,
+    ))
+    with leaderboards.recording():
+        db.commit()
+        leaderboards.record_completions(user_id, [
+            (mission.default_point, mission.base_co2_reduction, user_stats.month_key(completed_at))
+        ])
+
+    logger.debug("mission completed", extra={
+        "user_id": user_id, "missions_count": count, "badge_id": badge.badge_id if badge else None,
+    })
+    return _result(db, mission, mission.mission_id, badge.badge_id if badge else None,
+                   completed_at, replayed=False)
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, IntegrityError):
+        return True  # 初回の user_stats 作成や同じ Idempotency-Key の同時送信が競合した
+    args = getattr(getattr(error, "orig", None), "args", ())
+    return isinstance(error, OperationalError) and bool(args) and args[0] in RETRYABLE_MYSQL_ERRORS
+
+
+def _with_retry(db: Session, fn: Callable[[], T]) -> T:
+    """競合で失敗したトランザクションをロールバックして MAX_ATTEMPTS 回までやり直す"""
+    attempt = 1
+    while True:
+        try:
+            return fn()
+        except (IntegrityError, OperationalError) as e:
+            db.rollback()
+            if attempt >= MAX_ATTEMPTS or not _retryable(e):
+                raise
+            logger.info("retrying mission completion after %s", e.__class__.__name__,
+                        extra={"attempt": attempt})
+            attempt += 1
+
+
+def complete_mission(db: Session, user_id: int, mission_id: int,
+                     idempotency_key: Optional[str] = None) -> CompletionResult:
+    """
+    ミッション達成を1トランザクションで記録する
+    - 達成数は COUNT せず user_stats の行ロック付き加算から読む（同時実行でもバッジが重複しない）
+    - idempotency_key が記録済みなら何も書かずに前回の結果を返す
+    - 初回の user_stats 作成の競合・デッドロック・ロック待ちタイムアウトはやり直す
+    """
+    mission = mission_catalog.get(db, mission_id)
+    if mission is None:
+        raise MissionNotFound(mission_id)
+
+    return _with_retry(db, lambda: _complete_once(db, user_id, mission, idempotency_key))
+
+
+# ==============================
+# 一括（オフライン中に溜めた達成の同期）
+# ==============================
+class BatchItem(NamedTuple):
+    mission_id: int
+    completed_at: Optional[datetime]
+    idempotency_key: Optional[str]
+
+
+class BatchItemResult(NamedTuple):
+    index: int
+    mission_id: int
+    status: str  # created / replayed / not_found / conflict
+    result: Optional[CompletionResult] = None
+
+
+def _complete_batch_once(db: Session, user_id: int, items: Sequence[BatchItem]) -> List[BatchItemResult]:
+    now = datetime.now()
+    results: List[Optional[BatchItemResult]] = [None] * len(items)
+    first_by_key: Dict[str, int] = {}
+    candidates: List[Tuple[int, MissionEntry, datetime]] = []
+
+    for index, item in enumerate(items):
+        mission = mission_catalog.get(db, item.mission_id)
+        if mission is None:
+            results[index] = BatchItemResult(index, item.mission_id, "not_found")
+            continue
+        if item.idempotency_key is not None:
+            if item.idempotency_key in first_by_key:
+                continue  # 同じバッチ内の重複は最初の1件の結果を後で写す
+            first_by_key[item.idempotency_key] = index
+        completed_at = item.completed_at or now
+        if completed_at.tzinfo is not None:
+            # completed_at はサーバーのローカル時刻（naive）で保存している
+            completed_at = completed_at.astimezone().replace(tzinfo=None)
+        # 未来の時刻（端末の時計ずれ）はサーバー時刻に丸める
+        completed_at = min(completed_at, now)
+        candidates.append((index, mission, completed_at))
+
+    count = user_stats.lock_stats(db, user_id)
+
+    # 以前のリクエストで記録済みのキー（行ロック後に読むので他と競合しない）
+    if first_by_key:
+        recorded = db.execute(
+            select(
+                UserActivity.idempotency_key,
+                UserActivity.mission_id,
+                UserActivity.badge_id,
+                UserActivity.completed_at,
+            ).where(
+                UserActivity.user_id == user_id,
+                UserActivity.idempotency_key.in_(list(first_by_key)),
+            )
+        ).all()
+        for key, mission_id, badge_id, completed_at in recorded:
+            index = first_by_key[key]
+            if mission_id != items[index].mission_id:
+                results[index] = BatchItemResult(index, items[index].mission_id, "conflict")
+            else:
+                results[index] = BatchItemResult(index, mission_id, "replayed", _result(
+                    db, mission_catalog.get(db, mission_id), mission_id, badge_id, completed_at,
+                    replayed=True,
+                ))
+
+    # 達成した順にバッジを付与する
+    new_items = sorted(
+        (c for c in candidates if results[c[0]] is None), key=lambda c: (c[2], c[0])
+    )
+    rows = []
+    for index, mission, completed_at in new_items:
+        count += 1
+        badge = badge_catalog.get(db, count)
+        badge_id = badge.badge_id if badge else None
+        rows.append({
+            "user_id": user_id,
+            "mission_id": mission.mission_id,
+            "completed_at": completed_at,
+            "badge_id": badge_id,
+            "idempotency_key": items[index].idempotency_key,
+        })
+        results[index] = BatchItemResult(index, mission.mission_id, "created", _result(
+            db, mission, mission.mission_id, badge_id, completed_at, replayed=False,
+        ))
+
+    if rows:
+        user_stats.record_completions(db, user_id, [
+            (mission.default_point, mission.base_co2_reduction, completed_at)
+            for _, mission, completed_at in new_items
+        ])
+        # 1文の executemany でまとめて入れる（ORM の一括 INSERT は None の列の有無で文が分かれるので Core で流す）
+        db.connection().execute(insert(UserActivity.__table__), rows)
+    with leaderboards.recording():
+        db.commit()
+        leaderboards.record_completions(user_id, [
+            (mission.default_point, mission.base_co2_reduction, user_stats.month_key(completed_at))
+            for _, mission, completed_at in new_items
+        ])
+
+    # バッチ内で重複したキーは最初の1件と同じ結果（再送扱い）
+    for index, item in enumerate(items):
+        if results[index] is None:
+            first = results[first_by_key[item.idempotency_key]]
+            if first.result is not None and first.mission_id == item.mission_id:
+                results[index] = BatchItemResult(
+                    index, item.mission_id, "replayed", first.result._replace(replayed=True)
+                )
+            else:
+                results[index] = BatchItemResult(index, item.mission_id, "conflict")
+    return results
+
+
+def complete_missions(db: Session, user_id: int, items: Sequence[BatchItem]) -> List[BatchItemResult]:
+    """
+    複数の達成を1トランザクション・1回の INSERT で記録し、items と同じ順で結果を返す
+    - バッジは completed_at の順に付与する
+    - 記録済みの Idempotency-Key は再送として扱う（別ミッションに使われていれば conflict）
+    - 存在しないミッションは not_found にして、残りは記録する
+    """
+    return _with_retry(db, lambda: _complete_batch_once(db, user_id, items))
@@ -0,0 +1,241 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.eco_mission import EcoMission
+from app.models.user_activity import UserActivity
+from app.models.user_stats import UserMonthlyStats, UserStats
+
+
+class StatsTotals(NamedTuple):
+    missions_count: int
+    total_points: int
+    total_co2: float
+
+
+ZERO = StatsTotals(0, 0, 0.0)
+
+
+def month_key(dt: datetime) -> str:
+    """集計バケットのキー（"YYYY-MM"）"""
+    return dt.strftime("%Y-%m")
+
+
+def _month_range(month: str):
+    year, mon = (int(x) for x in month.split("-"))
+    start = datetime(year, mon, 1)
+    end = datetime(year + 1, 1, 1) if mon == 12 else datetime(year, mon + 1, 1)
+    return start, end
+
+
+# ==============================
+# 生データからの集計（ロールアップが無いユーザー用）
+# ==============================
+def _aggregate_activity(db: Session, user_id: int, start=None, end=None) -> StatsTotals:
+    query = (
+        select(
+            func.count(UserActivity.id),
+            func.coalesce(func.sum(EcoMission.default_point), 0),
+            func.coalesce(func.sum(EcoMission.base_co2_reduction), 0),
+        )
+        .select_from(UserActivity)
+        .outerjoin(EcoMission, EcoMission.mission_id == UserActivity.mission_id)
+        .where(UserActivity.user_id == user_id)
+    )
+    if start is not None:
+        query = query.where(UserActivity.completed_at >= start, UserActivity.completed_at < end)
+    count, points, co2 = db.execute(query).one()
+    return StatsTotals(int(count), int(points), float(co2))
+
+
+def _backfill(db: Session, user_id: int) -> UserStats:
+    """既存の user_activity からロールアップ行を作る（ユーザーごとに1回だけ）"""
+    rows = db.execute(
+        select(UserActivity.completed_at, EcoMission.default_point, EcoMission.base_co2_reduction)
+        .select_from(UserActivity)
+        .outerjoin(EcoMission, EcoMission.mission_id == UserActivity.mission_id)
+        .where(UserActivity.user_id == user_id)
+        .execution_options(yield_per=1000)
+    )
+
+    stats = UserStats(user_id=user_id, missions_count=0, total_points=0, total_co2=0.0)
+    monthly: Dict[str, UserMonthlyStats] = {}
+    for completed_at, point, co2 in rows:
+        point, co2 = point or 0, co2 or 0.0
+        stats.missions_count += 1
+        stats.total_points += point
+        stats.total_co2 += co2
+        if completed_at is None:
+            continue
+        key = month_key(completed_at)
+        bucket = monthly.get(key)
+        if bucket is None:
+            bucket = monthly[key] = UserMonthlyStats(
+                user_id=user_id, month=key, missions_count=0, total_points=0, total_co2=0.0
+            )
+        bucket.missions_count += 1
+        bucket.total_points += point
+        bucket.total_co2 += co2
+
+    db.add(stats)
+    db.add_all(monthly.values())
+    db.flush()
+    return stats
+
+
+def create_empty(db: Session, user_id: int) -> None:
+    """
+    新規ユーザーの空のロールアップ行（ユーザー作成と同じトランザクションで呼ぶ）
+    初回の /me や達成記録で集計・バックフィルのクエリが走らないようにする
+    """
+    db.execute(insert(UserStats).values(user_id=user_id, missions_count=0, total_points=0, total_co2=0.0))
+
+
+# ==============================
+# 書き込み（complete_mission から呼ぶ）
+# ==============================
+def _bump_stats(db: Session, user_id: int, count: int, points: int, co2: float) -> bool:
+    result = db.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .values(
+            missions_count=UserStats.missions_count + count,
+            total_points=UserStats.total_points + points,
+            total_co2=UserStats.total_co2 + co2,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def _bump_month(db: Session, user_id: int, month: str, count: int, points: int, co2: float) -> None:
+    result = db.execute(
+        update(UserMonthlyStats)
+        .where(UserMonthlyStats.user_id == user_id, UserMonthlyStats.month == month)
+        .values(
+            missions_count=UserMonthlyStats.missions_count + count,
+            total_points=UserMonthlyStats.total_points + points,
+            total_co2=UserMonthlyStats.total_co2 + co2,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.execute(insert(UserMonthlyStats).values(
+            user_id=user_id, month=month, missions_count=count, total_points=points, total_co2=co2
+        ))
+
+
+def _bump_months(db: Session, user_id: int, monthly: Dict[str, List[float]]) -> None:
+    """複数の月をまとめて加算する（月の数によらず SELECT 1回 + UPDATE / INSERT の executemany 各1回）"""
+    existing = set(db.execute(
+        select(UserMonthlyStats.month)
+        .where(UserMonthlyStats.user_id == user_id, UserMonthlyStats.month.in_(list(monthly)))
+    ).scalars())
+    table = UserMonthlyStats.__table__
+    conn = db.connection()
+    updates = [
+        {"b_month": month, "b_count": n, "b_points": p, "b_co2": c}
+        for month, (n, p, c) in monthly.items() if month in existing
+    ]
+    if updates:
+        conn.execute(
+            update(table)
+            .where(table.c.user_id == user_id, table.c.month == bindparam("b_month"))
+            .values(
+                missions_count=table.c.missions_count + bindparam("b_count"),
+                total_points=table.c.total_points + bindparam("b_points"),
+                total_co2=table.c.total_co2 + bindparam("b_co2"),
+            ),
+            updates,
+        )
+    inserts = [
+        {"user_id": user_id, "month": month, "missions_count": n, "total_points": p, "total_co2": c}
+        for month, (n, p, c) in monthly.items() if month not in existing
+    ]
+    if inserts:
+        conn.execute(insert(table), inserts)
+
+
+def lock_stats(db: Session, user_id: int) -> int:
+    """
+    user_stats の行ロックを取って現在の達成数を返す（行が無ければ作る）
+    加算額が決まる前にロックしたいとき用（0 を足す UPDATE でロックする）
+    """
+    if not _bump_stats(db, user_id, 0, 0, 0.0):
+        _backfill(db, user_id)
+    return db.execute(
+        select(UserStats.missions_count).where(UserStats.user_id == user_id)
+    ).scalar_one()
+
+
+def record_completions(
+    db: Session, user_id: int, completions: Sequence[Tuple[int, float, datetime]]
+) -> None:
+    """
+    ミッション達成 (point, co2, completed_at) を user_stats / user_monthly_stats に加算する
+    - user_stats は UPDATE で加算する。この UPDATE が行ロックを取るので、
+      同じユーザーの達成処理は commit までここで直列化される
+    - 行が無ければ既存の user_activity から作ってから加算する
+      （同時に作ろうとした側は IntegrityError になるので、呼び出し側でやり直す）
+    - 今回の user_activity を書き込む前に呼ぶこと（二重計上を防ぐため）。commit は呼び出し側
+    """
+    count = len(completions)
+    points = sum(point or 0 for point, _, _ in completions)
+    co2 = sum(c or 0.0 for _, c, _ in completions)
+
+    if not _bump_stats(db, user_id, count, points, co2):
+        _backfill(db, user_id)
+        _bump_stats(db, user_id, count, points, co2)
+
+    monthly: Dict[str, List[float]] = {}
+    for point, c, completed_at in completions:
+        bucket = monthly.setdefault(month_key(completed_at), [0, 0, 0.0])
+        bucket[0] += 1
+        bucket[1] += point or 0
+        bucket[2] += c or 0.0
+    if len(monthly) == 1:
+        for month, (n, p, c) in monthly.items():
+            _bump_month(db, user_id, month, n, p, c)
+    else:
+        _bump_months(db, user_id, monthly)
+
+
+# ==============================
+# 読み込み
+# ==============================
+def get_totals(db: Session, user_id: int) -> StatsTotals:
+    """ユーザーの累計（ロールアップの主キー参照1回）"""
+    row = db.execute(
+        select(UserStats.missions_count, UserStats.total_points, UserStats.total_co2)
+        .where(UserStats.user_id == user_id)
+    ).first()
+    if row is None:
+        return _aggregate_activity(db, user_id)
+    return StatsTotals(*row)
+
+
+def get_month(db: Session, user_id: int, month: str) -> StatsTotals:
+    """ユーザーの月次集計（ロールアップの主キー参照1回）"""
+    row = db.execute(
+        select(
+            UserMonthlyStats.missions_count,
+            UserMonthlyStats.total_points,
+            UserMonthlyStats.total_co2,
+        )
+        .select_from(UserStats)
+        .outerjoin(
+            UserMonthlyStats,
+            and_(UserMonthlyStats.user_id == UserStats.user_id, UserMonthlyStats.month == month),
+        )
+        .where(UserStats.user_id == user_id)
+    ).first()
+    if row is None:
+        # まだロールアップが無いユーザーは生データから集計
+        start, end = _month_range(month)
+        return _aggregate_activity(db, user_id, start, end)
+    if row.missions_count is None:
+        # ロールアップはあるがその月の達成は無い
+        return ZERO
+    return StatsTotals(*row)
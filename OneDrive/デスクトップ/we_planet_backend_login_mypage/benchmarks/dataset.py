@@ -0,0 +1,26 @@
+from typing import Dict
+
+from app.db.seed import SeedConfig, seed_database
+
+BENCH_PASSWORD = "bench-password"
+
+
+def seed(engine, users: int, missions: int, activities: int, password_hash: str,
+         badges: int = 20, days: int = 365, rng_seed: int = 42) -> Dict[str, int]:
+    """
+    ベンチマーク用の合成データを入れる（既存データは消す）
+    - ユーザーは bench{i}@example.com / BENCH_PASSWORD
+    - 投入とロールアップ作成は app.db.seed に任せる
+    """
+    seed_database(engine, SeedConfig(
+        users=users,
+        missions=missions,
+        badges=badges,
+        activities=activities,
+        days=days,
+        rng_seed=rng_seed,
+        email_prefix="bench",
+        password_hash=password_hash,
+        truncate=True,
+    ), log=lambda msg: None)
+    return {"users": users, "missions": missions, "badges": badges, "activities": activities}
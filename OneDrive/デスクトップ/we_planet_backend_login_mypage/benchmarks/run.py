@@ -0,0 +1,284 @@
+"""
+ホットなエンドポイントのベンチマーク
+
+    python -m benchmarks.run --users 1000 --activities 50000 --concurrency 32 --requests 2000 \
+        --output bench.json --baseline benchmarks/baseline.json --threshold 0.2
+
+- app.main:app をプロセス内で ASGI クライアント（httpx）から叩く（ネットワークを挟まない）
+- DATABASE_URL 未指定なら一時ファイルの SQLite に合成データを入れて使う
+- 結果は JSON で保存し、--baseline と比べて閾値を超えて悪化したら終了コード 1
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# app を import する前に環境を整える（Settings は import 時に読まれる）
+_DEFAULT_ENV = {
+    "JWT_SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+    "GOOGLE_CLIENT_ID": "benchmark",
+    "GOOGLE_CLIENT_SECRET": "benchmark",
+    "SESSION_SECRET_KEY": "benchmark-session-secret-key",
+    "METRICS_ENABLED": "true",  # 1リクエストあたりの SQL 件数を取るのに使う
+    "OIDC_CACHE_TTL_SECONDS": "0",  # Google のメタデータを取りに行かない
+}
+
+ENDPOINTS = [
+    "login", "me", "mission_today", "mission_complete", "mission_complete_batch",
+    "ecoboard_summary", "leaderboard", "badges",
+]
+BATCH_SIZE = 10  # mission_complete_batch の1リクエストあたりの件数
+
+# 回帰判定に使う指標（大きいほど悪い）
+GATED_METRICS = ("p95_ms", "queries_per_request")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """nearest-rank 法"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Scenario:
+    """1エンドポイント分のリクエストの作り方"""
+
+    def __init__(self, name: str, method: str, route: str, build: Callable[[random.Random], dict]):
+        self.name = name
+        self.method = method
+        self.route = route  # /metrics と同じルートテンプレート
+        self.build = build
+
+
+def build_scenarios(users: int, missions: int, tokens: Dict[int, str], password: str) -> Dict[str, Scenario]:
+    def auth(rng):
+        return {"Authorization": f"Bearer {tokens[rng.randint(1, users)]}"}
+
+    return {
+        "login": Scenario("login", "POST", "/login", lambda rng: {
+            "url": "/login",
+            "json": {"email": f"bench{rng.randint(1, users)}@example.com", "password": password},
+        }),
+        "me": Scenario("me", "GET", "/me", lambda rng: {"url": "/me", "headers": auth(rng)}),
+        "mission_today": Scenario("mission_today", "GET", "/mission/today", lambda rng: {
+            "url": "/mission/today", "headers": auth(rng),
+        }),
+        "mission_complete": Scenario(
+            "mission_complete", "POST", "/mission/complete/{mission_id}", lambda rng: {
+                "url": f"/mission/complete/{rng.randint(1, missions)}", "headers": auth(rng),
+            }
+        ),
+        "mission_complete_batch": Scenario(
+            "mission_complete_batch", "POST", "/mission/complete/batch", lambda rng: {
+                "url": "/mission/complete/batch", "headers": auth(rng),
+                "json": {"items": [
+                    {"mission_id": rng.randint(1, missions), "idempotency_key": "%032x" % rng.getrandbits(128)}
+                    for _ in range(BATCH_SIZE)
+                ]},
+            }
+        ),
+        "ecoboard_summary": Scenario("ecoboard_summary", "GET", "/ecoboard/summary/me", lambda rng: {
+            "url": "/ecoboard/summary/me", "headers": auth(rng),
+        }),
+        "leaderboard": Scenario("leaderboard", "GET", "/ecoboard/leaderboard", lambda rng: {
+            "url": "/ecoboard/leaderboard", "headers": auth(rng),
+            "params": {"metric": rng.choice(("co2", "points")), "offset": rng.randint(0, users // 2)},
+        }),
+        "badges": Scenario("badges", "GET", "/badge/badges", lambda rng: {"url": "/badge/badges"}),
+    }
+
+
+async def run_scenario(client, scenario: Scenario, requests: int, concurrency: int, rng_seed: int) -> dict:
+    from app.core.metrics import HTTP_DB_QUERIES
+    from app.core.query_budget import QUERY_BUDGET_EXCEEDED
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+    labels = {"method": scenario.method, "route": scenario.route}
+    q_sum_before, q_count_before = HTTP_DB_QUERIES.totals(**labels)
+    over_budget_before = QUERY_BUDGET_EXCEEDED.value(**labels)
+
+    async def worker(worker_id: int):
+        nonlocal remaining, errors
+        rng = random.Random(rng_seed * 1000 + worker_id)
+        while remaining > 0:
+            remaining -= 1
+            kwargs = scenario.build(rng)
+            start = time.perf_counter()
+            response = await client.request(scenario.method, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    q_sum, q_count = HTTP_DB_QUERIES.totals(**labels)
+    measured = q_count - q_count_before
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "queries_per_request": round((q_sum - q_sum_before) / measured, 3) if measured else None,
+        # ルートの @query_budget を超えたリクエスト数
+        "over_budget": int(QUERY_BUDGET_EXCEEDED.value(**labels) - over_budget_before),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """baseline より threshold（割合）を超えて悪化した指標を返す"""
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        for metric in GATED_METRICS:
+            before, after = previous.get(metric), current.get(metric)
+            if before is None or after is None:
+                continue
+            # 0 に近い値は割合だとぶれるので、クエリ数は +0.5 件未満の増加を許容する
+            slack = 0.5 if metric == "queries_per_request" else 0.0
+            if after > before * (1 + threshold) + slack:
+                regressions.append(f"{name}.{metric}: {before} -> {after}")
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{name}.errors: {previous.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+
+async def main_async(args) -> dict:
+    import httpx
+
+    from app.core import security
+    from app.core.database import Base, engine
+    from app.core.principal_cache import Principal
+    from app.main import app
+    from benchmarks.dataset import BENCH_PASSWORD, seed
+
+    if not args.no_seed:
+        Base.metadata.create_all(bind=engine)
+        print(f"[bench] seeding users={args.users} missions={args.missions} activities={args.activities}")
+        started = time.perf_counter()
+        seed(engine, args.users, args.missions, args.activities,
+             password_hash=security.get_password_hash(BENCH_PASSWORD), rng_seed=args.seed)
+        print(f"[bench] seeded in {time.perf_counter() - started:.1f}s")
+
+    tokens = {
+        uid: security.create_access_token(
+            Principal(user_id=uid, email=f"bench{uid}@example.com", nickname=f"bench{uid}",
+                      auth_provider="local").claims()
+        )
+        for uid in range(1, args.users + 1)
+    }
+    scenarios = build_scenarios(args.users, args.missions, tokens, BENCH_PASSWORD)
+    selected = args.endpoints or ENDPOINTS
+
+    results = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.url.render_as_string(hide_password=True),
+            "db_async": os.environ.get("DB_ASYNC", "false"),
+            "users": args.users,
+            "missions": args.missions,
+            "activities": args.activities,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+        },
+        "endpoints": {},
+    }
+
+    async with app.router.lifespan_context(app):
+        # 500 は例外で止めずにエラーとして数える
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in selected:
+                scenario = scenarios[name]
+                if args.warmup:
+                    await run_scenario(client, scenario, args.warmup, args.concurrency, args.seed + 1)
+                result = await run_scenario(client, scenario, args.requests, args.concurrency, args.seed)
+                results["endpoints"][name] = result
+                print(
+                    f"[bench] {name:<18} p50={result['p50_ms']:>8.2f}ms p95={result['p95_ms']:>8.2f}ms "
+                    f"p99={result['p99_ms']:>8.2f}ms rps={result['throughput_rps']:>8.1f} "
+                    f"q/req={result['queries_per_request']} over_budget={result['over_budget']} "
+                    f"errors={result['errors']}"
+                )
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="WePlanet backend benchmark")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--missions", type=int, default=50)
+    parser.add_argument("--activities", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="エンドポイントごとのリクエスト数")
+    parser.add_argument("--warmup", type=int, default=50, help="計測前に捨てるリクエスト数")
+    parser.add_argument("--endpoints", nargs="*", choices=ENDPOINTS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-seed", action="store_true", help="既存のデータをそのまま使う")
+    parser.add_argument("--output", help="結果の JSON を書き出すパス")
+    parser.add_argument("--baseline", help="比較対象の JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="許容する悪化の割合（0.2 = 20%%）")
+    parser.add_argument("--enforce-budgets", action="store_true",
+                        help="@query_budget を超えたリクエストがあれば終了コード 1")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    for key, value in _DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    if "DATABASE_URL" not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix="weplanet-bench-"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    # どこから実行しても app パッケージを import できるようにする
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    results = asyncio.run(main_async(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"[bench] wrote {args.output}")
+
+    if args.enforce_budgets:
+        over = {name: r["over_budget"] for name, r in results["endpoints"].items() if r["over_budget"]}
+        if over:
+            print(f"[bench] OVER QUERY BUDGET: {', '.join(f'{k}={v}' for k, v in over.items())}")
+            return 1
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"[bench] REGRESSION (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"[bench] no regression against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
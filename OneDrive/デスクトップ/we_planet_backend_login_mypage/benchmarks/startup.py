@@ -0,0 +1,115 @@
+"""
+起動時間のバジェット確認（コールドスタート対策）
+
+    python -m benchmarks.startup --top 15 --output startup.json   # バジェットは既定の 3000ms（--budget-ms で変更）
+
+- 新しいプロセスで `import app.main` と lifespan の起動処理を計り、-X importtime の結果を集計する
+- import + 起動がバジェットを超えたら終了コード 1
+- パッケージ別の import 時間（self の合計）を多い順に出すので、重い依存を見つけて遅延 import する
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks.run import _DEFAULT_ENV
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子プロセスで実行する計測スクリプト（最後の行に JSON を出す）
+_PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def _startup():
+    async with app.main.app.router.lifespan_context(app.main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(_startup())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """-X importtime の出力を (モジュール名, self µs, cumulative µs) のリストにする"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """トップレベルのパッケージ（app は app.core などの2階層目）ごとの self 時間の合計（µs）"""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        parts = name.split(".")
+        key = ".".join(parts[:2]) if parts[0] == "app" else parts[0]
+        totals[key] += self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def measure() -> dict:
+    env = dict(os.environ)
+    for key, value in _DEFAULT_ENV.items():
+        env.setdefault(key, value)
+    if "DATABASE_URL" not in env:
+        path = os.path.join(tempfile.mkdtemp(prefix="weplanet-startup-"), "startup.db")
+        env["DATABASE_URL"] = f"sqlite:///{path}"
+        env.setdefault("DB_CREATE_ALL", "true")
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=APP_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"app failed to start:\n{proc.stderr[-2000:]}")
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(proc.stderr)
+    return {
+        "import_ms": round(timings["import_ms"], 1),
+        "startup_ms": round(timings["startup_ms"], 1),
+        "total_ms": round(timings["import_ms"] + timings["startup_ms"], 1),
+        "modules": len(rows),
+        "packages_ms": {name: round(us / 1000, 1) for name, us in by_package(rows).items()},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="WePlanet backend startup budget")
+    parser.add_argument("--budget-ms", type=float, default=3000, help="import + 起動処理の上限（ミリ秒。CI のランナーでの値）")
+    parser.add_argument("--top", type=int, default=15, help="表示するパッケージ数")
+    parser.add_argument("--output", help="結果の JSON を書き出すパス")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = measure()
+    report["budget_ms"] = args.budget_ms
+
+    print(f"[startup] import={report['import_ms']:.0f}ms startup={report['startup_ms']:.0f}ms "
+          f"total={report['total_ms']:.0f}ms budget={args.budget_ms:.0f}ms modules={report['modules']}")
+    for name, ms in list(report["packages_ms"].items())[:args.top]:
+        print(f"[startup]   {name:<28} {ms:>8.1f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if report["total_ms"] > args.budget_ms:
+        print(f"[startup] over budget by {report['total_ms'] - args.budget_ms:.0f}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
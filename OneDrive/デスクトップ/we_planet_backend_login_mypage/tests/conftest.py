@@ -0,0 +1,107 @@
+"""
+テスト共通の準備
+
+- app を import する前に環境変数を決める（設定は import 時に読まれる）
+- DB は一時ディレクトリの SQLite。テーブルはセッションの最初に作り、ミッション・バッジを入れておく
+- QUERY_BUDGET_MODE=raise なので、予算を超えたルートはテストが落ちる
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="weplanet-test-")
+DB_PATH = os.path.join(_tmp, "test.db")
+
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{DB_PATH}",
+    JWT_SECRET_KEY="t" * 32,
+    GOOGLE_CLIENT_ID="test-client",
+    GOOGLE_CLIENT_SECRET="test-secret",
+    SESSION_SECRET_KEY="s" * 32,
+    BCRYPT_ROUNDS="4",
+    QUERY_BUDGET_MODE="raise",
+    OIDC_CACHE_TTL_SECONDS="0",   # テスト中に Google へ取りに行かない
+    AUTH_CACHE_SYNC_SECONDS="0",  # キャッシュの突き合わせはテストから呼ぶ
+    PROFILE_SECRET="test-profile-secret",
+    PROFILE_DIR=os.path.join(_tmp, "profiles"),
+    LOG_FORMAT="text",
+)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import main  # noqa: E402
+from app.core import database  # noqa: E402
+from app.core.database import Base  # noqa: E402
+from app.models.eco_badge import EcoBadge  # noqa: E402
+from app.models.eco_mission import EcoMission  # noqa: E402
+
+MISSION_IDS = [1, 2, 3, 4, 5]
+
+
+def _seed() -> None:
+    Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    try:
+        for i in MISSION_IDS:
+            db.add(EcoMission(mission_id=i, title=f"mission {i}", description="test",
+                              base_co2_reduction=10.0 * i, default_point=i))
+            db.add(EcoBadge(badge_id=i, badge_name=f"badge {i}"))
+        db.commit()
+    finally:
+        db.close()
+
+
+_seed()
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def register(client):
+    """ユーザーを登録してログインし、(user_id, Authorization ヘッダ) を返す"""
+    def _register(nickname: str = "tester"):
+        email = f"{uuid.uuid4().hex[:12]}@example.com"
+        r = client.post("/users/register", json={"email": email, "password": "pw", "nickname": nickname})
+        assert r.status_code == 200, r.text
+        r = client.post("/login", json={"email": email, "password": "pw"})
+        assert r.status_code == 200, r.text
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        me = client.get("/me", headers=headers)
+        assert me.status_code == 200, me.text
+        return me.json()["user_id"], headers
+    return _register
+
+
+@pytest.fixture
+def legacy_user(register):
+    """
+    ロールアップ（user_stats / user_monthly_stats）が作られる前からいたユーザー
+    達成履歴 (mission_id, completed_at) を user_activity に直接書き、ロールアップの行は消しておく
+    """
+    from sqlalchemy import delete
+
+    from app.models.user_activity import UserActivity
+    from app.models.user_stats import UserMonthlyStats, UserStats
+
+    def _legacy_user(activities=()):
+        user_id, headers = register("legacy")
+        db = database.SessionLocal()
+        try:
+            db.execute(delete(UserMonthlyStats).where(UserMonthlyStats.user_id == user_id))
+            db.execute(delete(UserStats).where(UserStats.user_id == user_id))
+            for mission_id, completed_at in activities:
+                db.add(UserActivity(user_id=user_id, mission_id=mission_id, completed_at=completed_at))
+            db.commit()
+        finally:
+            db.close()
+        return user_id, headers
+    return _legacy_user
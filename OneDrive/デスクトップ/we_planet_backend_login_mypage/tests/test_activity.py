@@ -0,0 +1,131 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update
+
+from app.core import database
+from app.core.catalog import mission_catalog
+from app.main import app
+from app.models.user_activity import UserActivity
+from app.routers import activity
+
+
+def test_export_reads_catalog_before_streaming(client, legacy_user, monkeypatch):
+    start = datetime(2026, 1, 1)
+    _, headers = legacy_user([(i % 5 + 1, start + timedelta(days=i)) for i in range(7)])
+    monkeypatch.setattr(activity, "EXPORT_CHUNK_ROWS", 2)
+    mission_catalog.invalidate()
+
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.read_engine, "before_cursor_execute", _record)
+    try:
+        r = client.get("/me/activities/export", headers=headers)
+    finally:
+        event.remove(database.read_engine, "before_cursor_execute", _record)
+    assert r.status_code == 200
+
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["mission_id"] for row in rows] == [i % 5 + 1 for i in range(7)]
+    assert rows[0]["title"] == "mission 1"
+
+    catalog = [i for i, s in enumerate(statements) if "FROM eco_mission" in s]
+    stream = [i for i, s in enumerate(statements) if "FROM user_activity" in s]
+    assert len(catalog) == 1 and len(stream) == 1
+    assert catalog[0] < stream[0]
+
+
+def test_activities_pagination(client, legacy_user):
+    start = datetime(2026, 2, 1)
+    _, headers = legacy_user([(1, start + timedelta(hours=i)) for i in range(5)])
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/me/activities", headers=headers, params=params).json()
+        seen.extend(item["id"] for item in body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_rows_without_completed_at_are_left_out_of_both_endpoints(client, legacy_user):
+    start = datetime(2026, 3, 1)
+    user_id, headers = legacy_user([(1, start), (2, start), (3, start + timedelta(hours=1))])
+    # completed_at の無い行（server_default より前の古いデータ）
+    db = database.SessionLocal()
+    try:
+        db.execute(
+            update(UserActivity)
+            .where(UserActivity.user_id == user_id, UserActivity.mission_id == 2)
+            .values(completed_at=None)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    page = client.get("/me/activities", headers=headers).json()
+    export = [json.loads(line) for line in client.get("/me/activities/export", headers=headers).text.splitlines()]
+    assert sorted(item["mission_id"] for item in page["items"]) == [1, 3]
+    assert [row["mission_id"] for row in export] == [1, 3]
+
+
+def test_export_closes_its_session_when_the_client_disconnects(client, legacy_user, monkeypatch):
+    start = datetime(2026, 4, 1)
+    _, headers = legacy_user([(1, start + timedelta(minutes=i)) for i in range(20)])
+    monkeypatch.setattr(activity, "EXPORT_CHUNK_ROWS", 1)
+
+    closed = []
+
+    def session():
+        db = database.ReadSessionLocal()
+        close = db.close
+
+        def _close():
+            closed.append(db)
+            close()
+        db.close = _close
+        return db
+
+    monkeypatch.setattr(activity, "ReadSessionLocal", session)
+
+    async def download():
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/me/activities/export", "raw_path": b"/me/activities/export",
+            "query_string": b"", "root_path": "", "client": ("testclient", 50000), "server": ("testserver", 80),
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+        requested = False
+        gone = asyncio.Event()
+        bodies = []
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                bodies.append(message)
+                if len(bodies) == 1:
+                    # 1行目を受け取ったところで切断する
+                    gone.set()
+                    await asyncio.sleep(1)
+
+        await app(scope, receive, send)
+        # GC に任せず、レスポンスが終わる時点で閉じている
+        return bodies, len(closed)
+
+    bodies, closed_on_return = asyncio.run(download())
+    assert len(bodies) == 1 and bodies[0]["more_body"]
+    assert closed_on_return == 1
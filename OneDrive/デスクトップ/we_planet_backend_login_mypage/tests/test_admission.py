@@ -0,0 +1,87 @@
+import asyncio
+
+from app import main
+from app.core.admission import AUTH, EXPORT, READ, WRITE, AdmissionMiddleware
+
+
+class _Blocking:
+    """ASGI アプリの代わり。/login は release されるまで返さない"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        if scope["path"] == "/login":
+            self.started.set()
+            await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def _request(app, method: str, path: str):
+    scope = {
+        "type": "http", "method": method, "path": path, "root_path": "",
+        "query_string": b"", "headers": [],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    return start["status"], dict((k.decode(), v.decode()) for k, v in start.get("headers", []))
+
+
+def _middleware(inner, **limits):
+    limits = dict({AUTH: 1, WRITE: 1, READ: 1, EXPORT: 1}, **limits)
+    return AdmissionMiddleware(inner, main.app.router, limits=limits, max_queue=1, queue_timeout=0.05)
+
+
+def test_saturated_class_sheds_with_503():
+    async def run():
+        inner = _Blocking()
+        app = _middleware(inner)
+        first = asyncio.ensure_future(_request(app, "POST", "/login"))
+        await inner.started.wait()
+        # 2件目は待ち行列で時間切れ、3件目は待ち行列が一杯
+        queued = asyncio.ensure_future(_request(app, "POST", "/login"))
+        await asyncio.sleep(0)
+        full = await _request(app, "POST", "/login")
+        timed_out = await queued
+        inner.release.set()
+        return await first, timed_out, full
+
+    first, timed_out, full = asyncio.run(run())
+    assert first[0] == 200
+    for status, headers in (timed_out, full):
+        assert status == 503
+        assert headers["retry-after"] == "1"
+
+
+def test_reads_pass_while_auth_is_saturated():
+    async def run():
+        inner = _Blocking()
+        app = _middleware(inner)
+        login = asyncio.ensure_future(_request(app, "POST", "/login"))
+        await inner.started.wait()
+        results = [
+            await _request(app, "GET", "/badge/badges"),
+            await _request(app, "GET", "/me/activities/export"),
+            await _request(app, "GET", "/health"),
+        ]
+        inner.release.set()
+        await login
+        return results
+
+    assert [status for status, _ in asyncio.run(run())] == [200, 200, 200]
+
+
+def test_export_has_its_own_class():
+    app = _middleware(_Blocking())
+    route = app._resolve({"type": "http", "method": "GET", "path": "/me/activities/export", "root_path": ""})
+    assert app._classify({"method": "GET"}, route) == EXPORT
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.core import database
+from app.core.leaderboard import load_scores
+from app.db.backfill import backfill_rollups
+from app.models.user_stats import UserMonthlyStats, UserStats
+
+
+def _backfill():
+    with database.engine.begin() as conn:
+        return backfill_rollups(conn)
+
+
+def test_backfill_adds_users_with_only_activity_rows(legacy_user):
+    user_id, _ = legacy_user([(1, datetime(2026, 1, 10)), (3, datetime(2026, 1, 20)), (2, datetime(2026, 2, 1))])
+    idle_id, _ = legacy_user()
+    db = database.SessionLocal()
+    try:
+        assert user_id not in load_scores(db, "points", "all")
+    finally:
+        db.close()
+
+    assert _backfill() >= 2
+
+    db = database.SessionLocal()
+    try:
+        assert load_scores(db, "points", "all")[user_id] == 1 + 3 + 2
+        assert load_scores(db, "co2", "all")[user_id] == 60.0
+        assert load_scores(db, "points", "2026-01")[user_id] == 4
+        assert load_scores(db, "points", "2026-02")[user_id] == 2
+        # 達成の無いユーザーにも 0 の行ができる（ランキングには出ない）
+        idle = db.get(UserStats, idle_id)
+        assert (idle.missions_count, idle.total_points) == (0, 0)
+        assert idle_id not in load_scores(db, "points", "all")
+    finally:
+        db.close()
+
+
+def test_backfill_is_idempotent(legacy_user):
+    user_id, _ = legacy_user([(1, datetime(2026, 3, 1))])
+    _backfill()
+    assert _backfill() == 0
+
+    db = database.SessionLocal()
+    try:
+        assert db.get(UserStats, user_id).total_points == 1
+        months = db.execute(select(UserMonthlyStats.month).where(UserMonthlyStats.user_id == user_id)).scalars().all()
+        assert months == ["2026-03"]
+    finally:
+        db.close()
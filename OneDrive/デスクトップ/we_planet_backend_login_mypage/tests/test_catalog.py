@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core import database
+from app.core.catalog import MissionCatalog, _Catalog, badge_catalog
+from app.core.database import AsyncDBRunner
+from app.core.db_url import to_async_url
+from app.core.query_budget import count_queries
+
+
+def _session():
+    return database.SessionLocal()
+
+
+def test_cached_path_issues_no_sql():
+    catalog = MissionCatalog(ttl_seconds=None)
+    db = _session()
+    try:
+        with count_queries() as first:
+            assert catalog.get(db, 1).title == "mission 1"
+        with count_queries() as second:
+            assert catalog.get(db, 2).default_point == 2
+            assert catalog.get(db, 999) is None
+            assert [m.mission_id for m in catalog.missions(db)][:5] == [1, 2, 3, 4, 5]
+    finally:
+        db.close()
+    assert (first.count, second.count) == (1, 0)
+    assert catalog.version == 1
+
+
+def test_expired_snapshot_is_reloaded():
+    catalog = MissionCatalog(ttl_seconds=0)
+    db = _session()
+    try:
+        catalog.get(db, 1)
+        with count_queries() as log:
+            catalog.get(db, 1)
+    finally:
+        db.close()
+    assert log.count == 1
+    assert catalog.version == 2
+
+
+def test_reload_in_progress_does_not_block():
+    catalog = MissionCatalog(ttl_seconds=0)
+    db = _session()
+    try:
+        stale = catalog._current(db)
+        # 他のスレッドが再読込中（ロックを握っている）
+        catalog._lock.acquire()
+        try:
+            with count_queries() as log:
+                assert catalog._current(db) is stale
+            assert log.count == 0
+
+            # 初回読込中なら自分で読むが、保存はしない
+            catalog.invalidate()
+            with count_queries() as log:
+                assert catalog.get(db, 1).title == "mission 1"
+            assert log.count == 1
+            assert catalog._snapshot is None
+        finally:
+            catalog._lock.release()
+    finally:
+        db.close()
+
+
+def test_badges_etag_returns_304(client):
+    badge_catalog.invalidate()
+    r = client.get("/badge/badges")
+    assert r.status_code == 200
+    assert [b["badge_id"] for b in r.json()][:2] == [1, 2]
+    r = client.get("/badge/badges", headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304
+
+
+def test_async_runner_uses_the_same_catalog_code():
+    async def run():
+        engine = create_async_engine(to_async_url(database.DATABASE_URL))
+        try:
+            async with AsyncSession(engine) as session:
+                catalog = MissionCatalog(ttl_seconds=None)
+                runner = AsyncDBRunner(session)
+                missions = await runner.run(catalog.missions)
+                cached = await runner.run(catalog.get, 3)
+                return missions, cached, catalog.version
+        finally:
+            await engine.dispose()
+
+    missions, cached, version = asyncio.run(run())
+    assert missions[0].mission_id == 1
+    assert cached.title == "mission 3"
+    assert version == 1
+
+
+def test_catalog_base_requires_build():
+    class Incomplete(_Catalog):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
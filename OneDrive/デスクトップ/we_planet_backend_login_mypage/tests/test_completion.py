@@ -0,0 +1,163 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.core import database
+from app.services import completion
+
+
+class _MySQLError(Exception):
+    """pymysql の例外と同じく args[0] がエラー番号"""
+
+
+def _failing_once(monkeypatch, name, code):
+    original = getattr(completion, name)
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("UPDATE user_stats ...", {}, _MySQLError(code, "simulated"))
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(completion, name, flaky)
+    return calls
+
+
+@pytest.mark.parametrize("code", [1213, 1205])
+def test_complete_mission_retries_deadlocks(monkeypatch, register, code):
+    user_id, _ = register()
+    calls = _failing_once(monkeypatch, "_complete_once", code)
+    db = database.SessionLocal()
+    try:
+        result = completion.complete_mission(db, user_id, 1)
+    finally:
+        db.close()
+    assert len(calls) == 2
+    assert result.point == 1 and not result.replayed
+
+
+def test_complete_missions_retries_deadlocks(monkeypatch, register):
+    user_id, _ = register()
+    calls = _failing_once(monkeypatch, "_complete_batch_once", 1213)
+    db = database.SessionLocal()
+    try:
+        results = completion.complete_missions(db, user_id, [completion.BatchItem(2, None, None)])
+    finally:
+        db.close()
+    assert len(calls) == 2
+    assert [r.status for r in results] == ["created"]
+
+
+def test_other_operational_errors_are_not_retried(monkeypatch, register):
+    user_id, _ = register()
+    calls = _failing_once(monkeypatch, "_complete_once", 2013)  # 接続断
+    db = database.SessionLocal()
+    try:
+        with pytest.raises(OperationalError):
+            completion.complete_mission(db, user_id, 1)
+    finally:
+        db.close()
+    assert len(calls) == 1
+
+
+# ==============================
+# POST /mission/complete/batch
+# ==============================
+def _batch(client, headers, *items):
+    r = client.post("/mission/complete/batch", headers=headers, json={"items": list(items)})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def _completed(client, headers):
+    return client.get("/badge/user-progress/me", headers=headers).json()["total_missions_completed"]
+
+
+def _without_status(body):
+    return [{k: v for k, v in r.items() if k != "status"} for r in body["results"]]
+
+
+def test_batch_results_follow_items_and_badges_follow_completed_at(client, register):
+    _, headers = register("batch")
+    body = _batch(
+        client, headers,
+        {"mission_id": 3, "completed_at": "2026-01-05T12:00:00"},
+        {"mission_id": 1, "completed_at": "2026-01-05T10:00:00"},
+        {"mission_id": 999, "completed_at": "2026-01-05T09:00:00"},
+        {"mission_id": 2, "completed_at": "2026-01-05T11:00:00"},
+    )
+    results = body["results"]
+    assert body["created"] == 3
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert [r["mission_id"] for r in results] == [3, 1, 999, 2]
+    assert [r["status"] for r in results] == ["created", "created", "not_found", "created"]
+    # バッジは items の順ではなく達成した順（1件目 = badge 1）
+    assert [r["badge"]["id"] if r["badge"] else None for r in results] == [3, 1, None, 2]
+    assert [r["point"] for r in results] == [3, 1, None, 2]
+    assert results[0]["completed_at"] == "2026-01-05T12:00:00"
+    assert _completed(client, headers) == 3
+
+
+def test_batch_not_found_item_does_not_block_the_rest(client, register):
+    _, headers = register("batch-missing")
+    body = _batch(client, headers, {"mission_id": 999, "idempotency_key": "gone"}, {"mission_id": 4})
+    assert [r["status"] for r in body["results"]] == ["not_found", "created"]
+    assert body["results"][0]["badge"] is None and body["results"][0]["point"] is None
+    assert body["created"] == 1
+
+    # not_found のキーは記録されないので、同じキーを後で使える
+    body = _batch(client, headers, {"mission_id": 5, "idempotency_key": "gone"})
+    assert [r["status"] for r in body["results"]] == ["created"]
+    assert _completed(client, headers) == 2
+
+
+def test_batch_replay_returns_the_recorded_results(client, register):
+    _, headers = register("batch-replay")
+    items = (
+        {"mission_id": 1, "completed_at": "2026-02-01T08:00:00", "idempotency_key": "a"},
+        {"mission_id": 2, "completed_at": "2026-02-01T09:00:00", "idempotency_key": "b"},
+    )
+    first = _batch(client, headers, *items)
+    again = _batch(client, headers, *items)
+
+    assert first["created"] == 2 and again["created"] == 0
+    assert [r["status"] for r in again["results"]] == ["replayed", "replayed"]
+    assert _without_status(again) == _without_status(first)
+    assert _completed(client, headers) == 2
+
+    # 単体の完了で記録したキーもバッチでは再送になる
+    r = client.post("/mission/complete/3", headers={**headers, "Idempotency-Key": "c"})
+    assert r.status_code == 200
+    body = _batch(client, headers, {"mission_id": 3, "idempotency_key": "c"})
+    assert [r["status"] for r in body["results"]] == ["replayed"]
+    assert body["results"][0]["badge"]["id"] == 3
+    assert _completed(client, headers) == 3
+
+
+def test_batch_duplicate_key_within_one_batch_is_recorded_once(client, register):
+    _, headers = register("batch-dup")
+    body = _batch(
+        client, headers,
+        {"mission_id": 1, "idempotency_key": "same"},
+        {"mission_id": 1, "idempotency_key": "same"},
+    )
+    assert body["created"] == 1
+    assert [r["status"] for r in body["results"]] == ["created", "replayed"]
+    assert body["results"][1]["badge"] == body["results"][0]["badge"]
+    assert _completed(client, headers) == 1
+
+
+def test_batch_conflicts_on_keys_used_for_another_mission(client, register):
+    _, headers = register("batch-conflict")
+    _batch(client, headers, {"mission_id": 1, "idempotency_key": "k1"})
+
+    body = _batch(
+        client, headers,
+        {"mission_id": 2, "idempotency_key": "k1"},    # 以前のリクエストで別ミッションに使った
+        {"mission_id": 3, "idempotency_key": "k2"},
+        {"mission_id": 4, "idempotency_key": "k2"},    # 同じバッチ内で別ミッションに使った
+    )
+    assert [r["status"] for r in body["results"]] == ["conflict", "created", "conflict"]
+    assert body["results"][0]["point"] is None and body["results"][2]["badge"] is None
+    assert body["created"] == 1
+    assert _completed(client, headers) == 2
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core import database
+from app.core.database import AsyncDBRunner, DBRunner, SyncDBRunner, open_db_runner
+from app.core.db_url import to_async_url
+from app.models.eco_mission import EcoMission
+
+
+def _titles(db, limit):
+    return list(db.scalars(select(EcoMission.title).order_by(EcoMission.mission_id).limit(limit)))
+
+
+def test_runner_base_requires_run():
+    class Incomplete(DBRunner):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_both_modes_run_the_same_function(mode):
+    async def run():
+        engine = create_async_engine(to_async_url(database.DATABASE_URL)) if mode == "async" else None
+        async_factory = async_sessionmaker(engine, expire_on_commit=False) if engine is not None else None
+        try:
+            async with open_db_runner(async_factory, database.SessionLocal) as runner:
+                return type(runner), await runner.run(_titles, 2)
+        finally:
+            if engine is not None:
+                await engine.dispose()
+
+    runner_type, titles = asyncio.run(run())
+    assert runner_type is (AsyncDBRunner if mode == "async" else SyncDBRunner)
+    assert titles == ["mission 1", "mission 2"]
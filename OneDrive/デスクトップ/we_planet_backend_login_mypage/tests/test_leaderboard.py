@@ -0,0 +1,133 @@
+import random
+import threading
+
+from app.core.leaderboard import ALL_TIME, Leaderboard, LeaderboardSet, RankedEntry, SkipList
+
+
+def _keys(skiplist):
+    return skiplist.slice(0, len(skiplist) + 1)
+
+
+def test_skiplist_insert_remove_rank_and_slice():
+    skiplist = SkipList(random.Random(1))
+    for key in (5, 1, 3, 4, 2):
+        skiplist.insert(key)
+    assert len(skiplist) == 5
+    assert _keys(skiplist) == [1, 2, 3, 4, 5]
+    assert [skiplist.rank(k) for k in (1, 3, 5)] == [1, 3, 5]
+    assert skiplist.rank(6) is None
+
+    assert skiplist.remove(3)
+    assert not skiplist.remove(3)
+    assert _keys(skiplist) == [1, 2, 4, 5]
+    assert skiplist.rank(4) == 3
+
+    # 範囲の端
+    assert skiplist.slice(0, 1) == [1]
+    assert skiplist.slice(3, 10) == [5]
+    assert skiplist.slice(4, 1) == []
+    assert skiplist.slice(-1, 2) == []
+    assert skiplist.slice(0, 0) == []
+
+
+def test_skiplist_matches_a_sorted_list():
+    rng = random.Random(7)
+    skiplist = SkipList.from_sorted(range(0, 200, 2), rng)
+    expected = list(range(0, 200, 2))
+    for _ in range(500):
+        key = rng.randrange(300)
+        if key in expected:
+            assert skiplist.remove(key)
+            expected.remove(key)
+        else:
+            skiplist.insert(key)
+            expected.append(key)
+            expected.sort()
+    assert _keys(skiplist) == expected
+    for i, key in enumerate(expected):
+        assert skiplist.rank(key) == i + 1
+    for offset in (0, 1, len(expected) - 1, len(expected)):
+        assert skiplist.slice(offset, 3) == expected[offset:offset + 3]
+
+
+def test_leaderboard_orders_by_score_then_user_id():
+    board = Leaderboard({1: 10.0, 2: 30.0, 3: 10.0})
+    assert board.page(0, 10) == [
+        RankedEntry(1, 2, 30.0), RankedEntry(2, 1, 10.0), RankedEntry(3, 3, 10.0),
+    ]
+    assert board.rank(3) == RankedEntry(3, 3, 10.0)
+    assert board.rank(99) is None
+
+    board.add(3, 25.0)  # 更新で順位が上がる
+    assert board.rank(3) == RankedEntry(1, 3, 35.0)
+    board.add(4, 5.0)   # 新しいユーザーは末尾
+    assert board.rank(4) == RankedEntry(4, 4, 5.0)
+    board.add(4, 0)
+    assert len(board) == 4
+    assert board.page(3, 10) == [RankedEntry(4, 4, 5.0)]
+    assert board.page(4, 10) == []
+
+
+def test_resync_neither_loses_nor_double_counts_a_completion():
+    db_scores = {1: 10.0}  # DB の代わり
+    loading = threading.Event()
+    release = threading.Event()
+
+    def loader(db, metric, period):
+        if release.is_set():
+            return dict(db_scores)
+        loading.set()
+        release.wait(2)
+        return dict(db_scores)
+
+    boards = LeaderboardSet(max_months=1, loader=loader)
+    release.set()
+    boards.load(None)
+    release.clear()
+
+    def complete():
+        with boards.recording():
+            db_scores[1] += 5.0  # commit
+            boards.record_completions(1, [(5, 5.0, "2026-10")])
+
+    resync = threading.Thread(target=boards.resync, args=(None,))
+    resync.start()
+    assert loading.wait(2)
+    writer = threading.Thread(target=complete)
+    writer.start()
+    writer.join(0.05)
+    assert writer.is_alive()  # 読み込み中は commit させない
+    assert db_scores[1] == 10.0
+    release.set()
+    resync.join(2)
+    writer.join(2)
+
+    for metric in ("co2", "points"):
+        assert boards.get(None, metric, ALL_TIME).rank(1).score == 15.0
+
+
+def test_resync_waits_for_a_completion_in_flight():
+    db_scores = {1: 10.0}
+    committed = threading.Event()
+    proceed = threading.Event()
+    boards = LeaderboardSet(max_months=1, loader=lambda db, metric, period: dict(db_scores))
+    boards.load(None)
+
+    def complete():
+        with boards.recording():
+            db_scores[1] += 5.0
+            committed.set()
+            proceed.wait(2)  # commit 後、ランキングに足す前
+            boards.record_completions(1, [(5, 5.0, "2026-10")])
+
+    writer = threading.Thread(target=complete)
+    writer.start()
+    assert committed.wait(2)
+    resync = threading.Thread(target=boards.resync, args=(None,))
+    resync.start()
+    resync.join(0.05)
+    assert resync.is_alive()  # 足し終わるまで読まない
+    proceed.set()
+    writer.join(2)
+    resync.join(2)
+    assert boards.get(None, "points", ALL_TIME).rank(1).score == 15.0
@@ -0,0 +1,92 @@
+import asyncio
+import time
+import types
+
+from fastapi import Depends, FastAPI
+
+from app import main
+from app.core.database import get_db, get_read_db
+from app.core.loop_monitor import LoopStallMonitor, LoopTaskMiddleware, audit_async_routes
+
+
+def test_app_routes_pass_the_audit():
+    assert audit_async_routes(main.app, blocking=(get_db, get_read_db)) == []
+
+
+def test_audit_flags_sync_sessions_in_async_code():
+    app = FastAPI()
+
+    async def async_dep(db=Depends(get_db)):
+        return db
+
+    def sync_dep(db=Depends(get_db)):
+        return db
+
+    @app.get("/direct")
+    async def direct(db=Depends(get_db)):
+        return {}
+
+    @app.get("/nested")
+    async def nested(value=Depends(async_dep)):
+        return {}
+
+    @app.get("/threadpool-dep")
+    async def threadpool_dep(value=Depends(sync_dep)):
+        return {}
+
+    @app.get("/sync")
+    def sync_endpoint(db=Depends(get_db)):
+        return {}
+
+    assert audit_async_routes(app, blocking=(get_db,)) == [
+        "GET /direct: async endpoint direct depends on get_db",
+        "GET /nested: async endpoint nested depends on async_dep -> get_db",
+    ]
+
+
+def _blocking_handler(seconds):
+    async def app(scope, receive, send):
+        time.sleep(seconds)  # 同期 DB 呼び出しの代わり
+
+    return app
+
+
+def test_stall_is_reported_with_route_and_stack():
+    reports = []
+
+    async def run():
+        monitor = LoopStallMonitor(threshold=0.05, interval=0.01, report=reports.append)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.03)
+            scope = {"type": "http", "method": "GET", "path": "/slow/1",
+                     "route": types.SimpleNamespace(path="/slow/{id}")}
+            await asyncio.get_running_loop().create_task(
+                LoopTaskMiddleware(_blocking_handler(0.3))(scope, None, None)
+            )
+            await asyncio.sleep(0.1)  # 見張りが再開に気付くまで
+        finally:
+            await monitor.stop()
+
+    asyncio.run(run())
+    blocked = [r for r in reports if r.startswith("event loop blocked")]
+    assert len(blocked) == 1
+    assert "in GET /slow/{id}" in blocked[0]
+    assert "time.sleep(seconds)" in blocked[0]
+    assert any(r.startswith("event loop resumed") for r in reports)
+
+
+def test_no_report_while_the_loop_keeps_running():
+    reports = []
+
+    async def run():
+        monitor = LoopStallMonitor(threshold=0.2, interval=0.01, report=reports.append)
+        monitor.start()
+        try:
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+        finally:
+            await monitor.stop()
+
+    asyncio.run(run())
+    assert reports == []
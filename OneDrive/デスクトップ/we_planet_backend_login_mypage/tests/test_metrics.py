@@ -0,0 +1,26 @@
+import pytest
+
+from app.core.metrics import Registry, _Metric
+
+
+def test_render_outputs_each_metric_type():
+    registry = Registry()
+    registry.counter("jobs_total", "Jobs", ("kind",)).inc(kind="a")
+    registry.gauge("queue_depth", "Depth", callback=lambda: [({}, 3)])
+    registry.histogram("job_seconds", "Latency", buckets=(0.1, 1)).observe(0.5)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE jobs_total counter" in lines
+    assert 'jobs_total{kind="a"} 1' in lines
+    assert "queue_depth 3" in lines
+    assert 'job_seconds_bucket{le="0.1"} 0' in lines
+    assert 'job_seconds_bucket{le="+Inf"} 1' in lines
+    assert "job_seconds_count 1" in lines
+
+
+def test_metric_base_requires_samples():
+    class Incomplete(_Metric):
+        type_name = "untyped"
+
+    with pytest.raises(TypeError):
+        Incomplete("x", "x")
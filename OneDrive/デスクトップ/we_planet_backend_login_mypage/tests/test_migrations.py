@@ -0,0 +1,49 @@
+"""alembic のマイグレーションと実行計画チェック（SQLite の一時ファイルで流す）"""
+import io
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect
+
+from app.core.database import Base
+from app.db import explain
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _alembic(url: str, *args: str) -> subprocess.CompletedProcess:
+    # env.py は import 時の設定から URL を読むので、別プロセスで流す
+    return subprocess.run(
+        [sys.executable, "-m", "alembic", *args],
+        cwd=APP_DIR, env=dict(os.environ, DATABASE_URL=url), capture_output=True, text=True,
+    )
+
+
+def test_upgrade_head_then_hot_queries_use_indexes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    result = _alembic(url, "upgrade", "head")
+    assert result.returncode == 0, result.stderr
+
+    engine = create_engine(url)
+    try:
+        assert set(Base.metadata.tables) <= set(inspect(engine).get_table_names())
+        with engine.connect() as conn:
+            failures = explain.check(conn, out=io.StringIO())
+    finally:
+        engine.dispose()
+    assert failures == []
+
+    result = _alembic(url, "check")
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_upgrade_head_on_a_create_all_database(tmp_path):
+    url = f"sqlite:///{tmp_path / 'create_all.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    result = _alembic(url, "upgrade", "head")
+    assert result.returncode == 0, result.stderr
+    assert "Running upgrade 0002 -> 0003" in result.stderr
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+from authlib.jose import JsonWebKey, jwt
+from fastapi import HTTPException
+
+from app.core import oauth, oidc
+from app.core.config import settings
+
+DISCOVERY_URL = "https://issuer.example/.well-known/openid-configuration"
+JWKS_URL = "https://issuer.example/jwks"
+
+
+class _Issuer:
+    """fetcher の代わり。取りに来た URL を記録し、down の間は失敗する"""
+
+    def __init__(self):
+        self.calls = []
+        self.down = False
+        self.kid = "k1"
+        self.keys = None  # 署名の検証に使う公開鍵（None なら kid だけの鍵）
+
+    def __call__(self, url):
+        self.calls.append(url)
+        if self.down:
+            raise ConnectionError(url)
+        if url == DISCOVERY_URL:
+            return {
+                "issuer": "https://issuer.example",
+                "authorization_endpoint": "https://issuer.example/authorize",
+                "token_endpoint": "https://issuer.example/token",
+                "jwks_uri": JWKS_URL,
+            }
+        return {"keys": self.keys or [{"kid": self.kid}]}
+
+
+def _provider(issuer, cache_path=None, ttl=3600):
+    return oidc.OIDCProvider(DISCOVERY_URL, ttl=ttl, cache_path=cache_path, fetcher=issuer)
+
+
+def test_refresh_fills_server_metadata():
+    issuer = _Issuer()
+    provider = _provider(issuer)
+    assert provider.is_stale()
+    provider.refresh()
+    assert issuer.calls == [DISCOVERY_URL, JWKS_URL]
+    assert not provider.is_stale()
+    metadata = provider.server_metadata()
+    assert metadata["token_endpoint"] == "https://issuer.example/token"
+    assert metadata["jwks"] == {"keys": [{"kid": "k1"}]}
+
+
+def test_restart_uses_the_disk_cache_without_fetching(tmp_path):
+    path = str(tmp_path / "oidc.json")
+    _provider(_Issuer(), path).refresh()
+
+    issuer = _Issuer()
+    issuer.down = True
+    restarted = _provider(issuer, path)
+    restarted.ensure_loaded()
+    assert issuer.calls == []
+    assert restarted.server_metadata()["jwks"] == {"keys": [{"kid": "k1"}]}
+
+    # 別の発行者のキャッシュは使わない
+    other = oidc.OIDCProvider("https://other.example/.well-known/openid-configuration", ttl=3600,
+                              cache_path=path, fetcher=issuer)
+    assert not other.load_cache()
+
+
+def test_failed_refresh_keeps_the_stale_copy(tmp_path):
+    issuer = _Issuer()
+    provider = _provider(issuer, str(tmp_path / "oidc.json"), ttl=0)
+    provider.refresh()
+    assert provider.is_stale()
+
+    issuer.down = True
+    issuer.kid = "k2"
+    refresher = oidc.OIDCRefresher(provider)
+    assert not refresher._refresh_once()
+    assert provider.server_metadata()["jwks"] == {"keys": [{"kid": "k1"}]}
+
+    issuer.down = False
+    assert refresher._refresh_once()
+    assert provider.server_metadata()["jwks"] == {"keys": [{"kid": "k2"}]}
+
+
+def test_refresher_retries_after_a_failure():
+    issuer = _Issuer()
+    issuer.down = True
+    provider = _provider(issuer)
+    refreshed = threading.Event()
+    refresh = provider.refresh
+
+    def watched():
+        refresh()
+        refreshed.set()
+
+    provider.refresh = watched
+    refresher = oidc.OIDCRefresher(provider, retry_seconds=0.01)
+    refresher.start()
+    try:
+        deadline = time.monotonic() + 2
+        while len(issuer.calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.005)  # 失敗して retry_seconds 後にもう一度取りに来る
+        issuer.down = False
+        assert refreshed.wait(2)
+    finally:
+        refresher.stop()
+    assert provider.loaded
+
+
+def test_google_client_is_503_until_metadata_is_available(monkeypatch):
+    issuer = _Issuer()
+    issuer.down = True
+    monkeypatch.setattr(oidc, "google_oidc", _provider(issuer))
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(oauth.get_google_client())
+    assert excinfo.value.status_code == 503
+
+
+def test_default_refresher_follows_the_swapped_provider(monkeypatch):
+    issuer = _Issuer()
+    monkeypatch.setattr(oidc, "google_oidc", oidc.google_oidc)
+    refresher = oidc.OIDCRefresher()
+    oauth.use_google_provider(_provider(issuer))
+    assert refresher._refresh_once()
+    assert issuer.calls == [DISCOVERY_URL, JWKS_URL]
+    assert oidc.google_oidc.loaded
+
+
+def _no_network(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError("unexpected network access")
+
+    # TestClient は独自のトランスポートなので、外へ出る通常のトランスポートだけ止める
+    monkeypatch.setattr(httpx.HTTPTransport, "handle_request", refuse)
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", refuse)
+
+
+def test_google_callback_verifies_the_id_token_with_cached_keys(client, monkeypatch):
+    key = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "test-key"})
+    issuer = _Issuer()
+    issuer.keys = [key.as_dict(is_private=False)]
+    provider = _provider(issuer)
+    provider.refresh()
+    monkeypatch.setattr(oidc, "google_oidc", oidc.google_oidc)
+    oauth.use_google_provider(provider)
+    _no_network(monkeypatch)
+    issuer.calls.clear()
+
+    r = client.get("/login/google", follow_redirects=False)
+    assert r.status_code == 302
+    location = urlparse(r.headers["location"])
+    assert location.netloc == "issuer.example"
+    query = {k: v[0] for k, v in parse_qs(location.query).items()}
+
+    now = int(time.time())
+    claims = {
+        "iss": "https://issuer.example", "aud": settings.GOOGLE_CLIENT_ID, "sub": "stand-in-1",
+        "email": "stand-in@example.com", "name": "stand-in", "nonce": query["nonce"],
+        "iat": now, "exp": now + 300,
+    }
+    id_token = jwt.encode({"alg": "RS256", "kid": "test-key"}, claims, key).decode()
+
+    async def fetch_access_token(**kwargs):
+        # コードの交換（トークンエンドポイントへの POST）だけは発行者の代わりに返す
+        assert kwargs["code"] == "code-1"
+        return {"access_token": "a", "token_type": "Bearer", "expires_in": 300, "id_token": id_token}
+
+    monkeypatch.setattr(oauth.get_oauth().google, "fetch_access_token", fetch_access_token)
+    r = client.get(f"/auth/google/callback?code=code-1&state={query['state']}", follow_redirects=False)
+    assert r.status_code == 307, r.text
+    assert "token=" in r.headers["location"]
+    assert issuer.calls == []
@@ -0,0 +1,146 @@
+import pytest
+from sqlalchemy import create_engine, func, update
+from sqlalchemy.orm import sessionmaker
+
+from app import main
+from app.core import database, security
+from app.core.database import Base, SyncDBRunner, get_read_db_runner
+from app.core.principal_cache import principal_cache
+from app.core.query_budget import count_queries
+from app.models.user import User
+
+
+@pytest.fixture
+def revalidate():
+    """別プロセスの PrincipalCacheSyncer の代わり（作った時点を目印にする）"""
+    revalidator = security.PrincipalRevalidator()
+
+    def _revalidate() -> int:
+        db = database.SessionLocal()
+        try:
+            return revalidator(db)
+        finally:
+            db.close()
+
+    _revalidate()
+    return _revalidate
+
+
+def _update_user(user_id, **values):
+    # 別のプロセス（や DB の直接編集）での変更。このプロセスのキャッシュには触らない
+    with database.engine.begin() as conn:
+        conn.execute(update(User).where(User.user_id == user_id).values(**values))
+
+
+def test_changed_user_gets_fresh_claims(client, register, revalidate):
+    user_id, headers = register("before")
+    assert client.get("/me", headers=headers).json()["nickname"] == "before"
+
+    _update_user(user_id, nickname="after")
+    # キャッシュが残っている間は古いまま
+    assert client.get("/me", headers=headers).json()["nickname"] == "before"
+
+    assert revalidate() == 1
+    assert client.get("/me", headers=headers).json()["nickname"] == "after"
+    assert revalidate() == 0
+
+
+def test_user_deleted_elsewhere_is_rejected_once_revalidated(client, register, revalidate):
+    user_id, headers = register()
+    assert client.get("/me", headers=headers).status_code == 200
+
+    _update_user(user_id, deleted_at=func.now())
+    assert user_id in principal_cache.user_ids()  # キャッシュはまだ温かい
+    assert revalidate() == 1
+    r = client.get("/me", headers=headers)
+    assert r.status_code == 401
+
+
+def test_deleted_user_is_rejected_even_when_the_cache_is_reloaded(client, register):
+    user_id, headers = register()
+    assert client.get("/me", headers=headers).status_code == 200
+
+    _update_user(user_id, deleted_at=func.now())
+    principal_cache.clear()
+    assert client.get("/me", headers=headers).status_code == 401
+
+
+def test_delete_me_rejects_the_warm_token(client):
+    email = "leaving@example.com"
+    client.post("/users/register", json={"email": email, "password": "pw", "nickname": "l"})
+    tokens = client.post("/login", json={"email": email, "password": "pw"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    user_id = client.get("/me", headers=headers).json()["user_id"]
+    assert user_id in principal_cache.user_ids()
+
+    r = client.delete("/users/me", headers=headers)
+    assert r.status_code == 200, r.text
+    assert client.get("/me", headers=headers).status_code == 401
+    assert client.post("/login", json={"email": email, "password": "pw"}).status_code == 401
+    r = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert r.status_code == 401
+
+    # Google で作り直すと再登録される
+    r = client.post("/users/", json={"email": email, "name": "l", "provider_id": "sub-l"})
+    assert r.json() == {"message": "User re-activated", "user_id": user_id}
+    assert client.post("/login", json={"email": email, "password": "pw"}).status_code == 200
+
+
+def test_revalidation_reads_only_changed_users(client, register, revalidate):
+    users = [register() for _ in range(3)]
+    for _, headers in users:
+        client.get("/me", headers=headers)
+    with count_queries() as log:
+        assert revalidate() == 0
+    assert log.count == 2  # DB の now() と、変わった行
+
+    _update_user(users[0][0], nickname="renamed")
+    assert revalidate() == 1
+    assert {u for u, _ in users[1:]} <= set(principal_cache.user_ids())
+
+
+def test_password_rehash_invalidates_the_user(client, register):
+    user_id, headers = register()
+    client.get("/me", headers=headers)
+    assert user_id in principal_cache.user_ids()
+
+    db = database.SessionLocal()
+    try:
+        security.update_password_hash(db, user_id, security.get_user_by_id(db, user_id).password_hash)
+    finally:
+        db.close()
+    assert user_id not in principal_cache.user_ids()
+
+
+@pytest.fixture
+def lagging_replica(tmp_path):
+    """users がまだ複製されていないレプリカ（空の DB）を get_read_db_runner に差し込む"""
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica)
+    factory = sessionmaker(bind=replica)
+
+    async def _replica_runner():
+        db = factory()
+        try:
+            yield SyncDBRunner(db)
+        finally:
+            db.close()
+
+    def _install():
+        main.app.dependency_overrides[get_read_db_runner] = _replica_runner
+        principal_cache.clear()
+
+    yield _install
+    main.app.dependency_overrides.pop(get_read_db_runner, None)
+    replica.dispose()
+
+
+def test_user_missing_on_replica_falls_back_to_primary(client, register, lagging_replica, monkeypatch):
+    _, headers = register()
+    lagging_replica()
+    monkeypatch.setattr(security, "has_read_replica", lambda: True)
+    assert client.get("/badge/user-progress/me", headers=headers).status_code == 200
+
+    principal_cache.clear()
+    monkeypatch.setattr(security, "has_read_replica", lambda: False)
+    assert client.get("/badge/user-progress/me", headers=headers).status_code == 401
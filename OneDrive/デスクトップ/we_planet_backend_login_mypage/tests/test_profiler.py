@@ -0,0 +1,69 @@
+import asyncio
+import glob
+import json
+import os
+import sys
+import types
+
+from app.core import profiler
+from app.core.config import settings
+
+
+def test_profiled_request_writes_collapsed_stacks(client, register):
+    _, headers = register()
+    token = profiler.sign_token(settings.PROFILE_SECRET, 60)
+    r = client.get("/me", headers=dict(headers, **{"X-Profile-Token": token}))
+    assert r.status_code == 200
+
+    name = r.headers["x-profile-id"]
+    base = os.path.join(settings.PROFILE_DIR, name)
+    with open(base + ".json", encoding="utf-8") as f:
+        meta = json.load(f)
+    assert meta["route"] == "/me"
+    assert meta["status"] == 200
+    assert meta["queries"]
+    with open(base + ".collapsed", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert any("app.main.get_me" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_unsigned_request_is_not_profiled(client, register):
+    _, headers = register()
+    before = set(glob.glob(os.path.join(settings.PROFILE_DIR, "*.json")))
+    r = client.get("/me", headers=dict(headers, **{"X-Profile-Token": profiler.sign_token("wrong", 60)}))
+    assert r.status_code == 200
+    assert "x-profile-id" not in r.headers
+    assert set(glob.glob(os.path.join(settings.PROFILE_DIR, "*.json"))) == before
+
+
+def test_label_without_qualname():
+    # Python 3.10 の code オブジェクトには co_qualname が無い
+    class Code310:
+        co_name = "handler"
+
+    code = Code310()
+    frame = types.SimpleNamespace(f_code=code, f_globals={"__name__": "app.routers.x"})
+    assert profiler._label(frame) == "app.routers.x.handler"
+
+
+def test_hook_is_only_set_while_stepping_the_profiled_request():
+    seen = {}
+
+    async def profiled():
+        seen["profiled"] = sys.getprofile() is profiler._hook
+        await asyncio.sleep(0.01)
+        seen["profiled_after_await"] = sys.getprofile() is profiler._hook
+
+    async def other():
+        await asyncio.sleep(0.005)  # 計測中のリクエストが await で止まっている間に動く
+        seen["other"] = sys.getprofile()
+
+    async def main():
+        profile = profiler.RequestProfile("header")
+        await asyncio.gather(profiler._ProfiledCoroutine(profiled(), profile), other())
+        return profile
+
+    profile = asyncio.run(main())
+    assert seen == {"profiled": True, "profiled_after_await": True, "other": None}
+    assert any(stack[-1].endswith("profiled") for stack in profile.stacks())
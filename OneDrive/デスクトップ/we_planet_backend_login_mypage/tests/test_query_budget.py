@@ -0,0 +1,108 @@
+"""
+@query_budget を付けたルートを、キャッシュが冷えた状態（一番 SQL が多くなる状態）で呼ぶ
+QUERY_BUDGET_MODE=raise（conftest）なので、予算を超えると QueryBudgetExceeded でテストが落ちる
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core import database
+from app.core.catalog import badge_catalog, mission_catalog
+from app.core.principal_cache import principal_cache
+from app.db.backfill import backfill_rollups
+from app.models.user_stats import UserMonthlyStats, UserStats
+
+
+def _cold():
+    principal_cache.clear()
+    mission_catalog.invalidate()
+    badge_catalog.invalidate()
+
+
+def _backfill():
+    with database.engine.begin() as conn:
+        backfill_rollups(conn)
+
+
+@pytest.fixture(params=["new", "legacy"])
+def user(request, register, legacy_user):
+    if request.param == "new":
+        return register()
+    user_id, headers = legacy_user([(1, datetime(2025, 12, 1)), (2, datetime(2026, 1, 5))])
+    _backfill()
+    return user_id, headers
+
+
+READS = [
+    "/me",
+    "/mission/today",
+    "/badge/badges",
+    "/badge/user-progress/me",
+    "/ecoboard/summary/me",
+    "/ecoboard/leaderboard",
+    "/ecoboard/leaderboard/me",
+    "/me/activities",
+    "/me/activities/export",
+]
+
+
+@pytest.mark.parametrize("path", READS)
+def test_reads_stay_within_budget(client, user, path):
+    _, headers = user
+    _cold()
+    r = client.get(path, headers=headers)
+    assert r.status_code == 200, r.text
+
+
+def test_writes_stay_within_budget(client, user):
+    user_id, headers = user
+    for mission_id in (1, 2, 3):
+        _cold()
+        r = client.post(f"/mission/complete/{mission_id}", headers=dict(headers, **{"Idempotency-Key": f"k{mission_id}"}))
+        assert r.status_code == 200, r.text
+    # 再送
+    _cold()
+    r = client.post("/mission/complete/1", headers=dict(headers, **{"Idempotency-Key": "k1"}))
+    assert r.headers.get("Idempotent-Replayed") == "true"
+
+    # 一括（既にある月と新しい月・再送・存在しないミッションを含む）
+    _cold()
+    items = [
+        {"mission_id": 3, "idempotency_key": "b0"},
+        {"mission_id": 4, "completed_at": "2026-03-31T23:00:00", "idempotency_key": "b1"},
+        {"mission_id": 5, "completed_at": "2026-04-01T08:00:00", "idempotency_key": "b2"},
+        {"mission_id": 1, "idempotency_key": "k1"},
+        {"mission_id": 999},
+    ]
+    r = client.post("/mission/complete/batch", headers=headers, json={"items": items})
+    assert r.status_code == 200, r.text
+
+    # 月次を足し合わせると累計と一致する
+    db = database.SessionLocal()
+    try:
+        stats = db.get(UserStats, user_id)
+        monthly = db.execute(
+            select(func.sum(UserMonthlyStats.missions_count), func.sum(UserMonthlyStats.total_points))
+            .where(UserMonthlyStats.user_id == user_id)
+        ).one()
+        assert tuple(monthly) == (stats.missions_count, stats.total_points)
+    finally:
+        db.close()
+
+
+def test_auth_routes_stay_within_budget(client):
+    email = "budget@example.com"
+    r = client.post("/users/register", json={"email": email, "password": "pw", "nickname": "b"})
+    assert r.status_code == 200, r.text
+    r = client.post("/login", json={"email": email, "password": "pw"})
+    assert r.status_code == 200, r.text
+    refresh_token = r.json()["refresh_token"]
+
+    r = client.post("/token/refresh", json={"refresh_token": refresh_token})
+    assert r.status_code == 200, r.text
+    r = client.post("/token/revoke", json={"refresh_token": r.json()["refresh_token"]})
+    assert r.status_code == 200, r.text
+
+    r = client.post("/users/", json={"email": "google@example.com", "name": "g", "provider_id": "sub-1"})
+    assert r.status_code == 200, r.text
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+from app.core import database
+from app.core.catalog import MissionCatalog, badge_catalog, mission_catalog
+from app.core.query_budget import count_queries
+from app.core.singleflight import SingleFlight, SingleFlightTimeout
+from app.routers import badge, mission
+
+
+def _run_threads(n, target):
+    results = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except BaseException as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_do_sync_runs_once_for_concurrent_threads():
+    flight = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def read(value):
+        calls.append(value)
+        started.set()
+        release.wait(5)
+        return value * 2
+
+    def call():
+        return flight.do_sync(("double", 21), read, 21)
+
+    def releaser():
+        started.wait(5)
+        time.sleep(0.05)  # 後続のスレッドが待ちに入るまで待つ
+        release.set()
+
+    threading.Thread(target=releaser).start()
+    assert _run_threads(4, call) == [42, 42, 42, 42]
+    assert calls == [21]
+
+    # 終わった後の呼び出しはもう一度実行する（キャッシュしない）
+    release.set()
+    assert flight.do_sync(("double", 21), read, 21) == 42
+    assert calls == [21, 21]
+
+
+def test_do_sync_shares_the_error_with_followers():
+    flight = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    leader = threading.Thread(target=lambda: pytest.raises(ValueError, flight.do_sync, "k", fail))
+    leader.start()
+    started.wait(5)
+    threading.Timer(0.05, release.set).start()
+    with pytest.raises(ValueError, match="boom"):
+        flight.do_sync("k", fail)
+    leader.join(5)
+
+
+def test_do_sync_follower_times_out_while_the_leader_finishes():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do_sync("slow", slow)))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do_sync("slow", slow, timeout=0.01)
+    release.set()
+    leader.join(5)
+    assert results == ["done"]
+
+
+def test_shared_read_sync_reads_in_its_own_session():
+    def titles(db, limit):
+        return [m.title for m in MissionCatalog(ttl_seconds=None).missions(db)[:limit]]
+
+    assert database.shared_read_sync(("titles", 2), titles, 2) == ["mission 1", "mission 2"]
+
+
+async def _no_read(*args, **kwargs):
+    raise AssertionError("shared_read called with a warm catalog")
+
+
+def test_warm_badge_catalog_skips_shared_read(client, monkeypatch):
+    assert client.get("/badge/badges").status_code == 200
+    assert badge_catalog.peek() is not None
+
+    monkeypatch.setattr(badge, "shared_read", _no_read)
+    with count_queries() as log:
+        assert client.get("/badge/badges").status_code == 200
+    assert log.count == 0
+
+
+def test_warm_mission_catalog_skips_shared_read(client, register, monkeypatch):
+    _, headers = register("flight")
+    assert client.get("/mission/today", headers=headers).status_code == 200
+    assert mission_catalog.peek() is not None
+
+    monkeypatch.setattr(mission, "shared_read", _no_read)
+    assert client.get("/mission/today", headers=headers).status_code == 200
+
+
+def test_cold_catalog_still_coalesces(client, monkeypatch):
+    badge_catalog.invalidate()
+    assert badge_catalog.peek() is None
+    keys = []
+    real = badge.shared_read
+
+    async def spy(key, fn, *args):
+        keys.append(key)
+        return await real(key, fn, *args)
+
+    monkeypatch.setattr(badge, "shared_read", spy)
+    assert client.get("/badge/badges").status_code == 200
+    assert keys == [("badge_catalog",)]
+    assert badge_catalog.peek() is not None
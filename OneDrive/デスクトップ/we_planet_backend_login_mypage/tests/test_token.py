@@ -0,0 +1,144 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from app.core import database
+from app.core.bloom import BloomFilter
+from app.core.revocation import RevocationList
+from app.models.token_revocation import TokenRevocation
+
+
+def _login(client):
+    email = f"{uuid.uuid4().hex[:12]}@example.com"
+    r = client.post("/users/register", json={"email": email, "password": "pw", "nickname": "t"})
+    user_id = r.json()["user_id"]
+    r = client.post("/login", json={"email": email, "password": "pw"})
+    return user_id, r.json()["refresh_token"]
+
+
+def _refresh(client, refresh_token):
+    return client.post("/token/refresh", json={"refresh_token": refresh_token})
+
+
+def test_refresh_token_rotates(client):
+    _, first = _login(client)
+    r = _refresh(client, first)
+    assert r.status_code == 200, r.text
+    second = r.json()["refresh_token"]
+    assert second != first
+    assert _refresh(client, second).status_code == 200
+
+
+def test_reuse_revokes_the_whole_family(client):
+    _, first = _login(client)
+    second = _refresh(client, first).json()["refresh_token"]
+
+    # 使用済みのトークンがもう一度来たら盗用とみなし、ローテーション後のトークンも使えなくする
+    assert _refresh(client, first).status_code == 401
+    assert _refresh(client, second).status_code == 401
+
+
+def test_logout_revokes_the_family(client):
+    _, first = _login(client)
+    second = _refresh(client, first).json()["refresh_token"]
+    assert client.post("/token/revoke", json={"refresh_token": second}).status_code == 200
+    assert _refresh(client, second).status_code == 401
+
+
+def _fresh_list(capacity=1000):
+    revocations = RevocationList(capacity, 0.001, sync_seconds=0)
+    db = database.SessionLocal()
+    try:
+        revocations.load(db)
+    finally:
+        db.close()
+    return revocations
+
+
+def _sync(revocations):
+    db = database.SessionLocal()
+    try:
+        revocations.sync(db)
+    finally:
+        db.close()
+
+
+def _insert_revocation(user_id, token_id, revoked_at=None):
+    # 別のプロセスが書いた失効（revoked_at を省くと DB の now()）
+    values = dict(token_id=token_id, kind="family", user_id=user_id,
+                  expires_at=datetime.utcnow() + timedelta(days=1))
+    if revoked_at is not None:
+        values["revoked_at"] = revoked_at
+    with database.engine.begin() as conn:
+        conn.execute(insert(TokenRevocation).values(**values))
+
+
+def test_revocation_from_another_process_is_picked_up(client):
+    user_id, _ = _login(client)
+    revocations = _fresh_list()
+    family = uuid.uuid4().hex
+    assert not revocations.might_be_revoked(family)
+
+    _insert_revocation(user_id, family)
+    _sync(revocations)
+    assert revocations.might_be_revoked(family)
+
+
+def test_late_commit_behind_the_watermark_is_not_missed(client):
+    user_id, _ = _login(client)
+    revocations = _fresh_list()
+    _insert_revocation(user_id, uuid.uuid4().hex)
+    _sync(revocations)
+
+    # 目印より前の時刻で、後から commit された失効
+    with database.engine.connect() as conn:
+        watermark = conn.scalar(select(func.max(TokenRevocation.revoked_at)))
+    late = uuid.uuid4().hex
+    _insert_revocation(user_id, late, revoked_at=watermark - timedelta(seconds=10))
+    _sync(revocations)
+    assert revocations.might_be_revoked(late)
+
+
+def test_overlapping_syncs_do_not_inflate_the_count(client):
+    user_id, _ = _login(client)
+    revocations = _fresh_list()
+    for _ in range(3):
+        _insert_revocation(user_id, uuid.uuid4().hex)
+    _sync(revocations)
+    count = revocations._filter.count
+    _sync(revocations)
+    _sync(revocations)
+    assert revocations._filter.count == count
+
+    # このプロセスで失効させた分も、差分読込で数え直さない
+    db = database.SessionLocal()
+    try:
+        assert revocations.revoke(db, uuid.uuid4().hex, "family", user_id, datetime.utcnow() + timedelta(days=1))
+        db.commit()
+    finally:
+        db.close()
+    _sync(revocations)
+    assert revocations._filter.count == count + 1
+
+
+def test_full_filter_reloads_without_losing_revocations(client):
+    user_id, _ = _login(client)
+    revocations = _fresh_list(capacity=2)
+    families = [uuid.uuid4().hex for _ in range(5)]
+    for family in families:
+        _insert_revocation(user_id, family)
+    _sync(revocations)
+    assert not revocations._filter.is_full  # 一杯になったので大きく作り直した
+    assert all(revocations.might_be_revoked(f) for f in families)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(2000, 0.01)
+    keys = [uuid.uuid4().hex for _ in range(2000)]
+    assert all(bloom.add(key) or key in bloom for key in keys)
+    assert all(key in bloom for key in keys)
+    assert not bloom.add(keys[0])
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(2000))
+    assert false_positives < 100
+